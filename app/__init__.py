@@ -4,7 +4,6 @@ Hospital Equipment Maintenance Management System.
 This Flask application manages hospital equipment maintenance schedules
 and provides email reminders for upcoming maintenance tasks.
 """
-import asyncio
 import logging
 import os
 from logging.handlers import RotatingFileHandler
@@ -103,18 +102,15 @@ def configure_logging(app):
 
 
 def start_email_scheduler():
-    """Start the email scheduler in a background thread."""
-    from app.services.email_service import EmailService
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    try:
-        loop.run_until_complete(EmailService.run_scheduler())
-    except Exception as e:
-        logging.error(f"Error in email scheduler: {str(e)}")
-    finally:
-        loop.close()
+    """Start the email scheduler thread of this process.
+
+    Used by the development server and by the scheduler process
+    (run_scheduler.py). The thread only sends reminders while this process
+    holds the scheduler leader lock.
+    """
+    from app.services.scheduler import SchedulerService
+
+    return SchedulerService.start()
 
 
 # Create a default app instance for production deployment
@@ -35,21 +35,32 @@ class Config:
     SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
     SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'True').lower() == 'true'
     EMAIL_SENDER = os.environ.get('EMAIL_SENDER', '')
     EMAIL_RECEIVER = os.environ.get('EMAIL_RECEIVER', '')
     CC_EMAIL_1 = os.environ.get('CC_EMAIL_1', '')
     CC_EMAIL_2 = os.environ.get('CC_EMAIL_2', '')
     CC_EMAIL_3 = os.environ.get('CC_EMAIL_3', '')
+    EMAIL_MAX_CONCURRENCY = int(os.environ.get('EMAIL_MAX_CONCURRENCY', '4'))  # Reminder digests delivered in parallel
 
     # File paths
     PPM_JSON_PATH = os.path.join(DATA_DIR, "ppm.json")
     OCM_JSON_PATH = os.path.join(DATA_DIR, "ocm.json")
     TRAINING_JSON_PATH = os.path.join(DATA_DIR, "training.json")
+    IMPORT_STATE_PATH = os.path.join(DATA_DIR, "import_state.json")  # Row/file hashes of the last imports
+    IMPORT_PREVIEW_DIR = os.path.join(DATA_DIR, "import_previews")  # Cached dry-run import plans
+    REMINDER_RECIPIENTS_PATH = os.path.join(DATA_DIR, "reminder_recipients.json")  # Department/engineer digest recipients
+    EMAIL_OUTBOX_PATH = os.path.join(DATA_DIR, "email_outbox.sqlite3")  # Queued reminder emails awaiting delivery
+    REMINDER_LEDGER_PATH = os.path.join(DATA_DIR, "reminder_ledger.sqlite3")  # Reminders already sent, per task and recipient
 
     # Reminder configuration
     REMINDER_DAYS = int(os.getenv("REMINDER_DAYS", "60"))
+    REMINDER_ESCALATION_DAYS = [int(d) for d in os.getenv("REMINDER_ESCALATION_DAYS", "60,30,7,0").split(",") if d.strip()]  # Re-remind at these days before due
     SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "True").lower() == "true"
+    SCHEDULER_CRON = os.getenv("SCHEDULER_CRON", "0 7 * * *")  # Reminder run times (local time); empty to use SCHEDULER_INTERVAL
     SCHEDULER_INTERVAL = int(os.getenv("SCHEDULER_INTERVAL", "24"))  # hours
+    SCHEDULER_STATE_PATH = os.path.join(DATA_DIR, "scheduler_state.json")  # Time of the last successful reminder run
+    SCHEDULER_LOCK_PATH = os.path.join(DATA_DIR, "scheduler.lock")  # Leader lock of the scheduler process
 
 class DevelopmentConfig(Config):
     """Development configuration"""
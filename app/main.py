@@ -1,8 +1,6 @@
 """
 Main entry point for the Hospital Equipment Maintenance Management System.
 """
-import threading
-
 from app import create_app, start_email_scheduler
 from app.config import Config
 
@@ -11,9 +9,7 @@ app = create_app()
 
 
 # Start email scheduler in a separate thread if enabled
-if Config.SCHEDULER_ENABLED:
-    scheduler_thread = threading.Thread(target=start_email_scheduler, daemon=True)
-    scheduler_thread.start()
+if start_email_scheduler():
     app.logger.info("Email scheduler started in background thread")
 
 
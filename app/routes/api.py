@@ -3,6 +3,7 @@ import logging
 import os
 import re
 import json
+import shutil
 import zipfile
 import tempfile
 import csv
@@ -11,26 +12,58 @@ from io import BytesIO, StringIO
 import pandas as pd
 
 from flask import Blueprint, jsonify, request, send_file, Response, current_app
+from werkzeug.utils import secure_filename
 from datetime import datetime
-from dotenv import load_dotenv, find_dotenv
 
+from app.services.config_service import ConfigService
 from app.services.data_service import DataService
-from app.services.import_export import ImportExportService
+from app.services.import_export import BACKUP_SECTIONS, ImportExportService
 from app.services.validation import ValidationService
 from app.utils.env_writer import update_env_value, update_env_section
+from app.utils.compression import gzip_response
+from app.utils.evaluation_date import get_evaluation_date
+from app.utils.import_format import detect_format
+from app.utils.projection import ENCODINGS, parse_fields, project, to_compact
+from app.utils.spreadsheet import is_xlsx
 
 api_bp = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
 
+api_bp.after_request(gzip_response)
+
 @api_bp.route('/equipment/<data_type>', methods=['GET'])
 def get_equipment(data_type):
-    """Get all equipment entries."""
+    """Get all equipment entries.
+
+    Query parameters: fields (comma-separated field paths, e.g. MFG_SERIAL,PPM_Q_I.date;
+    'status' adds the calculated status), format (records or compact), as_of (YYYY-MM-DD,
+    for status).
+    """
     if data_type not in ('ppm', 'ocm'):
         return jsonify({"error": "Invalid data type"}), 400
 
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    encoding = request.args.get('format', 'records')
+    if encoding not in ENCODINGS:
+        return jsonify({"error": f"Invalid format. Must be one of: {', '.join(ENCODINGS)}"}), 400
+
     try:
         entries = DataService.get_all_entries(data_type)
+        if 'status' in fields:
+            from app.routes.views_new import calculate_equipment_status
+            today = get_evaluation_date()
+            entries = [{**entry, 'status': calculate_equipment_status(entry, data_type, today)['status']}
+                       for entry in entries]
+        if encoding == 'compact':
+            return jsonify(to_compact(entries, fields)), 200
+        if fields:
+            entries = [project(entry, fields) for entry in entries]
         return jsonify(entries), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting {data_type} entries: {str(e)}")
         return jsonify({"error": "Failed to retrieve equipment data"}), 500
@@ -157,10 +190,15 @@ def export_data(data_type):
 @api_bp.route('/export-machine-list', methods=['GET'])
 def export_machine_list():
     """Export the machine list from the dashboard to CSV."""
+    try:
+        today = get_evaluation_date()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         # Get combined data for the dashboard (same as in the index view)
         from app.routes.views_new import get_combined_machine_list
-        combined_data = get_combined_machine_list()
+        combined_data = get_combined_machine_list(today)
 
         # Define CSV headers
         headers = [
@@ -199,7 +237,7 @@ def export_machine_list():
 
 @api_bp.route('/import/<data_type>', methods=['POST'])
 def import_data(data_type):
-    """Import data from CSV."""
+    """Import PPM or OCM data from a CSV or XLSX file."""
     if data_type not in ('ppm', 'ocm'):
         return jsonify({"error": "Invalid data type"}), 400
 
@@ -210,31 +248,106 @@ def import_data(data_type):
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    if file and file.filename.endswith('.csv'):
-        try:
-            # Save temporary file
-            upload_folder = Path(current_app.config['UPLOAD_FOLDER']) # Define UPLOAD_FOLDER in Config
-            upload_folder.mkdir(exist_ok=True)
-            temp_path = upload_folder / file.filename
-            file.save(temp_path)
+    if not file.filename.lower().endswith(('.csv', '.xlsx')):
+        return jsonify({"error": "Invalid file type, only CSV or XLSX allowed"}), 400
 
-            success, message, stats = ImportExportService.import_from_csv(data_type, str(temp_path))
+    temp_dir = tempfile.mkdtemp(prefix='import_')
+    try:
+        temp_path = os.path.join(temp_dir, 'import.xlsx' if is_xlsx(file.filename) else 'import.csv')
+        file.save(temp_path)
 
-            # Clean up temporary file
-            temp_path.unlink(missing_ok=True)
+        # Determine encoding, delimiter and header mapping from the first few KB
+        import_format = detect_format(temp_path, data_type)
+        plan = DataService.plan_import(data_type, temp_path, import_format)
+        stats = DataService.commit_import(plan)
 
-            if success:
-                return jsonify({"message": message, "stats": stats}), 200
-            else:
-                return jsonify({"error": message, "stats": stats}), 400
-        except Exception as e:
-            logger.error(f"Error importing {data_type} data: {str(e)}")
-            # Clean up temp file on error too
-            if 'temp_path' in locals() and temp_path.exists():
-                 temp_path.unlink(missing_ok=True)
-            return jsonify({"error": f"Failed to import {data_type} data: {str(e)}"}), 500
-    else:
-        return jsonify({"error": "Invalid file type, only CSV allowed"}), 400
+        message = (f"Imported {data_type.upper()} data: {stats['added']} added, {stats['updated']} updated, "
+                   f"{stats['unchanged']} unchanged, {stats['skipped']} skipped")
+        return jsonify({"message": message, "stats": stats}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error importing {data_type} data: {str(e)}")
+        return jsonify({"error": f"Failed to import {data_type} data: {str(e)}"}), 500
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+@api_bp.route('/import/<data_type>/preview', methods=['POST'])
+def preview_import(data_type):
+    """Dry-run an import and return the first page of the diff.
+
+    The computed plan is cached under the returned token, so a confirmed
+    commit does not have to upload or parse the file again.
+    """
+    if data_type not in ('ppm', 'ocm', 'training'):
+        return jsonify({"error": "Invalid data type"}), 400
+
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    if not file.filename.lower().endswith(('.csv', '.xlsx')):
+        return jsonify({"error": "Invalid file type, only CSV or XLSX allowed"}), 400
+
+    temp_dir = tempfile.mkdtemp(prefix='import_preview_')
+    try:
+        temp_path = os.path.join(temp_dir, 'import.xlsx' if is_xlsx(file.filename) else 'import.csv')
+        file.save(temp_path)
+
+        if data_type == 'training':
+            plan = DataService.plan_training_import(temp_path)
+        else:
+            plan = DataService.plan_import(data_type, temp_path)
+
+        token = DataService.save_import_preview(plan)
+        per_page = request.args.get('per_page', 50, type=int)
+        return jsonify(DataService.get_import_preview_page(token, per_page=per_page)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error previewing {data_type} import: {str(e)}")
+        return jsonify({"error": f"Failed to preview {data_type} import: {str(e)}"}), 500
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+@api_bp.route('/import/preview/<token>', methods=['GET'])
+def get_import_preview(token):
+    """Get a page of a cached import preview."""
+    action = request.args.get('action')
+    if action and action not in ('new', 'changed', 'unchanged', 'rejected'):
+        return jsonify({"error": "Invalid action filter"}), 400
+
+    try:
+        preview = DataService.get_import_preview_page(
+            token,
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 50, type=int),
+            action=action
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if preview is None:
+        return jsonify({"error": "Import preview not found or expired"}), 404
+    return jsonify(preview), 200
+
+@api_bp.route('/import/preview/<token>/commit', methods=['POST'])
+def commit_import_preview(token):
+    """Apply a previewed import."""
+    try:
+        summary = DataService.commit_import_preview(token)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error committing import preview {token}: {str(e)}")
+        return jsonify({"error": f"Failed to commit import: {str(e)}"}), 500
+
+    if summary is None:
+        return jsonify({"error": "Import preview not found or expired"}), 404
+    return jsonify({"message": "Import committed", "stats": summary}), 200
 
 @api_bp.route('/bulk_delete/<data_type>', methods=['POST'])
 def bulk_delete(data_type):
@@ -339,17 +452,15 @@ def bulk_delete_employees():
 def get_email_settings():
     """Get current email settings from .env file."""
     try:
-        # Load environment variables
-        load_dotenv(find_dotenv())
-
-        # Get email settings
-        smtp_username = os.environ.get('SMTP_USERNAME', '')
-        smtp_password = os.environ.get('SMTP_PASSWORD', '')
-        email_sender = os.environ.get('EMAIL_SENDER', '')
-        email_receiver = os.environ.get('EMAIL_RECEIVER', '')
-        cc_email_1 = os.environ.get('CC_EMAIL_1', '')
-        cc_email_2 = os.environ.get('CC_EMAIL_2', '')
-        cc_email_3 = os.environ.get('CC_EMAIL_3', '')
+        # Get email settings from the current configuration snapshot
+        settings = ConfigService.get_snapshot().settings
+        smtp_username = settings['SMTP_USERNAME']
+        smtp_password = settings['SMTP_PASSWORD']
+        email_sender = settings['EMAIL_SENDER']
+        email_receiver = settings['EMAIL_RECEIVER']
+        cc_email_1 = settings['CC_EMAIL_1']
+        cc_email_2 = settings['CC_EMAIL_2']
+        cc_email_3 = settings['CC_EMAIL_3']
 
         # Mask password for security
         masked_password = '*' * len(smtp_password) if smtp_password else ''
@@ -386,43 +497,21 @@ def backup_all_data():
 
         # Create a zip file
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Export PPM data
-            success, message, ppm_csv = ImportExportService.export_to_csv('ppm')
-            if success:
-                zip_file.writestr('ppm_data.csv', ppm_csv)
-            else:
-                logger.warning(f"Failed to export PPM data: {message}")
-
-            # Export OCM data
-            success, message, ocm_csv = ImportExportService.export_to_csv('ocm')
-            if success:
-                zip_file.writestr('ocm_data.csv', ocm_csv)
-            else:
-                logger.warning(f"Failed to export OCM data: {message}")
-
-            # Export Training data
-            training_csv = DataService.export_training_data()
-            if training_csv:
-                zip_file.writestr('training_data.csv', training_csv)
-            else:
-                logger.warning("Failed to export Training data")
+            # Export PPM, OCM and Training data in the import format so restore can validate them
+            for data_type, member in BACKUP_SECTIONS.items():
+                try:
+                    zip_file.writestr(member, DataService.export_data(data_type))
+                except Exception as e:
+                    logger.warning(f"Failed to export {data_type.upper()} data: {str(e)}")
 
             # Export settings as CSV
-            load_dotenv(find_dotenv(), override=True)
+            settings = ConfigService.get_snapshot().settings
 
             # Get email settings (excluding password for security)
-            settings_data = [
-                ['Setting', 'Value'],
-                ['SMTP_SERVER', os.environ.get('SMTP_SERVER', '')],
-                ['SMTP_PORT', os.environ.get('SMTP_PORT', '')],
-                ['SMTP_USERNAME', os.environ.get('SMTP_USERNAME', '')],
-                ['EMAIL_SENDER', os.environ.get('EMAIL_SENDER', '')],
-                ['EMAIL_RECEIVER', os.environ.get('EMAIL_RECEIVER', '')],
-                ['CC_EMAIL_1', os.environ.get('CC_EMAIL_1', '')],
-                ['CC_EMAIL_2', os.environ.get('CC_EMAIL_2', '')],
-                ['CC_EMAIL_3', os.environ.get('CC_EMAIL_3', '')],
-                ['EXPORT_DATE', current_date]
-            ]
+            settings_data = [['Setting', 'Value']]
+            settings_data += [[key, settings[key]] for key in ('SMTP_SERVER', 'SMTP_PORT', 'SMTP_USERNAME', 'EMAIL_SENDER',
+                                                               'EMAIL_RECEIVER', 'CC_EMAIL_1', 'CC_EMAIL_2', 'CC_EMAIL_3')]
+            settings_data.append(['EXPORT_DATE', current_date])
 
             # Convert settings to CSV
             settings_csv = StringIO()
@@ -490,152 +579,63 @@ def restore_all_data():
 
         # Check file extension
         if file.filename.endswith('.zip'):
-            # Handle ZIP file (containing CSV files)
-            with zipfile.ZipFile(file, 'r') as zip_file:
-                # Extract PPM data if available
-                if 'ppm_data.csv' in zip_file.namelist():
-                    # Save to a temporary file
-                    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as temp_file:
-                        temp_file.write(zip_file.read('ppm_data.csv'))
-                        temp_path = temp_file.name
-
-                    # Import the data
-                    success, message, stats = ImportExportService.import_from_csv('ppm', temp_path)
-                    if not success:
-                        logger.warning(f"Failed to import PPM data: {message}")
-
-                    # Clean up temporary file
-                    os.unlink(temp_path)
-
-                # Extract OCM data if available
-                if 'ocm_data.csv' in zip_file.namelist():
-                    # Save to a temporary file
-                    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as temp_file:
-                        temp_file.write(zip_file.read('ocm_data.csv'))
-                        temp_path = temp_file.name
-
-                    # Import the data
-                    success, message, stats = ImportExportService.import_from_csv('ocm', temp_path)
-                    if not success:
-                        logger.warning(f"Failed to import OCM data: {message}")
-
-                    # Clean up temporary file
-                    os.unlink(temp_path)
-
-                # Extract Training data if available
-                if 'training_data.csv' in zip_file.namelist():
-                    # Save to a temporary file
-                    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as temp_file:
-                        temp_file.write(zip_file.read('training_data.csv'))
-                        temp_path = temp_file.name
-
-                    # Import the data using DataService
-                    try:
-                        # Read the CSV file
-                        df = pd.read_csv(temp_path)
-                        df.fillna('', inplace=True)
-
-                        # Convert to list of dictionaries
-                        training_data = df.to_dict('records')
-
-                        # Save the data
-                        DataService.save_data(training_data, 'training')
-                    except Exception as e:
-                        logger.warning(f"Failed to import Training data: {str(e)}")
-
-                    # Clean up temporary file
-                    os.unlink(temp_path)
-
-                # Extract Settings data if available
-                if 'settings.csv' in zip_file.namelist():
-                    try:
-                        # Read the settings CSV
-                        settings_csv = zip_file.read('settings.csv').decode('utf-8')
-                        reader = csv.reader(settings_csv.splitlines())
-
-                        # Skip header
-                        next(reader)
-
-                        # Process settings
-                        settings = {}
-                        for row in reader:
-                            if len(row) >= 2:
-                                key, value = row[0], row[1]
-                                if key not in ['EXPORT_DATE'] and value:  # Skip export date and empty values
-                                    settings[key] = value
-
-                        # Update settings in .env file
-                        if settings:
-                            update_env_section('# Email Configuration', settings)
-                    except Exception as e:
-                        logger.warning(f"Failed to import Settings data: {str(e)}")
-
-            return jsonify({
-                'success': True,
-                'message': 'Backup restored successfully'
-            })
+            # Handle ZIP file (containing CSV files), streamed straight from the upload
+            try:
+                success, message, stats = ImportExportService.restore_from_zip(file.stream)
+            except zipfile.BadZipFile:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid ZIP file'
+                }), 400
 
         elif file.filename.endswith('.json'):
             # Handle JSON file
             try:
                 # Read the JSON file
                 backup_data = json.loads(file.read().decode('utf-8'))
+            except json.JSONDecodeError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid JSON file'
+                }), 400
 
-                # Validate backup data structure
-                if not isinstance(backup_data, dict):
-                    return jsonify({
-                        'success': False,
-                        'error': 'Invalid backup file format: root must be an object'
-                    }), 400
-
-                # Check for required sections
-                required_sections = ['ppm', 'ocm', 'training']
-                missing_sections = [section for section in required_sections if section not in backup_data]
-
-                if missing_sections:
-                    return jsonify({
-                        'success': False,
-                        'error': f'Invalid backup file: missing sections {", ".join(missing_sections)}'
-                    }), 400
-
-                # Restore PPM data
-                if 'ppm' in backup_data and isinstance(backup_data['ppm'], list):
-                    DataService.save_data(backup_data['ppm'], 'ppm')
-
-                # Restore OCM data
-                if 'ocm' in backup_data and isinstance(backup_data['ocm'], list):
-                    DataService.save_data(backup_data['ocm'], 'ocm')
-
-                # Restore Training data
-                if 'training' in backup_data and isinstance(backup_data['training'], list):
-                    DataService.save_data(backup_data['training'], 'training')
-
-                # Restore Settings data
-                if 'settings' in backup_data and isinstance(backup_data['settings'], dict):
-                    # Filter out sensitive or unnecessary fields
-                    settings = {k: v for k, v in backup_data['settings'].items()
-                               if k not in ['export_date'] and v}
-
-                    # Update settings in .env file
-                    if settings:
-                        update_env_section('# Email Configuration', settings)
-
+            # Validate backup data structure
+            if not isinstance(backup_data, dict):
                 return jsonify({
-                    'success': True,
-                    'message': 'Backup restored successfully'
-                })
+                    'success': False,
+                    'error': 'Invalid backup file format: root must be an object'
+                }), 400
 
-            except json.JSONDecodeError:
+            # Check for required sections
+            required_sections = ['ppm', 'ocm', 'training']
+            missing_sections = [section for section in required_sections if section not in backup_data]
+
+            if missing_sections:
                 return jsonify({
                     'success': False,
-                    'error': 'Invalid JSON file'
+                    'error': f'Invalid backup file: missing sections {", ".join(missing_sections)}'
                 }), 400
+
+            success, message, stats = ImportExportService.restore_from_json(backup_data)
         else:
             return jsonify({
                 'success': False,
                 'error': 'Unsupported file format. Please upload a .zip or .json file.'
             }), 400
 
+        if not success:
+            return jsonify({
+                'success': False,
+                'error': message,
+                'details': stats.get('error_details', [])[:20]
+            }), 400
+
+        return jsonify({
+            'success': True,
+            'message': message,
+            'stats': stats
+        })
+
     except Exception as e:
         logger.error(f"Error restoring backup: {str(e)}")
         return jsonify({
@@ -643,6 +643,263 @@ def restore_all_data():
             'error': f"Failed to restore backup: {str(e)}"
         }), 500
 
+@api_bp.route('/reminder-recipients', methods=['GET'])
+def get_reminder_recipients():
+    """Get the department and engineer reminder digest recipients."""
+    from app.services.email_service import EmailService
+
+    try:
+        return jsonify(EmailService.load_reminder_recipients()), 200
+    except Exception as e:
+        logger.error(f"Error getting reminder recipients: {str(e)}")
+        return jsonify({"error": "Failed to retrieve reminder recipients"}), 500
+
+@api_bp.route('/reminder-recipients', methods=['PUT'])
+def update_reminder_recipients():
+    """Replace the department and engineer reminder digest recipients.
+
+    Expects {"departments": {name: [emails]}, "engineers": {name: [emails]}}.
+    """
+    from app.services.email_service import EmailService
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid request data"}), 400
+
+    for section in ('departments', 'engineers'):
+        mapping = data.get(section, {})
+        if not isinstance(mapping, dict):
+            return jsonify({"error": f"'{section}' must be an object"}), 400
+        for name, emails in mapping.items():
+            emails = [emails] if isinstance(emails, str) else emails
+            if not isinstance(emails, list) or not all(isinstance(e, str) and re.match(r"[^@]+@[^@]+\.[^@]+", e.strip()) for e in emails):
+                return jsonify({"error": f"Invalid email address for {section[:-1]} '{name}'"}), 400
+
+    try:
+        EmailService.save_reminder_recipients(data)
+        return jsonify(EmailService.load_reminder_recipients()), 200
+    except Exception as e:
+        logger.error(f"Error saving reminder recipients: {str(e)}")
+        return jsonify({"error": "Failed to save reminder recipients"}), 500
+
+@api_bp.route('/email-outbox/metrics', methods=['GET'])
+def get_email_outbox_metrics():
+    """Get email outbox queue depth and delivery latency."""
+    from app.services.outbox import EmailOutbox
+
+    try:
+        return jsonify(EmailOutbox.get_metrics()), 200
+    except Exception as e:
+        logger.error(f"Error getting email outbox metrics: {str(e)}")
+        return jsonify({"error": "Failed to retrieve email outbox metrics"}), 500
+
+@api_bp.route('/search', methods=['GET'])
+def search():
+    """Search equipment and training records.
+
+    Query parameters: q (required), type (comma-separated ppm/ocm/training), page, per_page.
+    """
+    from app.services.search_service import SEARCH_DATA_TYPES, SearchService
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+
+    data_types = [t.strip() for t in request.args.get('type', '').split(',') if t.strip()]
+    if any(t not in SEARCH_DATA_TYPES for t in data_types):
+        return jsonify({"error": f"Invalid type. Must be one of: {', '.join(SEARCH_DATA_TYPES)}"}), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    try:
+        return jsonify(SearchService.search(query, data_types or None, page, per_page)), 200
+    except Exception as e:
+        logger.error(f"Error searching for '{query}': {str(e)}")
+        return jsonify({"error": "Failed to search records"}), 500
+
+@api_bp.route('/suggest', methods=['GET'])
+def suggest():
+    """Suggest values of a form field starting with a prefix.
+
+    Query parameters: field (required), prefix, limit.
+    """
+    from app.services.suggest_service import SuggestService
+
+    field = request.args.get('field', '')
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    try:
+        return jsonify({
+            'field': field,
+            'prefix': prefix,
+            'suggestions': SuggestService.suggest(field, prefix, limit)
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error getting {field} suggestions: {str(e)}")
+        return jsonify({"error": "Failed to get suggestions"}), 500
+
+@api_bp.route('/aggregate', methods=['GET'])
+def aggregate():
+    """Group equipment by dimensions and compute metrics per group.
+
+    Query parameters: group_by (required, comma-separated), metrics (comma-separated,
+    default count), type (comma-separated ppm/ocm), as_of (YYYY-MM-DD, default today).
+    """
+    from app.services.aggregate_service import AggregateService
+
+    def split(name, default=''):
+        return [v.strip() for v in request.args.get(name, default).split(',') if v.strip()]
+
+    try:
+        return jsonify(AggregateService.aggregate(split('group_by'), split('metrics', 'count'),
+                                                  split('type') or None, get_evaluation_date())), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error aggregating equipment: {str(e)}")
+        return jsonify({"error": "Failed to aggregate equipment"}), 500
+
+@api_bp.route('/workload', methods=['GET'])
+def get_workload():
+    """Forecast PPM and OCM tasks per engineer per week.
+
+    Query parameters: weeks (default 12), as_of (YYYY-MM-DD, default today).
+    """
+    from app.services.workload_service import DEFAULT_WEEKS, WorkloadService
+
+    try:
+        return jsonify(WorkloadService.get_forecast(request.args.get('weeks', DEFAULT_WEEKS, type=int),
+                                                    get_evaluation_date())), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error forecasting workload: {str(e)}")
+        return jsonify({"error": "Failed to forecast workload"}), 500
+
+@api_bp.route('/calendar', methods=['GET'])
+def get_calendar():
+    """Count maintenance events due per week or month, with the devices in each bucket.
+
+    Query parameters: from and to (YYYY-MM-DD, default the next 90 days from as_of),
+    granularity (week or month, default week), type (comma-separated ppm/ocm/warranty,
+    default ppm,ocm).
+    """
+    from datetime import date, timedelta
+    from app.services.calendar_service import CalendarService
+
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else get_evaluation_date()
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=90)
+    except ValueError:
+        return jsonify({"error": "Query parameters 'from', 'to' and 'as_of' must be dates in YYYY-MM-DD format"}), 400
+
+    kinds = [t.strip() for t in request.args.get('type', '').split(',') if t.strip()]
+    try:
+        return jsonify(CalendarService.get_calendar(start, end, request.args.get('granularity', 'week'),
+                                                    kinds or None)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building maintenance calendar: {str(e)}")
+        return jsonify({"error": "Failed to build maintenance calendar"}), 500
+
+@api_bp.route('/calendar/<field>/<value>.ics', methods=['GET'])
+def get_calendar_feed(field, value):
+    """Subscribable iCalendar feed of a department's or an engineer's PPM and OCM tasks."""
+    from app.services.ics_service import IcsFeedService
+
+    try:
+        etag, chunks = IcsFeedService.get_feed(field, value)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error generating {field} feed for {value}: {str(e)}")
+        return jsonify({"error": "Failed to generate calendar feed"}), 500
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(chunks, mimetype='text/calendar')
+        response.headers['Content-Disposition'] = f'inline; filename="{secure_filename(value) or field}.ics"'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api_bp.route('/schedule/projection', methods=['GET'])
+def get_schedule_projection():
+    """Project PPM quarter occurrences within a date range, beyond the stored year.
+
+    Query parameters: from and to (YYYY-MM-DD, default the next 365 days from as_of),
+    limit (default 1000).
+    """
+    from datetime import date, timedelta
+    from itertools import islice
+    from app.services.schedule_projection import ScheduleProjector
+
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else get_evaluation_date()
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=365)
+    except ValueError:
+        return jsonify({"error": "Query parameters 'from', 'to' and 'as_of' must be dates in YYYY-MM-DD format"}), 400
+    if end < start:
+        return jsonify({"error": "'to' must not be before 'from'"}), 400
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+
+    try:
+        # One extra occurrence tells whether the range holds more than the limit
+        occurrences = list(islice(ScheduleProjector.iter_occurrences(start, end), limit + 1))
+        fields = ('equipment', 'mfg_serial', 'task', 'department', 'date', 'engineer')
+        return jsonify({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'occurrences': [
+                dict(zip(fields, event), date=datetime.strptime(event[4], '%d/%m/%Y').date().isoformat())
+                for event in occurrences[:limit]
+            ],
+            'truncated': len(occurrences) > limit
+        }), 200
+    except Exception as e:
+        logger.error(f"Error projecting PPM schedule: {str(e)}")
+        return jsonify({"error": "Failed to project PPM schedule"}), 500
+
+@api_bp.route('/lookup/<path:code>', methods=['GET'])
+def lookup_device(code):
+    """Resolve a scanned serial number or log number to its device, status and next due date.
+
+    Query parameters: as_of (YYYY-MM-DD, default today).
+    """
+    from app.services.lookup_service import LookupService
+    from app.routes.views_new import calculate_equipment_status
+
+    try:
+        today = get_evaluation_date()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        matches = LookupService.lookup(code)
+        if not matches:
+            return jsonify({"error": f"No equipment found for code '{code}'"}), 404
+
+        data_type, field, entry = matches[0]
+        return jsonify({
+            'data_type': data_type,
+            'matched_field': field,
+            'equipment': entry,
+            'as_of': today.isoformat(),
+            'status': calculate_equipment_status(entry, data_type, today),
+            'next_due': LookupService.get_next_due(data_type, entry, today),
+            'other_matches': [{'data_type': t, 'matched_field': f, 'MFG_SERIAL': e.get('MFG_SERIAL')}
+                              for t, f, e in matches[1:]]
+        }), 200
+    except Exception as e:
+        logger.error(f"Error looking up code {code}: {str(e)}")
+        return jsonify({"error": "Failed to look up equipment"}), 500
+
 @api_bp.route('/email-settings', methods=['POST'])
 def update_email_settings():
     """Update email settings in .env file."""
@@ -10,7 +10,7 @@ import csv
 import os
 import platform
 import ctypes
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, Response
 from flask import send_file
 import tempfile
@@ -20,12 +20,15 @@ from app.services.data_service import DataService
 from app.services.validation import ValidationService
 from app.services.import_export import ImportExportService
 from app.routes.auth import login_required
+from app.utils.import_format import detect_format
+from app.utils.spreadsheet import is_xlsx
+from app.utils.evaluation_date import get_evaluation_date
 
 views_bp = Blueprint('views', __name__)
 logger = logging.getLogger(__name__)
 
-# Allowed file extension
-ALLOWED_EXTENSIONS = {'csv'}
+# Allowed file extensions
+ALLOWED_EXTENSIONS = {'csv', 'xlsx'}
 
 # Export this function for use in other modules
 __all__ = ['views_bp', 'get_combined_machine_list']
@@ -34,9 +37,14 @@ def allowed_file(filename):
     """Check if file has allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_combined_machine_list():
-    """Combine PPM and OCM data into a unified list for the dashboard."""
-    from datetime import datetime
+def get_combined_machine_list(today=None):
+    """Combine PPM and OCM data into a unified list for the dashboard.
+
+    Args:
+        today: Date statuses are evaluated on (default: the request's evaluation date)
+    """
+    today = today or get_evaluation_date()
+    midnight = datetime.combine(today, time())
 
     # Get data from both sources
     ppm_data = DataService.get_all_entries('ppm')
@@ -61,7 +69,7 @@ def get_combined_machine_list():
                 quarter_dates = {'I': q1_date, 'II': q2_date, 'III': q3_date, 'IV': q4_date}
 
                 # Find the earliest upcoming quarter date
-                upcoming_dates = [date for date in quarter_dates.values() if date >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)]
+                upcoming_dates = [date for date in quarter_dates.values() if date >= midnight]
                 if upcoming_dates:
                     next_maintenance = min(upcoming_dates)
 
@@ -106,7 +114,7 @@ def get_combined_machine_list():
     # Add status information
     for item in combined_data:
         # Calculate automatic status
-        status_info = calculate_equipment_status(item, item['type'].lower())
+        status_info = calculate_equipment_status(item, item['type'].lower(), today)
         
         # Use override status if available, otherwise use calculated status
         item['status'] = item.get('status_override') or status_info['status']
@@ -114,8 +122,14 @@ def get_combined_machine_list():
 
     return combined_data
 
-def calculate_equipment_status(entry, data_type):
-    """Calculate status for a single equipment entry."""
+def calculate_equipment_status(entry, data_type, today=None):
+    """Calculate status for a single equipment entry.
+
+    Args:
+        entry: PPM or OCM entry
+        data_type: 'ppm' or 'ocm'
+        today: Date the status is evaluated on (default: the request's evaluation date)
+    """
     # Check if there's a manual status override
     status_override = entry.get('status_override')
     if status_override:
@@ -128,6 +142,7 @@ def calculate_equipment_status(entry, data_type):
         return status_map.get(status_override, {'status': 'OK', 'class': 'success'})
 
     # Calculate automatic status based on maintenance dates
+    now = datetime.combine(today or get_evaluation_date(), time())
     next_maintenance = None
     
     if data_type == 'ppm':
@@ -143,7 +158,6 @@ def calculate_equipment_status(entry, data_type):
                 quarter_dates = [q1_date, q2_date, q3_date, q4_date]
 
                 # Find the earliest upcoming quarter date or the most recent past date
-                now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
                 upcoming_dates = [date for date in quarter_dates if date >= now]
                 
                 if upcoming_dates:
@@ -166,7 +180,7 @@ def calculate_equipment_status(entry, data_type):
 
     # Calculate status based on next maintenance date
     if next_maintenance:
-        days_until = (next_maintenance - datetime.now()).days
+        days_until = (next_maintenance - now).days
         
         # For PPM, also check if any quarter is overdue
         if data_type == 'ppm':
@@ -178,8 +192,7 @@ def calculate_equipment_status(entry, data_type):
                     q3_date = q1_date + relativedelta(months=6)
                     q4_date = q1_date + relativedelta(months=9)
                     quarter_dates = [q1_date, q2_date, q3_date, q4_date]
-                    
-                    now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
                     # Check if any quarter is overdue
                     overdue_dates = [date for date in quarter_dates if date < now]
                     if overdue_dates:
@@ -208,11 +221,17 @@ def index():
     # Check if user is logged in, if not redirect to login
     if not session.get('logged_in'):
         return redirect(url_for('auth.login'))
-    
-    from datetime import datetime
+
+    # Evaluate every status against one date, captured once for the request
+    try:
+        today = get_evaluation_date()
+    except ValueError as e:
+        flash(str(e), "warning")
+        today = date.today()
+    midnight = datetime.combine(today, time())
 
     # Get combined data for the dashboard
-    combined_data = get_combined_machine_list()
+    combined_data = get_combined_machine_list(today)
     current_date = datetime.now().strftime("%A, %d %B %Y - %I:%M:%S %p")
 
     # Calculate statistics from combined data
@@ -230,7 +249,7 @@ def index():
         if next_maintenance and next_maintenance != 'Not Scheduled':
             try:
                 maintenance_date = datetime.strptime(next_maintenance, '%d/%m/%Y')
-                days_until = (maintenance_date - datetime.now()).days
+                days_until = (maintenance_date - midnight).days
 
                 if days_until < 0:
                     overdue_count += 1
@@ -244,6 +263,7 @@ def index():
 
     return render_template('index.html',
                          current_date=current_date,
+                         as_of=today if today != date.today() else None,
                          total_machines=total_machines,
                          overdue_count=overdue_count,
                          upcoming_counts=upcoming_counts,
@@ -259,10 +279,15 @@ def list_equipment(data_type):
         return redirect(url_for('views.index'))
     try:
         data = DataService.get_all_entries(data_type) # Don't exclude PPM entries
-        
+        try:
+            today = get_evaluation_date()
+        except ValueError as e:
+            flash(str(e), "warning")
+            today = date.today()
+
         # Add status information to each entry
         for entry in data:
-            status_info = calculate_equipment_status(entry, data_type)
+            status_info = calculate_equipment_status(entry, data_type, today)
             entry['calculated_status'] = status_info['status']
             entry['calculated_status_class'] = status_info['class']
             
@@ -598,7 +623,7 @@ def import_training():
             temp_dir = tempfile.mkdtemp(prefix='training_import_')
 
             # Save the file to the temporary directory with a fixed name
-            temp_file_path = os.path.join(temp_dir, 'import.csv')
+            temp_file_path = os.path.join(temp_dir, 'import.xlsx' if is_xlsx(file.filename) else 'import.csv')
 
             try:
                 # Save in chunks to avoid memory issues
@@ -622,106 +647,19 @@ def import_training():
             import atexit
             atexit.register(lambda: shutil.rmtree(temp_dir, ignore_errors=True))
 
-            # Process the CSV file
-            df = pd.read_csv(file_stream, delimiter=',', encoding='utf-8')
-
-            # Normalize column headers
-            def normalize_col(col):
-                return ' '.join(col.replace('_', ' ').upper().split())
-            df.columns = [normalize_col(col) for col in df.columns]
-
-            # Define canonical column names
-            canonical_columns = [
-                'NAME', 'ID', 'DEPARTMENT',
-                'MACHINE 1', 'MACHINE 1 TRAINER',
-                'MACHINE 2', 'MACHINE 2 TRAINER',
-                'MACHINE 3', 'MACHINE 3 TRAINER',
-                'MACHINE 4', 'MACHINE 4 TRAINER',
-                'MACHINE 5', 'MACHINE 5 TRAINER',
-                'MACHINE 6', 'MACHINE 6 TRAINER',
-                'MACHINE 7', 'MACHINE 7 TRAINER'
-            ]
-
-            # Check for missing required columns
-            required_fields = ['NAME', 'ID', 'DEPARTMENT']
-            missing_fields = [field for field in required_fields if field not in df.columns]
-            if missing_fields:
-                flash(f"Import failed: Missing required columns: {', '.join(missing_fields)}", 'danger')
-                return redirect(url_for('views.import_export_page', section='training'))
-
-            # Continue with the rest of the import logic, using df with normalized columns
-            success_count = 0
-            update_count = 0
-            error_count = 0
-            error_messages = []
-
-            for index, row in df.iterrows():
-                try:
-                    # Convert row to dict and clean up
-                    data = row.to_dict()
-
-                    # Fill empty fields with 'n/a'
-                    for key in data:
-                        if pd.isna(data[key]) or data[key] == '':
-                            data[key] = 'n/a'
-
-                    # Validate required fields
-                    missing_fields = [field for field in required_fields if data.get(field) == 'n/a']
-
-                    if missing_fields:
-                        error_count += 1
-                        error_messages.append(f"Row {index+1}: Missing required fields: {', '.join(missing_fields)}")
-                        continue
-
-                    # Process machine columns into MACHINES dictionary
-                    machines = {}
-                    total_trained = 0
-
-                    for machine_col in ['MACHINE 1', 'MACHINE 2', 'MACHINE 3', 'MACHINE 4', 'MACHINE 5', 'MACHINE 6', 'MACHINE 7']:
-                        if machine_col in data and data[machine_col].lower() != 'n/a':
-                            # If the machine name is present, mark it as trained
-                            machine_name = data[machine_col].lower().replace(' ', '_')
-                            machines[machine_name] = True
-                            total_trained += 1
-
-                    # Create employee data dictionary
-                    employee_data = {
-                        'ID': str(data['ID']).strip(),
-                        'NAME': data.get('NAME', 'n/a'),
-                        'DEPARTMENT': data.get('DEPARTMENT', 'n/a'),
-                        'TRAINER': data.get('MACHINE 1 TRAINER', 'n/a'),
-                        'MACHINES': machines,
-                        'machine1_trainer': data.get('MACHINE 1 TRAINER', 'n/a'),
-                        'machine2_trainer': data.get('MACHINE 2 TRAINER', 'n/a'),
-                        'machine3_trainer': data.get('MACHINE 3 TRAINER', 'n/a'),
-                        'machine4_trainer': data.get('MACHINE 4 TRAINER', 'n/a'),
-                        'machine5_trainer': data.get('MACHINE 5 TRAINER', 'n/a'),
-                        'machine6_trainer': data.get('MACHINE 6 TRAINER', 'n/a'),
-                        'machine7_trainer': data.get('MACHINE 7 TRAINER', 'n/a'),
-                        'total_trained': total_trained
-                    }
-
-                    # Check if employee already exists
-                    existing_employee = DataService.get_training_entry(employee_data['ID'])
-                    if existing_employee:
-                        # Update existing employee
-                        DataService.update_training_entry(employee_data['ID'], employee_data)
-                        update_count += 1
-                    else:
-                        # Add new employee
-                        DataService.add_training_entry(employee_data)
-                        success_count += 1
-
-                except Exception as e:
-                    error_count += 1
-                    error_messages.append(f"Row {index+1}: {str(e)}")
-                    logger.exception(f"Error processing training import row {index+1}")
-
-            # Clean up
             try:
+                result = DataService.import_training_data(file_stream)
+            except ValueError as e:
+                flash(f"Import failed: {str(e)}", 'danger')
+                return redirect(url_for('views.import_export_page', section='training'))
+            finally:
+                # Clean up
                 shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception:
-                pass
+
+            success_count = result.get('added', 0)
+            update_count = result.get('updated', 0)
+            error_count = result.get('skipped', 0)
+            error_messages = result.get('error_details', [])
 
             # Show results
             if success_count > 0 or update_count > 0:
@@ -730,8 +668,12 @@ def import_training():
                     message.append(f'Added {success_count} new records')
                 if update_count > 0:
                     message.append(f'Updated {update_count} existing records')
+                if result.get('unchanged', 0) > 0:
+                    message.append(f"{result['unchanged']} unchanged")
 
                 flash(f'Successfully processed training data: {", ".join(message)}', 'success')
+            elif error_count == 0:
+                flash(f"No changes: all {result.get('unchanged', 0)} records are already up to date", 'info')
 
             if error_count > 0:
                 flash(f'Failed to process {error_count} records', 'warning')
@@ -773,7 +715,7 @@ def import_training():
 
             return redirect(url_for('views.import_export_page', section='training'))
     else:
-        flash('Invalid file type. Please upload a CSV file.', 'danger')
+        flash('Invalid file type. Please upload a CSV or XLSX file.', 'danger')
         return redirect(url_for('views.import_export_page', section='training'))
 
 @views_bp.route('/training/list')
@@ -1216,10 +1158,34 @@ def download_training_template():
         flash(f"An error occurred while generating the template: {str(e)}", 'danger')
         return redirect(url_for('views.list_training'))
 
+def send_xlsx_export(data_type, download_name):
+    """Stream a dataset into a temporary workbook and send it as a download.
+
+    The workbook is unlinked as soon as it is open for sending, so nothing is left
+    on disk however the download ends.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmpfile:
+        tmp_file_path = tmpfile.name
+
+    try:
+        DataService.export_data_xlsx(data_type, tmp_file_path)
+        workbook = open(tmp_file_path, 'rb')
+    finally:
+        os.unlink(tmp_file_path)
+
+    response = send_file(
+        workbook,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=download_name
+    )
+    response.content_length = os.fstat(workbook.fileno()).st_size
+    return response
+
 @views_bp.route('/export/<data_type>')
 def export_equipment(data_type):
     """
-    Export equipment data to CSV for download.
+    Export equipment data to CSV (or XLSX with ?format=xlsx) for download.
 
     Args:
         data_type: Type of data to export ('ppm' or 'ocm')
@@ -1229,6 +1195,9 @@ def export_equipment(data_type):
         return redirect(url_for('views.import_export_page', section='machines'))
 
     try:
+        if request.args.get('format') == 'xlsx':
+            return send_xlsx_export(data_type, f'{data_type}_export.xlsx')
+
         # Call DataService to handle the export logic
         csv_content = DataService.export_data(data_type=data_type)
 
@@ -1266,9 +1235,9 @@ def import_equipment():
             flash('No selected file', 'danger')
             return redirect(url_for('views.import_export_page', section='machines'))
 
-        # Check if file is CSV
-        if not file.filename.endswith('.csv'):
-            flash('Invalid file type. Please upload a CSV file.', 'danger')
+        # Check if file is CSV or XLSX
+        if not allowed_file(file.filename):
+            flash('Invalid file type. Please upload a CSV or XLSX file.', 'danger')
             return redirect(url_for('views.import_export_page', section='machines'))
 
         # Check disk space before saving file
@@ -1300,25 +1269,28 @@ def import_equipment():
 
         # Process the file
         try:
-            # Determine if it's PPM or OCM data based on headers
-            with open(temp_file_path, 'r') as f:
-                reader = csv.reader(f)
-                headers = next(reader)
-
-                if 'PPM' in headers:
-                    data_type = 'ppm'
-                elif 'OCM' in headers:
-                    data_type = 'ocm'
-                else:
-                    flash('Invalid CSV format. Could not determine if PPM or OCM data.', 'danger')
-                    return redirect(url_for('views.import_export_page', section='machines'))
+            # Determine encoding, delimiter and PPM/OCM type from the first few KB
+            try:
+                import_format = detect_format(temp_file_path)
+            except ValueError as e:
+                flash(f'Invalid file format. {str(e)}', 'danger')
+                return redirect(url_for('views.import_export_page', section='machines'))
+
+            data_type = import_format.data_type
+            if data_type not in ('ppm', 'ocm'):
+                flash('Invalid file format. Could not determine if PPM or OCM data.', 'danger')
+                return redirect(url_for('views.import_export_page', section='machines'))
 
             try:
                 # Import the data
-                result = DataService.import_data(data_type, temp_file_path)
+                result = DataService.import_data(data_type, temp_file_path, import_format=import_format)
 
                 # Show success message
-                flash(f'Successfully imported {result["success"]} {data_type.upper()} records. {result["skipped"]} skipped. {result["errors"]} errors.', 'success')
+                if result.get('identical_file'):
+                    flash(f'File is identical to the last {data_type.upper()} import. {result["unchanged"]} records unchanged.', 'info')
+                else:
+                    flash(f'Successfully imported {data_type.upper()} data: {result["added"]} added, {result["updated"]} updated, '
+                          f'{result["unchanged"]} unchanged. {result["skipped"]} skipped. {result["errors"]} errors.', 'success')
             except Exception as e:
                 logger.exception(f"Error processing import data: {str(e)}")
                 flash(f'Error processing file: {str(e)}', 'danger')
@@ -1339,6 +1311,30 @@ def import_equipment():
         flash(f'An unexpected error occurred: {str(e)}', 'danger')
         return redirect(url_for('views.import_export_page', section='machines'))
 
+@views_bp.route('/workload')
+def workload():
+    """Display the engineer workload forecast."""
+    from app.services.workload_service import DEFAULT_WEEKS, MAX_WEEKS, WorkloadService
+
+    weeks = min(max(request.args.get('weeks', DEFAULT_WEEKS, type=int), 1), MAX_WEEKS)
+    try:
+        today = get_evaluation_date()
+    except ValueError as e:
+        flash(str(e), "warning")
+        today = date.today()
+    try:
+        forecast = WorkloadService.get_forecast(weeks, today=today)
+    except Exception as e:
+        logger.error(f"Error forecasting workload: {str(e)}")
+        flash("Error loading workload forecast.", "danger")
+        forecast = {'weeks': [], 'engineers': [], 'totals': []}
+    return render_template('workload.html', forecast=forecast, weeks=weeks, max_weeks=MAX_WEEKS)
+
+@views_bp.route('/calendar')
+def maintenance_calendar():
+    """Display the maintenance calendar; buckets are loaded from /api/calendar."""
+    return render_template('calendar.html')
+
 @views_bp.route('/settings')
 def settings():
     """Display the settings page."""
@@ -1347,9 +1343,9 @@ def settings():
 @views_bp.route('/send-test-notification')
 def send_test_notification():
     """Send a test notification email."""
-    import asyncio
+    from app.config import Config
     from app.services.email_service import EmailService
-    from app.services.data_service import DataService
+    from app.utils.async_runner import run_coroutine
     from app.utils.config_reloader import reload_config
 
     try:
@@ -1357,19 +1353,16 @@ def send_test_notification():
         reload_config()
         logger.info("Configuration reloaded before sending test notification")
 
-        # Load PPM data
-        ppm_data = DataService.get_all_entries('ppm')
-
-        # Create a new event loop for the async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Get upcoming PPM, OCM and warranty events
+        upcoming = EmailService.get_upcoming_reminders()
 
-        # Get upcoming maintenance
-        upcoming = loop.run_until_complete(EmailService.get_upcoming_maintenance(ppm_data))
+        # Show the email instead of sending it; the rendered body is cached for the send
+        if request.args.get('preview'):
+            return EmailService.render_reminder_html(upcoming, Config.EMAIL_RECEIVER)
 
         # Send reminder if there are upcoming maintenance tasks
         if upcoming:
-            success = loop.run_until_complete(EmailService.send_reminder_email(upcoming))
+            success = run_coroutine(EmailService.send_reminder_email(upcoming))
             if success:
                 flash(f"Test notification sent successfully for {len(upcoming)} upcoming maintenance tasks.", "success")
             else:
@@ -1377,8 +1370,6 @@ def send_test_notification():
         else:
             flash("No upcoming maintenance tasks found within the next 60 days.", "warning")
 
-        loop.close()
-
         # Redirect back to settings page if that's where we came from
         referrer = request.referrer
         if referrer and 'settings' in referrer:
@@ -1398,8 +1389,11 @@ def send_test_notification():
 
 @views_bp.route('/export/training')
 def export_training():
-    """Export training data to CSV for download."""
+    """Export training data to CSV (or XLSX with ?format=xlsx) for download."""
     try:
+        if request.args.get('format') == 'xlsx':
+            return send_xlsx_export('training', 'training_export.xlsx')
+
         # Call DataService to handle the export logic
         csv_content = DataService.export_training_data()
 
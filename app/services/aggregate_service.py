@@ -0,0 +1,210 @@
+"""
+Group-by aggregation over the equipment fleet.
+
+PPM and OCM devices are flattened into a columnar pandas snapshot (one row per
+device) once per version of the data files. Status columns depend on the current
+date, so they are derived from the snapshot's due dates with vectorized
+operations on each call. Aggregation results are cached per data version, date
+and query, so repeated dashboards and reports are dictionary lookups.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.data_service import DataService
+
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_DATA_TYPES = ('ppm', 'ocm')
+
+# Dimensions that can be grouped by
+GROUP_BY_FIELDS = ('type', 'department', 'manufacturer', 'model', 'equipment', 'engineer', 'status')
+
+# Metrics that can be computed per group
+METRICS = ('count', 'overdue', 'due_soon', 'ok', 'no_schedule', 'min_days_until', 'mean_days_until')
+
+# Statuses as computed by calculate_equipment_status; overrides outside this set count as OK
+STATUSES = ('OK', 'Due Soon', 'Overdue', 'Invalid Date', 'No Schedule')
+
+# Devices due within this many days are Due Soon
+DUE_SOON_DAYS = 7
+
+RESULT_CACHE_SIZE = 64
+
+
+def _text(value: Any) -> str:
+    value = str(value).strip() if value is not None else ''
+    return value or 'N/A'
+
+
+def _snapshot_row(data_type: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a device into the snapshot's columns."""
+    if data_type == 'ppm':
+        quarters = [record.get(q) or {} for q in ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']]
+        engineer = next((q.get('engineer') for q in quarters if q.get('engineer')), None)
+        # PPM status follows the first quarter's date; later quarters are derived from it
+        due = (quarters[0].get('date') or '').strip()
+        scheduled = bool(due)
+    else:
+        engineer = record.get('ENGINEER')
+        due = (record.get('Next_Date') or '').strip()
+        scheduled = bool(due) and due.lower() != 'n/a'
+
+    override = record.get('status_override')
+    return {
+        'type': data_type.upper(),
+        'department': _text(record.get('DEPARTMENT')),
+        'manufacturer': _text(record.get('MANUFACTURER')),
+        'model': _text(record.get('MODEL')),
+        'equipment': _text(record.get('EQUIPMENT')),
+        'engineer': _text(engineer),
+        'override': (override if override in STATUSES else 'OK') if override else None,
+        'scheduled': scheduled,
+        'due': due if scheduled else None,
+    }
+
+
+class AggregateService:
+    """Service computing grouped fleet statistics."""
+
+    # (dataset keys, snapshot)
+    _snapshot: Optional[Tuple[str, pd.DataFrame]] = None
+    _results: 'OrderedDict[Tuple, List[Dict[str, Any]]]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build_snapshot(datasets: Dict[str, List[Dict[str, Any]]]) -> pd.DataFrame:
+        """
+        Build the columnar snapshot of the devices.
+
+        Args:
+            datasets: Records by data type
+
+        Returns:
+            DataFrame: One row per device with the GROUP_BY_FIELDS dimensions (except
+            status), the status override, whether a due date is set and the due date
+        """
+        rows = [_snapshot_row(data_type, record)
+                for data_type, records in datasets.items() for record in records]
+        snapshot = pd.DataFrame(rows, columns=['type', 'department', 'manufacturer', 'model', 'equipment',
+                                               'engineer', 'override', 'scheduled', 'due'])
+        snapshot['scheduled'] = snapshot['scheduled'].astype(bool)
+        snapshot['due'] = pd.to_datetime(snapshot['due'], format='%d/%m/%Y', errors='coerce')
+        return snapshot
+
+    @staticmethod
+    def _get_snapshot() -> Tuple[str, pd.DataFrame]:
+        """Get the snapshot and its version, rebuilding it if a data file changed."""
+        version = '|'.join(DataService.get_dataset_key(data_type) for data_type in AGGREGATE_DATA_TYPES)
+        snapshot = AggregateService._snapshot
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot
+
+        with AggregateService._lock:
+            snapshot = AggregateService._snapshot
+            if snapshot is None or snapshot[0] != version:
+                datasets = {data_type: DataService.load_data(data_type) for data_type in AGGREGATE_DATA_TYPES}
+                snapshot = AggregateService._snapshot = (version, AggregateService.build_snapshot(datasets))
+                AggregateService._results.clear()
+                logger.info(f"Built aggregation snapshot with {len(snapshot[1])} devices")
+            return snapshot
+
+    @staticmethod
+    def with_status(snapshot: pd.DataFrame, today: date) -> pd.DataFrame:
+        """
+        Add the date-dependent columns to a snapshot.
+
+        Args:
+            snapshot: Snapshot from build_snapshot
+            today: Date the status is evaluated on
+
+        Returns:
+            DataFrame: The snapshot with days_until and status columns
+        """
+        frame = snapshot.copy()
+        days_until = (frame['due'] - pd.Timestamp(today)).dt.days
+        frame['days_until'] = days_until
+        frame['status'] = np.select(
+            [frame['override'].notna(),
+             frame['scheduled'] & frame['due'].isna(),
+             ~frame['scheduled'],
+             days_until < 0,
+             days_until <= DUE_SOON_DAYS],
+            [frame['override'], 'Invalid Date', 'No Schedule', 'Overdue', 'Due Soon'],
+            default='OK')
+        return frame
+
+    @staticmethod
+    def aggregate(group_by: Sequence[str], metrics: Sequence[str] = ('count',),
+                  data_types: Optional[Sequence[str]] = None, today: date = None) -> Dict[str, Any]:
+        """
+        Group the devices by dimensions and compute metrics per group.
+
+        Args:
+            group_by: Dimensions from GROUP_BY_FIELDS
+            metrics: Metrics from METRICS
+            data_types: Restrict to these data types (default: all)
+            today: Date statuses are evaluated on (default: today)
+
+        Returns:
+            dict: as_of (YYYY-MM-DD), group_by, metrics and rows (one dict per group,
+            sorted by the group keys)
+
+        Raises:
+            ValueError: If a dimension, metric or data type is invalid
+        """
+        group_by = list(dict.fromkeys(group_by))
+        metrics = list(dict.fromkeys(metrics)) or ['count']
+        data_types = sorted(set(data_types or AGGREGATE_DATA_TYPES))
+        if not group_by or any(field not in GROUP_BY_FIELDS for field in group_by):
+            raise ValueError(f"Invalid group_by. Must be one or more of: {', '.join(GROUP_BY_FIELDS)}")
+        if any(metric not in METRICS for metric in metrics):
+            raise ValueError(f"Invalid metrics. Must be one or more of: {', '.join(METRICS)}")
+        if any(data_type not in AGGREGATE_DATA_TYPES for data_type in data_types):
+            raise ValueError(f"Invalid type. Must be one of: {', '.join(AGGREGATE_DATA_TYPES)}")
+
+        today = today or date.today()
+        version, snapshot = AggregateService._get_snapshot()
+        key = (version, today, tuple(group_by), tuple(metrics), tuple(data_types))
+        with AggregateService._lock:
+            rows = AggregateService._results.get(key)
+            if rows is not None:
+                AggregateService._results.move_to_end(key)
+
+        if rows is None:
+            frame = AggregateService.with_status(snapshot, today)
+            frame = frame[frame['type'].isin([data_type.upper() for data_type in data_types])]
+            frame = frame.assign(
+                overdue=frame['status'] == 'Overdue',
+                due_soon=frame['status'] == 'Due Soon',
+                ok=frame['status'] == 'OK',
+                no_schedule=frame['status'] == 'No Schedule')
+
+            grouped = frame.groupby(group_by, sort=True).agg(
+                count=('type', 'size'),
+                overdue=('overdue', 'sum'),
+                due_soon=('due_soon', 'sum'),
+                ok=('ok', 'sum'),
+                no_schedule=('no_schedule', 'sum'),
+                min_days_until=('days_until', 'min'),
+                mean_days_until=('days_until', 'mean'))[metrics].reset_index()
+            if 'mean_days_until' in metrics:
+                grouped['mean_days_until'] = grouped['mean_days_until'].round(1)
+
+            # Plain Python values for JSON; groups without any due date get None
+            grouped = grouped.astype(object).where(grouped.notna(), None)
+            rows = [{column: value.item() if isinstance(value, np.generic) else value
+                     for column, value in row.items()} for row in grouped.to_dict('records')]
+
+            with AggregateService._lock:
+                AggregateService._results[key] = rows
+                while len(AggregateService._results) > RESULT_CACHE_SIZE:
+                    AggregateService._results.popitem(last=False)
+
+        return {'as_of': today.isoformat(), 'group_by': group_by, 'metrics': metrics, 'rows': rows}
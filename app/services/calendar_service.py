@@ -0,0 +1,166 @@
+"""
+Maintenance calendar buckets.
+
+The due event index is split per event kind into NumPy arrays of due date
+ordinals once per data version. A calendar query turns its range into week or
+month bucket edges and finds each bucket's slice of every kind's array with one
+searchsorted call, so no record or date string is looked at. Results are cached
+per data version and query.
+"""
+import heapq
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.due_events import EVENT_KINDS, OCM_EVENT, PPM_EVENT, DueEventService, Event
+
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('week', 'month')
+DEFAULT_KINDS = (PPM_EVENT, OCM_EVENT)
+MAX_BUCKETS = 366
+CALENDAR_CACHE_SIZE = 64
+
+
+def _month_start(day: date, months: int = 0) -> date:
+    """Get the first day of the month a number of months after the month of a date."""
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def bucket_edges(start: date, end: date, granularity: str) -> List[date]:
+    """
+    Get the start dates of the buckets covering a date range, plus the end of the last one.
+
+    Weeks start on Monday and months on the 1st; the first bucket is the one
+    containing the start date.
+
+    Args:
+        start: First date of the range
+        end: Last date of the range
+        granularity: 'week' or 'month'
+
+    Returns:
+        list: Bucket boundaries; bucket i covers edges[i] up to the day before edges[i + 1]
+    """
+    if granularity == 'week':
+        edge = start - timedelta(days=start.weekday())
+        edges = [edge]
+        while edge <= end:
+            edge += timedelta(weeks=1)
+            edges.append(edge)
+    else:
+        edges = [_month_start(start)]
+        while edges[-1] <= end:
+            edges.append(_month_start(edges[-1], 1))
+    return edges
+
+
+class CalendarService:
+    """Service counting the maintenance events due per week or month."""
+
+    # (data version, {kind: (due date ordinals, events)})
+    _arrays: Optional[Tuple[str, Dict[str, Tuple[np.ndarray, List[Event]]]]] = None
+    _results: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_arrays() -> Tuple[str, Dict[str, Tuple[np.ndarray, List[Event]]]]:
+        """Get the data version and per-kind due date arrays, rebuilding them if the due event index changed."""
+        version, ordinals, kinds, events = DueEventService.get_index()
+        arrays = CalendarService._arrays
+        if arrays is not None and arrays[0] == version:
+            return arrays
+
+        with CalendarService._lock:
+            arrays = CalendarService._arrays
+            if arrays is None or arrays[0] != version:
+                kind_codes = np.array(kinds, dtype=str)
+                all_ordinals = np.array(ordinals, dtype=np.int64)
+                per_kind = {}
+                for kind in EVENT_KINDS:
+                    positions = np.flatnonzero(kind_codes == kind)
+                    per_kind[kind] = (all_ordinals[positions], [events[i] for i in positions])
+                arrays = CalendarService._arrays = (version, per_kind)
+                CalendarService._results.clear()
+                logger.info(f"Built calendar arrays for {len(events)} events")
+            return arrays
+
+    @staticmethod
+    def get_calendar(start: date, end: date, granularity: str = 'week',
+                     kinds: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Count the events due in each week or month of a date range.
+
+        Args:
+            start: First due date included
+            end: Last due date included
+            granularity: 'week' or 'month'
+            kinds: Event kinds from EVENT_KINDS (default: PPM and OCM)
+
+        Returns:
+            dict: from, to (YYYY-MM-DD), granularity, kinds and buckets, each with its
+            start and end dates, total count, counts per kind and the serial numbers
+            of the devices due, in due-date order
+
+        Raises:
+            ValueError: If the range, granularity or kinds are invalid
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Invalid granularity. Must be one of: {', '.join(GRANULARITIES)}")
+        kinds = set(kinds or DEFAULT_KINDS)
+        if any(kind not in EVENT_KINDS for kind in kinds):
+            raise ValueError(f"Invalid type. Must be one of: {', '.join(EVENT_KINDS)}")
+        kinds = [kind for kind in EVENT_KINDS if kind in kinds]
+        if end < start:
+            raise ValueError("'to' must not be before 'from'")
+        edges = bucket_edges(start, end, granularity)
+        if len(edges) - 1 > MAX_BUCKETS:
+            raise ValueError(f"Range too long: at most {MAX_BUCKETS} {granularity}s")
+
+        version, arrays = CalendarService._get_arrays()
+        key = (version, start, end, granularity, tuple(kinds))
+        with CalendarService._lock:
+            calendar = CalendarService._results.get(key)
+            if calendar is not None:
+                CalendarService._results.move_to_end(key)
+                return calendar
+
+        # Clip the outer edges to the requested range so partial buckets only count days inside it
+        bounds = np.array([e.toordinal() for e in edges], dtype=np.int64)
+        bounds[0] = start.toordinal()
+        bounds[-1] = end.toordinal() + 1
+        slices = {kind: np.searchsorted(arrays[kind][0], bounds, side='left') for kind in kinds}
+
+        buckets = []
+        for i in range(len(edges) - 1):
+            counts = {kind: int(slices[kind][i + 1] - slices[kind][i]) for kind in kinds}
+            # Each kind's slice is in due-date order already; merge them on their ordinals
+            due = heapq.merge(*(zip(arrays[kind][0][slices[kind][i]:slices[kind][i + 1]].tolist(),
+                                    arrays[kind][1][slices[kind][i]:slices[kind][i + 1]])
+                                for kind in kinds), key=lambda occurrence: occurrence[0])
+            buckets.append({
+                'start': edges[i].isoformat(),
+                'end': (edges[i + 1] - timedelta(days=1)).isoformat(),
+                'count': sum(counts.values()),
+                'counts': counts,
+                'devices': list(dict.fromkeys(event[1] for _, event in due))
+            })
+
+        calendar = {
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'granularity': granularity,
+            'kinds': kinds,
+            'buckets': buckets
+        }
+        with CalendarService._lock:
+            CalendarService._results[key] = calendar
+            while len(CalendarService._results) > CALENDAR_CACHE_SIZE:
+                CalendarService._results.popitem(last=False)
+        return calendar
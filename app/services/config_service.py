@@ -0,0 +1,150 @@
+"""
+Configuration service backed by the .env file.
+
+The .env path is resolved once. Each refresh is a single stat() of the file; it is
+only re-parsed when its modification time or size changed, after which Config is
+updated and a new immutable settings snapshot is published with the next version
+number. Readers take the current snapshot and look values up like in a dict.
+"""
+import logging
+import os
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from dotenv import dotenv_values, find_dotenv
+
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() == 'true'
+
+
+def _parse_int_list(value: str) -> List[int]:
+    return [int(d) for d in value.split(',') if d.strip()]
+
+
+# Settings reloaded from .env: Config attribute (same as the variable name) -> (default, parser)
+SETTINGS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    # Email configuration
+    'SMTP_SERVER': ('smtp.gmail.com', str),
+    'SMTP_PORT': ('587', int),
+    'SMTP_USERNAME': ('', str),
+    'SMTP_PASSWORD': ('', str),
+    'SMTP_USE_TLS': ('True', _parse_bool),
+    'EMAIL_SENDER': ('reminders@equipment.com', str),
+    'EMAIL_RECEIVER': ('', str),
+    'CC_EMAIL_1': ('', str),
+    'CC_EMAIL_2': ('', str),
+    'CC_EMAIL_3': ('', str),
+    'EMAIL_MAX_CONCURRENCY': ('4', int),
+    # Reminder configuration
+    'REMINDER_DAYS': ('60', int),
+    'REMINDER_ESCALATION_DAYS': ('60,30,7,0', _parse_int_list),
+    'SCHEDULER_ENABLED': ('True', _parse_bool),
+    'SCHEDULER_CRON': ('0 7 * * *', str),
+    'SCHEDULER_INTERVAL': ('24', int),
+}
+
+
+class ConfigSnapshot(NamedTuple):
+    """Immutable view of the settings as of one version of the .env file."""
+    version: int
+    settings: Mapping[str, Any]
+
+
+class ConfigService:
+    """Service keeping Config in sync with the .env file."""
+
+    _env_path: Optional[str] = None
+    _env_resolved = False
+    _file_stamp: Optional[Tuple[int, int]] = None
+    _snapshot: Optional[ConfigSnapshot] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_env_path() -> Optional[str]:
+        """Get the path of the .env file, searching for it only on the first call."""
+        if not ConfigService._env_resolved:
+            ConfigService._env_path = find_dotenv() or None
+            ConfigService._env_resolved = True
+            if not ConfigService._env_path:
+                logger.error("Could not find .env file")
+        return ConfigService._env_path
+
+    @staticmethod
+    def _stamp(env_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(env_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _publish() -> ConfigSnapshot:
+        """Publish a snapshot of the current Config values."""
+        version = ConfigService._snapshot.version + 1 if ConfigService._snapshot else 1
+        settings = MappingProxyType({name: getattr(Config, name) for name in SETTINGS})
+        ConfigService._snapshot = ConfigSnapshot(version, settings)
+        return ConfigService._snapshot
+
+    @staticmethod
+    def refresh() -> bool:
+        """
+        Reload the settings if the .env file changed since it was last parsed.
+
+        Returns:
+            bool: True if the settings reflect the .env file, False if it cannot be found or read
+        """
+        env_path = ConfigService.get_env_path()
+        if not env_path:
+            if ConfigService._snapshot is None:
+                with ConfigService._lock:
+                    ConfigService._publish()
+            return False
+
+        stamp = ConfigService._stamp(env_path)
+        if stamp is not None and stamp == ConfigService._file_stamp:
+            return True
+
+        with ConfigService._lock:
+            stamp = ConfigService._stamp(env_path)
+            if stamp is None:
+                logger.error(f"Could not read .env file {env_path}")
+                if ConfigService._snapshot is None:
+                    ConfigService._publish()
+                return False
+            if stamp == ConfigService._file_stamp:
+                return True
+
+            # Values in .env take precedence over the process environment, as with load_dotenv(override=True)
+            for key, value in dotenv_values(env_path).items():
+                if value is not None:
+                    os.environ[key] = value
+
+            for name, (default, parse) in SETTINGS.items():
+                raw = os.environ.get(name, default)
+                try:
+                    setattr(Config, name, parse(raw))
+                except ValueError:
+                    logger.error(f"Invalid value for {name} in .env: {raw!r}; keeping {getattr(Config, name)!r}")
+
+            ConfigService._file_stamp = stamp
+            snapshot = ConfigService._publish()
+            logger.info(f"Configuration reloaded from .env file (version {snapshot.version})")
+            return True
+
+    @staticmethod
+    def get_snapshot() -> ConfigSnapshot:
+        """Get the current settings snapshot, reloading .env first if it changed."""
+        ConfigService.refresh()
+        return ConfigService._snapshot
+
+    @staticmethod
+    def get(name: str, default: Any = None) -> Any:
+        """Get one setting from the current snapshot."""
+        return ConfigService.get_snapshot().settings.get(name, default)
@@ -1,13 +1,20 @@
 """
 Data service for managing equipment maintenance data.
 """
+import hashlib
 import json
+import re
+import uuid
 from dateutil.relativedelta import relativedelta
 import logging
 import io
 import csv
+import os
+import shutil
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Literal, Union, TextIO
+from typing import List, Dict, Any, Optional, Literal, Union, TextIO, Tuple, Iterator, Iterable
 from datetime import datetime, timedelta
 
 import pandas as pd
@@ -17,10 +24,26 @@ from app.config import Config
 from app.models.ppm import PPMEntry
 from app.models.ocm import OCMEntry
 from app.models.training import TrainingEntry
+from app.utils.import_format import ImportFormat, detect_format
+from app.utils.spreadsheet import write_xlsx
 
 
 logger = logging.getLogger(__name__)
 
+# Required (normalized) columns of a training import file
+TRAINING_REQUIRED_COLUMNS = ['NAME', 'ID', 'DEPARTMENT']
+
+# Seconds an import preview stays available for commit
+IMPORT_PREVIEW_TTL = 3600
+
+# Import plans kept in memory, least recently used evicted first (all of them stay on disk)
+IMPORT_PREVIEW_CACHE_SIZE = 8
+
+# Import plans cached by preview token as (created timestamp, plan), backed by files in
+# Config.IMPORT_PREVIEW_DIR
+_import_previews: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_import_previews_lock = threading.Lock()
+
 
 class DataService:
     """Service for managing equipment maintenance data."""
@@ -47,6 +70,17 @@ class DataService:
             with open(training_path, 'w') as f:
                 json.dump([], f)
 
+    @staticmethod
+    def _get_file_path(data_type: Literal['ppm', 'ocm', 'training']) -> str:
+        """Get the JSON file path for a data type."""
+        if data_type == 'ppm':
+            return Config.PPM_JSON_PATH
+        elif data_type == 'ocm':
+            return Config.OCM_JSON_PATH
+        elif data_type == 'training':
+            return Config.TRAINING_JSON_PATH
+        raise ValueError(f"Unsupported data type: {data_type}")
+
     @staticmethod
     def load_data(data_type: Literal['ppm', 'ocm', 'training']) -> List[Dict[str, Any]]:
         """Load data from JSON file.
@@ -59,15 +93,7 @@ class DataService:
         """
         try:
             DataService.ensure_data_files_exist()
-
-            if data_type == 'ppm':
-                file_path = Config.PPM_JSON_PATH
-            elif data_type == 'ocm':
-                file_path = Config.OCM_JSON_PATH
-            elif data_type == 'training':
-                file_path = Config.TRAINING_JSON_PATH
-            else:
-                raise ValueError(f"Unsupported data type: {data_type}")
+            file_path = DataService._get_file_path(data_type)
 
             with open(file_path, 'r') as f:
                 # Handle empty file case
@@ -86,24 +112,21 @@ class DataService:
 
 
     @staticmethod
-    def save_data(data: List[Dict[str, Any]], data_type: Literal['ppm', 'ocm', 'training']):
+    def save_data(data: List[Dict[str, Any]], data_type: Literal['ppm', 'ocm', 'training'],
+                  upserted: Optional[List[Dict[str, Any]]] = None, removed: Optional[List[str]] = None):
         """Save data to JSON file.
 
         Args:
             data: List of data entries to save
             data_type: Type of data to save ('ppm', 'ocm', or 'training')
+            upserted: Entries added or updated by this save (optional); passing the change
+                lets the search index update these entries instead of re-reading the file
+            removed: Keys of the entries deleted by this save (optional)
         """
         try:
             DataService.ensure_data_files_exist()
-
-            if data_type == 'ppm':
-                file_path = Config.PPM_JSON_PATH
-            elif data_type == 'ocm':
-                file_path = Config.OCM_JSON_PATH
-            elif data_type == 'training':
-                file_path = Config.TRAINING_JSON_PATH
-            else:
-                raise ValueError(f"Unsupported data type: {data_type}")
+            file_path = DataService._get_file_path(data_type)
+            base_version = DataService.get_dataset_key(data_type)
 
             with open(file_path, 'w') as f:
                 json.dump(data, f, indent=2)
@@ -111,6 +134,152 @@ class DataService:
             logger.error(f"Error saving {data_type} data: {str(e)}")
             raise
 
+        if upserted is not None or removed is not None:
+            DataService._update_search_index(data_type, base_version, upserted or [], removed or [])
+
+    @staticmethod
+    def _update_search_index(data_type: Literal['ppm', 'ocm', 'training'], base_version: str,
+                             upserted: List[Dict[str, Any]], removed: List[str]):
+        """Pass the entries changed by a save to the search index of this process."""
+        from app.services.search_service import SearchService
+
+        try:
+            SearchService.apply_changes(data_type, base_version, DataService.get_dataset_key(data_type),
+                                        upserted, removed)
+        except Exception as e:
+            # The data is saved; the next search re-syncs the index from the file
+            logger.warning(f"Could not update the search index for {data_type}: {str(e)}")
+
+    @staticmethod
+    def save_datasets(datasets: Dict[str, List[Dict[str, Any]]]):
+        """Save several datasets as one commit: either every file is replaced or none is.
+
+        Each dataset is first written to a staging file next to its target. Only when all
+        staging files are on disk are they swapped in with os.replace(); if a swap fails,
+        the datasets already swapped are restored from their rollback copies.
+
+        Args:
+            datasets: Mapping of data type to the full list of entries to save
+
+        Raises:
+            OSError: If the datasets could not be written; the stored data is left unchanged
+        """
+        DataService.ensure_data_files_exist()
+        paths = {data_type: DataService._get_file_path(data_type) for data_type in datasets}
+        staged = {data_type: f"{path}.restore" for data_type, path in paths.items()}
+        rollback = {data_type: f"{path}.rollback" for data_type, path in paths.items()}
+        swapped = []
+
+        try:
+            for data_type, data in datasets.items():
+                with open(staged[data_type], 'w') as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            for data_type, path in paths.items():
+                shutil.copy2(path, rollback[data_type])
+
+            try:
+                for data_type, path in paths.items():
+                    os.replace(staged[data_type], path)
+                    swapped.append(data_type)
+            except OSError:
+                logger.error(f"Failed to swap in datasets, rolling back {', '.join(swapped) or 'nothing'}")
+                for data_type in swapped:
+                    os.replace(rollback[data_type], paths[data_type])
+                raise
+        finally:
+            for leftover in list(staged.values()) + list(rollback.values()):
+                try:
+                    os.remove(leftover)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _backup_row_to_entry(data_type: Literal['ppm', 'ocm'], row: Dict[str, Any]) -> Dict[str, Any]:
+        """Map a PPM or OCM row exported by iter_export_rows() back to its stored entry.
+
+        Unlike an import, every exported value is kept as it is: quarter dates are not
+        regenerated from Q1 and Next_Date is not recomputed from Last_Date.
+
+        Args:
+            data_type: Type of the section ('ppm' or 'ocm')
+            row: Row dictionary read from the backup
+
+        Returns:
+            The entry, ready for model validation
+        """
+        def value(column: str) -> str:
+            return str(row.get(column) or '').strip()
+
+        entry = {field: value(field) for field in
+                 ('EQUIPMENT', 'MODEL', 'MFG_SERIAL', 'MANUFACTURER', 'LOG_NO', 'DEPARTMENT')}
+        entry.update({
+            'installation_date': value('INSTALLATION_DATE') or None,
+            'end_of_warranty': value('WARRANTY_END') or None,
+            'status_override': value('STATUS_OVERRIDE') or None,
+        })
+
+        if data_type == 'ppm':
+            entry['PPM'] = value('PPM')
+            for roman, num in (('I', 1), ('II', 2), ('III', 3), ('IV', 4)):
+                entry[f'PPM_Q_{roman}'] = {'date': value(f'PPM Q {roman}'), 'engineer': value(f'Q{num}_ENGINEER')}
+        else:
+            entry.update({
+                'OCM': value('OCM'),
+                'Last_Date': value('Last_Date'),
+                'ENGINEER': value('ENGINEER'),
+                'Next_Date': value('Next_Date'),
+            })
+        return entry
+
+    @staticmethod
+    def validate_backup_rows(data_type: Literal['ppm', 'ocm', 'training'],
+                             rows: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Validate the rows of one backup section into stored entries.
+
+        Rows are expected as exported by export_data() and restored exactly as they were
+        stored, then validated against the section's model.
+
+        Args:
+            data_type: Type of the section ('ppm', 'ocm', or 'training')
+            rows: Row dictionaries read from the backup
+
+        Returns:
+            Tuple of (reindexed entries, error messages)
+        """
+        key_field = 'ID' if data_type == 'training' else 'MFG_SERIAL'
+        model = {'ppm': PPMEntry, 'ocm': OCMEntry, 'training': TrainingEntry}[data_type]
+        records = []
+        errors = []
+        seen = set()
+
+        for index, row in enumerate(rows):
+            row_number = index + 2
+            row = dict(row)
+            row.pop('NO', None)
+
+            if data_type == 'training':
+                # Let the model coerce exported 'True'/'3' strings, leave empty cells at their defaults
+                entry = {k: v for k, v in row.items() if v not in ('', None)}
+            else:
+                entry = DataService._backup_row_to_entry(data_type, row)
+
+            try:
+                validated = model(**entry).model_dump()
+            except ValidationError as e:
+                errors.append(f"Row {row_number}: {str(e)}")
+                continue
+
+            if validated[key_field] in seen:
+                errors.append(f"Row {row_number}: Duplicate {key_field} '{validated[key_field]}'")
+                continue
+            seen.add(validated[key_field])
+            records.append(validated)
+
+        return DataService.reindex(records), errors
+
     @staticmethod
     def ensure_unique_mfg_serial(data: List[Dict[str, Any]], new_entry: Dict[str, Any], exclude_serial: Optional[str] = None):
         """Ensure MFG_SERIAL is unique in the data.
@@ -207,7 +376,7 @@ class DataService:
 
         data.append(validated_entry)
         reindexed_data = DataService.reindex(data)
-        DataService.save_data(reindexed_data, data_type)
+        DataService.save_data(reindexed_data, data_type, upserted=[validated_entry])
 
         # Find the added entry in the reindexed list to return it with 'NO'
         for e in reindexed_data:
@@ -280,7 +449,7 @@ class DataService:
         # Reindexing might not be strictly necessary if NO is preserved,
         # but can ensure consistency if deletions happened previously.
         reindexed_data = DataService.reindex(updated_data)
-        DataService.save_data(reindexed_data, data_type)
+        DataService.save_data(reindexed_data, data_type, upserted=[validated_entry])
 
         # Find the updated entry in the reindexed list
         for e in reindexed_data:
@@ -308,7 +477,7 @@ class DataService:
             return False # Entry not found
 
         reindexed_data = DataService.reindex(data) # Reindex after deletion
-        DataService.save_data(reindexed_data, data_type)
+        DataService.save_data(reindexed_data, data_type, removed=[mfg_serial])
         return True
 
     @staticmethod
@@ -350,292 +519,797 @@ class DataService:
         return data
 
     @staticmethod
-    def import_data(data_type: Literal['ppm', 'ocm'], file_path: str) -> Dict[str, Any]:
+    def get_data_version(data_type: Literal['ppm', 'ocm', 'training']) -> str:
+        """Get a version token for a data file that changes whenever the file is rewritten.
+
+        Args:
+            data_type: Type of data ('ppm', 'ocm', or 'training')
+
+        Returns:
+            Version token built from the file's modification time and size
+        """
+        file_path = DataService._get_file_path(data_type)
+        try:
+            stat = Path(file_path).stat()
+        except FileNotFoundError:
+            return '0:0'
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    @staticmethod
+    def get_dataset_key(data_type: Literal['ppm', 'ocm', 'training']) -> str:
+        """Get a key identifying the current contents of a data file, for caches built from it.
+
+        Args:
+            data_type: Type of data ('ppm', 'ocm', or 'training')
+
+        Returns:
+            The file's path and version token
         """
-        Bulk import data from a CSV file, skipping 'NO' field in the CSV.
-        Normalizes values and ensures uniqueness of MFG_SERIAL before saving.
+        return f"{DataService._get_file_path(data_type)}:{DataService.get_data_version(data_type)}"
+
+    @staticmethod
+    def compute_row_hash(row: Dict[str, Any]) -> str:
+        """Compute a stable content hash for an imported row or stored record.
+
+        The 'NO' field is ignored because it is reassigned on every reindex.
+
         Args:
-            data_type: The type of data ('ppm' or 'ocm').
-            file_path: The path to the CSV file.
+            row: Row or record dictionary
+
         Returns:
-            A dictionary containing import status (added_count, skipped_count, errors).
+            Hex digest of the row content
         """
-        added_count = 0
-        skipped_count = 0
-        errors = []
-        new_entries_validated = []
+        content = {k: v for k, v in row.items() if k != 'NO'}
+        canonical = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
 
+    @staticmethod
+    def compute_file_hash(file_path: str) -> str:
+        """Compute the SHA-256 digest of an uploaded file without loading it at once."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def load_import_state() -> Dict[str, Any]:
+        """Load the per-dataset import hashes (file hash and row/record hashes)."""
         try:
-            # Try to read the CSV with error handling for encoding issues
-            try:
-                # Try with different encodings and error handling
-                df = pd.read_csv(file_path, encoding='latin-1', on_bad_lines='skip')
-            except Exception as e:
-                # If all else fails, try with even more permissive settings
-                df = pd.read_csv(file_path, encoding='latin-1', on_bad_lines='skip', engine='python')
-
-            # Handle NaN values properly
-            for col in df.columns:
-                if df[col].dtype == 'float64':
-                    df[col] = df[col].fillna(0).astype(int).astype(str)
-                    df[col] = df[col].replace('0', '')
-                else:
-                    df[col] = df[col].fillna('').astype(str)
+            with open(Config.IMPORT_STATE_PATH, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Ignoring unreadable import state: {str(e)}")
+            return {}
 
-            if 'NO' in df.columns:
-                df = df.drop(columns=['NO'])
+    @staticmethod
+    def save_import_state(state: Dict[str, Any]):
+        """Persist the import hashes next to the data files."""
+        try:
+            with open(Config.IMPORT_STATE_PATH, 'w') as f:
+                json.dump(state, f)
+        except OSError as e:
+            logger.error(f"Error saving import state: {str(e)}")
 
-            existing_data = DataService.load_data(data_type)
+    @staticmethod
+    def _normalize_import_row(data_type: Literal['ppm', 'ocm'], row_dict: Dict[str, Any], row_number: int) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """Normalize a raw import row into a model-ready entry.
 
-            for index, row in df.iterrows():
-                row_dict = row.to_dict()
-                combined_entry = {}
+        Args:
+            data_type: The type of data ('ppm' or 'ocm').
+            row_dict: Raw row values keyed by CSV header.
+            row_number: Row number in the source file (for messages).
 
-                # Only need Q1 date and all engineers
-                q1_date = row_dict.get('PPM Q I', '').strip()
+        Returns:
+            Tuple of (entry or None if the row must be skipped, messages)
+        """
+        messages = []
+        combined_entry = {}
 
-                # Skip Q1 date check for OCM data type
-                if data_type == 'ppm' and not q1_date:
-                    msg = f"Row {index+2}: Missing Q1 date"
-                    logger.warning(msg)
-                    errors.append(msg)
-                    skipped_count += 1
-                    continue
+        # Only need Q1 date and all engineers
+        q1_date = row_dict.get('PPM Q I', '').strip()
 
-                # Default values for dates
-                q1_date_formatted = ''
-                other_dates = ['', '', '']
+        # Skip Q1 date check for OCM data type
+        if data_type == 'ppm' and not q1_date:
+            return None, [f"Row {row_number}: Missing Q1 date"]
 
-                # Only validate and generate dates for PPM data type
-                if data_type == 'ppm' and q1_date:
-                    # Try to parse the date in different formats
-                    q1_date_formatted = None
-                    date_obj = None
+        # Default values for dates
+        q1_date_formatted = ''
+        other_dates = ['', '', '']
 
-                    # Try DD/MM/YYYY format first
-                    try:
-                        date_obj = datetime.strptime(q1_date, '%d/%m/%Y')
-                        q1_date_formatted = q1_date  # Already in DD/MM/YYYY, use as-is
-                    except ValueError:
-                        # Try MM/DD/YYYY format
-                        try:
-                            date_obj = datetime.strptime(q1_date, '%m/%d/%Y')
-                            # Convert to DD/MM/YYYY format
-                            q1_date_formatted = date_obj.strftime('%d/%m/%Y')
-                        except ValueError:
-                            # Try other common formats
-                            try:
-                                # Try YYYY-MM-DD format
-                                date_obj = datetime.strptime(q1_date, '%Y-%m-%d')
-                                q1_date_formatted = date_obj.strftime('%d/%m/%Y')
-                            except ValueError as e:
-                                msg = f"Row {index+2}: Invalid Q1 date format: {q1_date}. Please use DD/MM/YYYY format."
-                                logger.warning(msg)
-                                errors.append(msg)
-                                skipped_count += 1
-                                continue
-
-                    # Generate Q2, Q3, Q4 dates (in DD/MM/YYYY format)
-                    try:
-                        # Use the date object directly for more reliable quarter generation
-                        if date_obj:
-                            # Generate quarter dates using relativedelta for more accurate quarter calculations
-                            q2_date = date_obj + relativedelta(months=3)
-                            q3_date = date_obj + relativedelta(months=6)
-                            q4_date = date_obj + relativedelta(months=9)
-
-                            other_dates = [
-                                q2_date.strftime('%d/%m/%Y'),
-                                q3_date.strftime('%d/%m/%Y'),
-                                q4_date.strftime('%d/%m/%Y')
-                            ]
-                        else:
-                            # Fallback to the old method if date_obj is not available
-                            other_dates = ValidationService.generate_quarter_dates(q1_date_formatted)
-                    except ValueError as e:
-                        msg = f"Row {index+2}: Error generating quarter dates: {e}"
-                        logger.warning(msg)
-                        errors.append(msg)
-                        skipped_count += 1
-                        continue
-
-                # Only set up quarter data for PPM data type
-                if data_type == 'ppm':
-                    # Get engineer values from the CSV
-                    q1_engineer = row_dict.get('Q1_ENGINEER', '').strip() or 'n/a'
-                    q2_engineer = row_dict.get('Q2_ENGINEER', '').strip() or 'n/a'
-                    q3_engineer = row_dict.get('Q3_ENGINEER', '').strip() or 'n/a'
-                    q4_engineer = row_dict.get('Q4_ENGINEER', '').strip() or 'n/a'
-
-                    # Set up quarter data with dates and engineers
-                    combined_entry['PPM_Q_I'] = {
-                        'date': q1_date_formatted or '01/01/2024',  # Use validated Q1 date
-                        'engineer': q1_engineer
-                    }
-                    combined_entry['PPM_Q_II'] = {
-                        'date': other_dates[0],  # Q2 date (Q1 + 3 months)
-                        'engineer': q2_engineer
-                    }
-                    combined_entry['PPM_Q_III'] = {
-                        'date': other_dates[1],  # Q3 date (Q1 + 6 months)
-                        'engineer': q3_engineer
-                    }
-                    combined_entry['PPM_Q_IV'] = {
-                        'date': other_dates[2],  # Q4 date (Q1 + 9 months)
-                        'engineer': q4_engineer
-                    }
-
-                # Only MFG_SERIAL is required for both PPM and OCM
-                mfg_serial = row_dict.get('MFG_SERIAL', '').strip()
-                if not mfg_serial:
-                    msg = f"Skipping row {index+2}: Missing required field 'MFG_SERIAL'"
-                    logger.warning(msg)
-                    errors.append(msg)
-                    skipped_count += 1
-                    continue
-
-                # Populate entry with normalized values, auto-filling empty fields with "n/a"
-                if data_type == 'ppm':
-                    # Handle installation_date and end_of_warranty fields
-                    installation_date = row_dict.get('INSTALLATION_DATE', '').strip()
-                    end_of_warranty = row_dict.get('WARRANTY_END', '').strip()
-                    
-                    combined_entry.update({
-                        'EQUIPMENT': row_dict.get('EQUIPMENT', '').strip() or 'n/a',
-                        'MODEL': row_dict.get('MODEL', '').strip() or 'n/a',
-                        'MFG_SERIAL': mfg_serial,
-                        'MANUFACTURER': row_dict.get('MANUFACTURER', '').strip() or 'n/a',
-                        'LOG_NO': str(row_dict.get('LOG_NO', '')).strip() or 'n/a',
-                        'DEPARTMENT': row_dict.get('DEPARTMENT', '').strip() or 'n/a',
-                        'PPM': row_dict.get('PPM', '').strip().capitalize() if 'PPM' in row_dict else '',
-                        'OCM': row_dict.get('OCM', '').strip().capitalize() if 'OCM' in row_dict else '',
-                        'installation_date': installation_date if installation_date and installation_date.lower() != 'n/a' else None,
-                        'end_of_warranty': end_of_warranty if end_of_warranty and end_of_warranty.lower() != 'n/a' else None,
-                    })
-                else:  # OCM data type
-                    # Get Last_Date from the CSV
-                    last_date = row_dict.get('Last_Date', '').strip()
-                    if not last_date:
-                        msg = f"Skipping row {index+2}: Missing required field 'Last_Date'"
-                        logger.warning(msg)
-                        errors.append(msg)
-                        skipped_count += 1
-                        continue
-
-                    # Calculate Next_Date (1 year after Last_Date)
-                    next_date = ''
+        # Only validate and generate dates for PPM data type
+        if data_type == 'ppm' and q1_date:
+            # Try to parse the date in different formats
+            q1_date_formatted = None
+            date_obj = None
+
+            # Try DD/MM/YYYY format first
+            try:
+                date_obj = datetime.strptime(q1_date, '%d/%m/%Y')
+                q1_date_formatted = q1_date  # Already in DD/MM/YYYY, use as-is
+            except ValueError:
+                # Try MM/DD/YYYY format
+                try:
+                    date_obj = datetime.strptime(q1_date, '%m/%d/%Y')
+                    # Convert to DD/MM/YYYY format
+                    q1_date_formatted = date_obj.strftime('%d/%m/%Y')
+                except ValueError:
+                    # Try other common formats
                     try:
-                        last_date_obj = datetime.strptime(last_date, '%d/%m/%Y')
-                        next_date_obj = last_date_obj + timedelta(days=365)
-                        next_date = next_date_obj.strftime('%d/%m/%Y')
+                        # Try YYYY-MM-DD format
+                        date_obj = datetime.strptime(q1_date, '%Y-%m-%d')
+                        q1_date_formatted = date_obj.strftime('%d/%m/%Y')
                     except ValueError:
-                        msg = f"Row {index+2}: Invalid Last_Date format: {last_date}. Using 'n/a' for Next_Date."
-                        logger.warning(msg)
-                        errors.append(msg)
-                        next_date = 'n/a'
-
-                    # Handle installation_date and end_of_warranty fields for OCM
-                    installation_date = row_dict.get('INSTALLATION_DATE', '').strip()
-                    end_of_warranty = row_dict.get('WARRANTY_END', '').strip()
-
-                    combined_entry.update({
-                        'EQUIPMENT': row_dict.get('EQUIPMENT', '').strip() or 'n/a',
-                        'MODEL': row_dict.get('MODEL', '').strip() or 'n/a',
-                        'MFG_SERIAL': mfg_serial,
-                        'MANUFACTURER': row_dict.get('MANUFACTURER', '').strip() or 'n/a',
-                        'LOG_NO': str(row_dict.get('LOG_NO', '')).strip() or 'n/a',
-                        'DEPARTMENT': row_dict.get('DEPARTMENT', '').strip() or 'n/a',
-                        'PPM': row_dict.get('PPM', '').strip().capitalize() if 'PPM' in row_dict else '',
-                        'OCM': row_dict.get('OCM', '').strip().capitalize() if 'OCM' in row_dict else '',
-                        'Last_Date': last_date,
-                        'ENGINEER': row_dict.get('ENGINEER', '').strip() or 'n/a',
-                        'Next_Date': next_date,
-                        'installation_date': installation_date if installation_date and installation_date.lower() != 'n/a' else None,
-                        'end_of_warranty': end_of_warranty if end_of_warranty and end_of_warranty.lower() != 'n/a' else None,
-                    })
-
-                # Normalize PPM value to match Literal['Yes', 'No']
+                        return None, [f"Row {row_number}: Invalid Q1 date format: {q1_date}. Please use DD/MM/YYYY format."]
+
+            # Generate Q2, Q3, Q4 dates (in DD/MM/YYYY format)
+            try:
+                # Use the date object directly for more reliable quarter generation
+                if date_obj:
+                    # Generate quarter dates using relativedelta for more accurate quarter calculations
+                    q2_date = date_obj + relativedelta(months=3)
+                    q3_date = date_obj + relativedelta(months=6)
+                    q4_date = date_obj + relativedelta(months=9)
+
+                    other_dates = [
+                        q2_date.strftime('%d/%m/%Y'),
+                        q3_date.strftime('%d/%m/%Y'),
+                        q4_date.strftime('%d/%m/%Y')
+                    ]
+                else:
+                    # Fallback to the old method if date_obj is not available
+                    other_dates = ValidationService.generate_quarter_dates(q1_date_formatted)
+            except ValueError as e:
+                return None, [f"Row {row_number}: Error generating quarter dates: {e}"]
+
+        # Only set up quarter data for PPM data type
+        if data_type == 'ppm':
+            # Get engineer values from the CSV
+            q1_engineer = row_dict.get('Q1_ENGINEER', '').strip() or 'n/a'
+            q2_engineer = row_dict.get('Q2_ENGINEER', '').strip() or 'n/a'
+            q3_engineer = row_dict.get('Q3_ENGINEER', '').strip() or 'n/a'
+            q4_engineer = row_dict.get('Q4_ENGINEER', '').strip() or 'n/a'
+
+            # Set up quarter data with dates and engineers
+            combined_entry['PPM_Q_I'] = {
+                'date': q1_date_formatted or '01/01/2024',  # Use validated Q1 date
+                'engineer': q1_engineer
+            }
+            combined_entry['PPM_Q_II'] = {
+                'date': other_dates[0],  # Q2 date (Q1 + 3 months)
+                'engineer': q2_engineer
+            }
+            combined_entry['PPM_Q_III'] = {
+                'date': other_dates[1],  # Q3 date (Q1 + 6 months)
+                'engineer': q3_engineer
+            }
+            combined_entry['PPM_Q_IV'] = {
+                'date': other_dates[2],  # Q4 date (Q1 + 9 months)
+                'engineer': q4_engineer
+            }
+
+        # Only MFG_SERIAL is required for both PPM and OCM
+        mfg_serial = row_dict.get('MFG_SERIAL', '').strip()
+        if not mfg_serial:
+            return None, [f"Skipping row {row_number}: Missing required field 'MFG_SERIAL'"]
+
+        # Populate entry with normalized values, auto-filling empty fields with "n/a"
+        installation_date = row_dict.get('INSTALLATION_DATE', '').strip()
+        end_of_warranty = row_dict.get('WARRANTY_END', '').strip()
+
+        if data_type == 'ppm':
+            combined_entry.update({
+                'EQUIPMENT': row_dict.get('EQUIPMENT', '').strip() or 'n/a',
+                'MODEL': row_dict.get('MODEL', '').strip() or 'n/a',
+                'MFG_SERIAL': mfg_serial,
+                'MANUFACTURER': row_dict.get('MANUFACTURER', '').strip() or 'n/a',
+                'LOG_NO': str(row_dict.get('LOG_NO', '')).strip() or 'n/a',
+                'DEPARTMENT': row_dict.get('DEPARTMENT', '').strip() or 'n/a',
+                'PPM': row_dict.get('PPM', '').strip().capitalize() if 'PPM' in row_dict else '',
+                'OCM': row_dict.get('OCM', '').strip().capitalize() if 'OCM' in row_dict else '',
+                'installation_date': installation_date if installation_date and installation_date.lower() != 'n/a' else None,
+                'end_of_warranty': end_of_warranty if end_of_warranty and end_of_warranty.lower() != 'n/a' else None,
+            })
+        else:  # OCM data type
+            # Get Last_Date from the CSV
+            last_date = row_dict.get('Last_Date', '').strip()
+            if not last_date:
+                return None, [f"Skipping row {row_number}: Missing required field 'Last_Date'"]
+
+            # Calculate Next_Date (1 year after Last_Date)
+            next_date = ''
+            try:
+                last_date_obj = datetime.strptime(last_date, '%d/%m/%Y')
+                next_date_obj = last_date_obj + timedelta(days=365)
+                next_date = next_date_obj.strftime('%d/%m/%Y')
+            except ValueError:
+                messages.append(f"Row {row_number}: Invalid Last_Date format: {last_date}. Using 'n/a' for Next_Date.")
+                next_date = 'n/a'
+
+            combined_entry.update({
+                'EQUIPMENT': row_dict.get('EQUIPMENT', '').strip() or 'n/a',
+                'MODEL': row_dict.get('MODEL', '').strip() or 'n/a',
+                'MFG_SERIAL': mfg_serial,
+                'MANUFACTURER': row_dict.get('MANUFACTURER', '').strip() or 'n/a',
+                'LOG_NO': str(row_dict.get('LOG_NO', '')).strip() or 'n/a',
+                'DEPARTMENT': row_dict.get('DEPARTMENT', '').strip() or 'n/a',
+                'PPM': row_dict.get('PPM', '').strip().capitalize() if 'PPM' in row_dict else '',
+                'OCM': row_dict.get('OCM', '').strip().capitalize() if 'OCM' in row_dict else '',
+                'Last_Date': last_date,
+                'ENGINEER': row_dict.get('ENGINEER', '').strip() or 'n/a',
+                'Next_Date': next_date,
+                'installation_date': installation_date if installation_date and installation_date.lower() != 'n/a' else None,
+                'end_of_warranty': end_of_warranty if end_of_warranty and end_of_warranty.lower() != 'n/a' else None,
+            })
+
+        # Normalize PPM value to match Literal['Yes', 'No']
+        if data_type == 'ppm':
+            ppm_val = combined_entry['PPM'].lower()
+            if ppm_val in ('yes', 'no'):
+                combined_entry['PPM'] = 'Yes' if ppm_val == 'yes' else 'No'
+            else:
+                messages.append(f"Skipping row {row_number}: Invalid PPM value '{combined_entry['PPM']}'")
+                return None, messages
+
+        return combined_entry, messages
+
+    @staticmethod
+    def _diff_fields(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Get the fields that differ between a stored record and its replacement.
+
+        Args:
+            old: Stored record
+            new: Validated replacement record
+
+        Returns:
+            Mapping of field name to {'old': ..., 'new': ...}
+        """
+        changes = {}
+        for field in sorted(set(old) | set(new)):
+            if field == 'NO':
+                continue
+            if old.get(field) != new.get(field):
+                changes[field] = {'old': old.get(field), 'new': new.get(field)}
+        return changes
+
+    @staticmethod
+    def _new_import_plan(data_type: str, key_field: str, file_hash: Optional[str], base_version: str) -> Dict[str, Any]:
+        """Create an empty import plan."""
+        return {
+            'data_type': data_type,
+            'key_field': key_field,
+            'file_hash': file_hash,
+            'base_version': base_version,
+            'identical_file': False,
+            'row_count': 0,
+            'added': [],
+            'updated': [],
+            'unchanged': [],
+            'rejected': [],
+            'messages': [],
+            'row_hashes': {},
+        }
+
+    @staticmethod
+    def _plan_record(plan: Dict[str, Any], planned: Dict[str, Tuple[str, int]], existing_data: List[Dict[str, Any]],
+                     existing_index: Dict[str, int], validated: Dict[str, Any], row_number: int):
+        """Classify a validated record as added, updated or unchanged against the key index.
+
+        Later rows with the same key replace earlier rows of the same file.
+        """
+        key = validated[plan['key_field']]
+        existing = existing_data[existing_index[key]] if key in existing_index else None
+
+        if existing is not None and DataService.compute_row_hash(existing) == DataService.compute_row_hash(validated):
+            item = {'row': row_number, 'key': key}
+            action = 'unchanged'
+        elif existing is not None:
+            item = {'row': row_number, 'key': key, 'entry': validated,
+                    'changes': DataService._diff_fields(existing, validated)}
+            action = 'updated'
+        else:
+            item = {'row': row_number, 'key': key, 'entry': validated}
+            action = 'added'
+
+        if key in planned:
+            previous_action, position = planned[key]
+            if previous_action == action:
+                plan[action][position] = item
+                return
+            plan[previous_action][position] = None
+
+        planned[key] = (action, len(plan[action]))
+        plan[action].append(item)
+
+    @staticmethod
+    def _finish_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Drop rows superseded by later rows with the same key."""
+        for action in ('added', 'updated', 'unchanged'):
+            plan[action] = [item for item in plan[action] if item is not None]
+        return plan
+
+    @staticmethod
+    def plan_import(data_type: Literal['ppm', 'ocm'], file_path: str,
+                    import_format: Optional[ImportFormat] = None) -> Dict[str, Any]:
+        """
+        Run the full normalization and validation pipeline for an equipment file without writing.
+
+        Rows are diffed against the MFG_SERIAL index of the stored data in a single pass.
+        Rows whose hash matches the stored record are classified as unchanged without validation.
+
+        Args:
+            data_type: The type of data ('ppm' or 'ocm').
+            file_path: The path to the CSV or XLSX file.
+            import_format: Format already detected for the file (optional).
+
+        Returns:
+            An import plan with 'added', 'updated', 'unchanged' and 'rejected' rows.
+        """
+        import_state = DataService.load_import_state()
+        dataset_state = import_state.get(data_type, {})
+        row_hashes = dataset_state.get('rows', {})
+
+        file_hash = DataService.compute_file_hash(file_path)
+        plan = DataService._new_import_plan(data_type, 'MFG_SERIAL', file_hash, DataService.get_data_version(data_type))
+
+        if dataset_state.get('file_hash') == file_hash and dataset_state.get('data_version') == plan['base_version']:
+            logger.info(f"Skipping {data_type} import: file is identical to the last import")
+            plan['identical_file'] = True
+            plan['row_count'] = dataset_state.get('row_count', len(row_hashes))
+            return plan
+
+        existing_data = DataService.load_data(data_type)
+        existing_index = {entry.get('MFG_SERIAL'): i for i, entry in enumerate(existing_data)}
+        planned = {}
+
+        if import_format is None:
+            import_format = detect_format(file_path, data_type)
+
+        for index, row_dict in enumerate(import_format.iter_rows()):
+            row_dict.pop('NO', None)
+            row_number = index + 2
+            plan['row_count'] += 1
+            row_hash = DataService.compute_row_hash(row_dict)
+            mfg_serial = row_dict.get('MFG_SERIAL', '').strip()
+
+            # Unchanged rows are skipped without validation
+            stored = row_hashes.get(mfg_serial)
+            if (stored and stored.get('row') == row_hash and mfg_serial in existing_index and mfg_serial not in planned and
+                    DataService.compute_row_hash(existing_data[existing_index[mfg_serial]]) == stored.get('record')):
+                plan['row_hashes'][mfg_serial] = stored
+                planned[mfg_serial] = ('unchanged', len(plan['unchanged']))
+                plan['unchanged'].append({'row': row_number, 'key': mfg_serial})
+                continue
+
+            combined_entry, messages = DataService._normalize_import_row(data_type, row_dict, row_number)
+            for msg in messages:
+                logger.warning(msg)
+            if combined_entry is None:
+                plan['rejected'].append({'row': row_number, 'key': mfg_serial, 'message': messages[-1]})
+                plan['messages'].extend(messages[:-1])
+                continue
+            plan['messages'].extend(messages)
+
+            # Validate against Pydantic model
+            try:
                 if data_type == 'ppm':
-                    ppm_val = combined_entry['PPM'].lower()
-                    if ppm_val in ('yes', 'no'):
-                        combined_entry['PPM'] = 'Yes' if ppm_val == 'yes' else 'No'
-                    else:
-                        msg = f"Skipping row {index+2}: Invalid PPM value '{combined_entry['PPM']}'"
-                        logger.warning(msg)
-                        errors.append(msg)
-                        skipped_count += 1
-                        continue
-
-                # Validate against Pydantic model
-                try:
-                    if data_type == 'ppm':
-                        validated = PPMEntry(**combined_entry).model_dump()
-                    else:
-                        validated = OCMEntry(**combined_entry).model_dump()
-                except ValidationError as e:
-                    msg = f"Validation error on row {index+2}: {str(e)}"
-                    logger.warning(msg)
-                    errors.append(msg)
-                    skipped_count += 1
-                    continue
-
-                # Check for duplicates and handle replacement
-                mfg_serial = validated['MFG_SERIAL']
-                duplicate_found = False
-
-                # Check in existing data and replace if found
-                for i, entry in enumerate(existing_data):
-                    if entry['MFG_SERIAL'] == mfg_serial:
-                        existing_data[i] = validated
-                        duplicate_found = True
-                        msg = f"Row {index+2}: Replaced existing entry with MFG_SERIAL '{mfg_serial}'"
-                        logger.info(msg)
-                        errors.append(msg)
-                        break
-
-                # Check in new entries and replace if found
-                if not duplicate_found:
-                    for i, entry in enumerate(new_entries_validated):
-                        if entry['MFG_SERIAL'] == mfg_serial:
-                            new_entries_validated[i] = validated
-                            duplicate_found = True
-                            msg = f"Row {index+2}: Replaced previously imported entry with MFG_SERIAL '{mfg_serial}'"
-                            logger.info(msg)
-                            errors.append(msg)
-                            break
-
-                # If no duplicate found, add as new entry
-                if not duplicate_found:
-                    new_entries_validated.append(validated)
-                    added_count += 1
-
-            # Save valid entries after processing all rows
-            if new_entries_validated:
-                updated_data = existing_data + new_entries_validated
-                reindexed_data = DataService.reindex(updated_data)
-                DataService.save_data(reindexed_data, data_type)
-
-        except pd.errors.EmptyDataError:
-            msg = "Import Error: The uploaded CSV file is empty."
-            logger.error(msg)
-            errors.append(msg)
-            skipped_count = len(df.index) if 'df' in locals() else 0
+                    validated = PPMEntry(**combined_entry).model_dump()
+                else:
+                    validated = OCMEntry(**combined_entry).model_dump()
+            except ValidationError as e:
+                msg = f"Validation error on row {row_number}: {str(e)}"
+                logger.warning(msg)
+                plan['rejected'].append({'row': row_number, 'key': mfg_serial, 'message': msg})
+                continue
+
+            plan['row_hashes'][validated['MFG_SERIAL']] = {'row': row_hash,
+                                                           'record': DataService.compute_row_hash(validated)}
+            DataService._plan_record(plan, planned, existing_data, existing_index, validated, row_number)
+
+        return DataService._finish_plan(plan)
+
+    @staticmethod
+    def commit_import(plan: Dict[str, Any], existing_data: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Apply an import plan produced by plan_import() or plan_training_import().
+
+        Args:
+            plan: The import plan
+            existing_data: Already loaded data to apply the plan to (optional)
+
+        Returns:
+            The import summary.
+
+        Raises:
+            ValueError: If the stored data changed after the plan was computed.
+        """
+        data_type = plan['data_type']
+        key_field = plan['key_field']
+
+        if plan['identical_file']:
+            return DataService.summarize_import(plan)
+
+        if DataService.get_data_version(data_type) != plan['base_version']:
+            raise ValueError(f"{data_type.upper()} data changed since the import was previewed. Please preview the file again.")
+
+        if plan['added'] or plan['updated']:
+            if existing_data is None:
+                existing_data = DataService.load_data(data_type)
+            existing_index = {entry.get(key_field): i for i, entry in enumerate(existing_data)}
+
+            for item in plan['updated']:
+                existing_data[existing_index[item['key']]] = item['entry']
+            existing_data.extend(item['entry'] for item in plan['added'])
+
+            reindexed_data = DataService.reindex(existing_data)
+            DataService.save_data(reindexed_data, data_type,
+                                  upserted=[item['entry'] for item in plan['added'] + plan['updated']])
+
+        if data_type in ('ppm', 'ocm'):
+            import_state = DataService.load_import_state()
+            previous_hashes = import_state.get(data_type, {}).get('rows', {})
+            current_keys = {e.get(key_field) for e in existing_data} if existing_data is not None else None
+
+            # Keep hashes of rows that were not part of this file so partial uploads stay cheap
+            merged_hashes = {key: hashes for key, hashes in previous_hashes.items()
+                             if key not in plan['row_hashes'] and (current_keys is None or key in current_keys)}
+            merged_hashes.update(plan['row_hashes'])
+            import_state[data_type] = {
+                'file_hash': plan['file_hash'] if not plan['rejected'] else None,
+                'data_version': DataService.get_data_version(data_type),
+                'row_count': plan['row_count'],
+                'rows': merged_hashes
+            }
+            DataService.save_import_state(import_state)
+
+        return DataService.summarize_import(plan)
+
+    @staticmethod
+    def summarize_import(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the import summary reported to the user from an import plan."""
+        added = len(plan['added'])
+        updated = len(plan['updated'])
+        summary = {
+            "success": added + updated,
+            "skipped": len(plan['rejected']),
+            "errors": len(plan['rejected']) + len(plan['messages']),
+            "added": added,
+            "updated": updated,
+            "unchanged": plan['row_count'] if plan['identical_file'] else len(plan['unchanged']),
+            "error_details": [item['message'] for item in plan['rejected']] + plan['messages']
+        }
+        if plan['identical_file']:
+            summary['identical_file'] = True
+        return summary
+
+    @staticmethod
+    def import_data(data_type: Literal['ppm', 'ocm'], file_path: str, dry_run: bool = False,
+                    import_format: Optional[ImportFormat] = None) -> Dict[str, Any]:
+        """
+        Bulk import data from a CSV or XLSX file, skipping 'NO' field in the file.
+        Normalizes values and ensures uniqueness of MFG_SERIAL before saving.
+
+        A content hash is stored for the uploaded file and for every imported row.
+        Re-uploading an identical file is short-circuited, and rows whose hash matches
+        the stored record are skipped without validation, so the cost of a re-import
+        is proportional to the number of changed rows.
+
+        Args:
+            data_type: The type of data ('ppm' or 'ocm').
+            file_path: The path to the CSV or XLSX file.
+            dry_run: If True, cache the computed plan and return a preview instead of writing.
+            import_format: Format already detected for the file (optional).
+        Returns:
+            A dictionary containing import status (success, skipped, errors,
+            added, updated, unchanged), or the first preview page when dry_run is set.
+        """
+        try:
+            plan = DataService.plan_import(data_type, file_path, import_format)
+            if dry_run:
+                token = DataService.save_import_preview(plan)
+                return DataService.get_import_preview_page(token)
+            return DataService.commit_import(plan)
+        except ValueError as e:
+            msg = f"Import Error: {str(e)}"
         except KeyError as e:
             msg = f"Import Error: Missing expected column in CSV: {e}. Please check the header."
-            logger.error(msg)
-            errors.append(msg)
         except Exception as e:
             msg = f"Import failed: An unexpected error occurred - {str(e)}"
             logger.exception(msg)
-            errors.append(msg)
-            skipped_count = df.shape[0] if 'df' in locals() else 0
+        logger.error(msg)
+
+        return {
+            "success": 0,
+            "skipped": 0,
+            "errors": 1,
+            "added": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "error_details": [msg]
+        }
+
+    @staticmethod
+    def _normalize_training_row(data: Dict[str, str], row_number: int) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Normalize a training import row (headers already normalized) into a model-ready entry.
+
+        Args:
+            data: Row values keyed by normalized header (e.g. 'MACHINE 1 TRAINER')
+            row_number: Row number in the source file (for messages)
+
+        Returns:
+            Tuple of (entry or None, error message or None)
+        """
+        # Fill empty fields with 'n/a'
+        for key in data:
+            if pd.isna(data[key]) or data[key] == '':
+                data[key] = 'n/a'
+
+        # Validate required fields
+        missing_fields = [field for field in TRAINING_REQUIRED_COLUMNS if data.get(field) == 'n/a']
+        if missing_fields:
+            return None, f"Row {row_number}: Missing required fields: {', '.join(missing_fields)}"
+
+        # Process machine columns into MACHINES dictionary
+        machines = {}
+        total_trained = 0
+
+        for machine_col in ['MACHINE 1', 'MACHINE 2', 'MACHINE 3', 'MACHINE 4', 'MACHINE 5', 'MACHINE 6', 'MACHINE 7']:
+            if machine_col in data and data[machine_col].lower() != 'n/a':
+                # If the machine name is present, mark it as trained
+                machine_name = data[machine_col].lower().replace(' ', '_')
+                machines[machine_name] = True
+                total_trained += 1
+
+        # Create employee data dictionary
+        return {
+            'ID': str(data['ID']).strip(),
+            'NAME': data.get('NAME', 'n/a'),
+            'DEPARTMENT': data.get('DEPARTMENT', 'n/a'),
+            'TRAINER': data.get('MACHINE 1 TRAINER', 'n/a'),
+            'MACHINES': machines,
+            'machine1_trainer': data.get('MACHINE 1 TRAINER', 'n/a'),
+            'machine2_trainer': data.get('MACHINE 2 TRAINER', 'n/a'),
+            'machine3_trainer': data.get('MACHINE 3 TRAINER', 'n/a'),
+            'machine4_trainer': data.get('MACHINE 4 TRAINER', 'n/a'),
+            'machine5_trainer': data.get('MACHINE 5 TRAINER', 'n/a'),
+            'machine6_trainer': data.get('MACHINE 6 TRAINER', 'n/a'),
+            'machine7_trainer': data.get('MACHINE 7 TRAINER', 'n/a'),
+            'total_trained': total_trained
+        }, None
+
+    @staticmethod
+    def plan_training_import(file_path: str) -> Dict[str, Any]:
+        """
+        Run the training normalization and validation pipeline without writing.
+
+        Rows are diffed against the employee ID index of the stored data in a single pass.
+
+        Args:
+            file_path: The path to the CSV or XLSX file.
+
+        Returns:
+            An import plan with 'added', 'updated', 'unchanged' and 'rejected' rows.
+
+        Raises:
+            ValueError: If required columns are missing from the header.
+        """
+        plan = DataService._new_import_plan('training', 'ID', DataService.compute_file_hash(file_path),
+                                           DataService.get_data_version('training'))
+
+        # Stream the CSV or XLSX rows with normalized headers
+        import_format = detect_format(file_path, 'training')
+
+        # Check for missing required columns
+        missing_fields = [field for field in TRAINING_REQUIRED_COLUMNS if field not in import_format.columns]
+        if missing_fields:
+            raise ValueError(f"Missing required columns: {', '.join(missing_fields)}")
+
+        existing_data = DataService.load_data('training')
+        existing_index = {(entry.get('ID') or entry.get('id')): i for i, entry in enumerate(existing_data)}
+        planned = {}
+
+        for index, data in enumerate(import_format.iter_rows()):
+            row_number = index + 2
+            plan['row_count'] += 1
+
+            employee_data, error = DataService._normalize_training_row(data, row_number)
+            if employee_data is None:
+                plan['rejected'].append({'row': row_number, 'key': data.get('ID'), 'message': error})
+                continue
+
+            try:
+                validated = TrainingEntry(**employee_data).model_dump()
+            except ValidationError as e:
+                plan['rejected'].append({'row': row_number, 'key': employee_data['ID'],
+                                         'message': f"Row {row_number}: {str(e)}"})
+                continue
+
+            DataService._plan_record(plan, planned, existing_data, existing_index, validated, row_number)
+
+        return DataService._finish_plan(plan)
+
+    @staticmethod
+    def import_training_data(file_path: str, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Import employee training data from a CSV or XLSX file.
+
+        Args:
+            file_path: The path to the CSV or XLSX file.
+            dry_run: If True, cache the computed plan and return a preview instead of writing.
+
+        Returns:
+            The import summary, or the first preview page when dry_run is set.
+
+        Raises:
+            ValueError: If required columns are missing from the header.
+        """
+        plan = DataService.plan_training_import(file_path)
+        if dry_run:
+            token = DataService.save_import_preview(plan)
+            return DataService.get_import_preview_page(token)
+        return DataService.commit_import(plan)
+
+    @staticmethod
+    def _import_preview_path(token: str) -> Path:
+        """Get the cache file path of an import preview."""
+        if not re.fullmatch(r'[0-9a-f]{32}', token or ''):
+            raise ValueError("Invalid preview token")
+        return Path(Config.IMPORT_PREVIEW_DIR) / f"{token}.json"
+
+    @staticmethod
+    def save_import_preview(plan: Dict[str, Any]) -> str:
+        """
+        Cache an import plan so a confirmed commit can reuse it without re-parsing the file.
+
+        Plans are cached in memory and on disk, so any worker process can commit them.
+
+        Args:
+            plan: The import plan
+
+        Returns:
+            The preview token
+        """
+        preview_dir = Path(Config.IMPORT_PREVIEW_DIR)
+        preview_dir.mkdir(parents=True, exist_ok=True)
+
+        # Drop expired previews
+        expiry = datetime.now().timestamp() - IMPORT_PREVIEW_TTL
+        for path in preview_dir.glob('*.json'):
+            if path.stat().st_mtime < expiry:
+                path.unlink(missing_ok=True)
+                with _import_previews_lock:
+                    _import_previews.pop(path.stem, None)
+
+        token = uuid.uuid4().hex
+        path = DataService._import_preview_path(token)
+        with open(path, 'w') as f:
+            json.dump(plan, f)
+        DataService._cache_import_preview(token, path.stat().st_mtime, plan)
+        return token
+
+    @staticmethod
+    def _cache_import_preview(token: str, created_at: float, plan: Dict[str, Any]):
+        """Keep an import plan in memory, evicting the least recently used ones."""
+        with _import_previews_lock:
+            _import_previews[token] = (created_at, plan)
+            _import_previews.move_to_end(token)
+            while len(_import_previews) > IMPORT_PREVIEW_CACHE_SIZE:
+                _import_previews.popitem(last=False)
+
+    @staticmethod
+    def load_import_preview(token: str) -> Optional[Dict[str, Any]]:
+        """Load a cached import plan by token, or None if it expired."""
+        expiry = datetime.now().timestamp() - IMPORT_PREVIEW_TTL
+        with _import_previews_lock:
+            cached = _import_previews.get(token)
+            if cached is not None and cached[0] >= expiry:
+                _import_previews.move_to_end(token)
+                return cached[1]
+
+        try:
+            path = DataService._import_preview_path(token)
+            created_at = path.stat().st_mtime
+            if created_at < expiry:
+                DataService.discard_import_preview(token)
+                return None
+            with open(path, 'r') as f:
+                plan = json.load(f)
+        except (FileNotFoundError, ValueError):
+            with _import_previews_lock:
+                _import_previews.pop(token, None)
+            return None
+        DataService._cache_import_preview(token, created_at, plan)
+        return plan
+
+    @staticmethod
+    def discard_import_preview(token: str):
+        """Remove a cached import plan."""
+        with _import_previews_lock:
+            _import_previews.pop(token, None)
+        try:
+            DataService._import_preview_path(token).unlink(missing_ok=True)
+        except ValueError:
+            pass
+
+    @staticmethod
+    def get_import_preview_page(token: str, page: int = 1, per_page: int = 50, action: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get one page of the diff of a cached import plan.
+
+        Args:
+            token: The preview token
+            page: Page number (1-based)
+            per_page: Items per page
+            action: Only include items of this kind ('new', 'changed', 'unchanged' or 'rejected')
+
+        Returns:
+            The preview page, or None if the preview does not exist
+        """
+        plan = DataService.load_import_preview(token)
+        if plan is None:
+            return None
+
+        sections = [('new', plan['added']), ('changed', plan['updated']),
+                    ('unchanged', plan['unchanged']), ('rejected', plan['rejected'])]
+        if action:
+            sections = [(name, items) for name, items in sections if name == action]
+
+        total = sum(len(items) for _, items in sections)
+        page = max(page, 1)
+        per_page = max(1, min(per_page, 500))
+        start = (page - 1) * per_page
+        end = start + per_page
+
+        # Slice across sections without building the full diff list
+        page_items = []
+        offset = 0
+        for name, items in sections:
+            if offset + len(items) > start and offset < end:
+                for item in items[max(start - offset, 0):end - offset]:
+                    diff_item = {'action': name, 'row': item['row'], 'key': item.get('key')}
+                    if 'changes' in item:
+                        diff_item['changes'] = item['changes']
+                    if 'message' in item:
+                        diff_item['message'] = item['message']
+                    elif name == 'new':
+                        diff_item['entry'] = item['entry']
+                    page_items.append(diff_item)
+            offset += len(items)
 
         return {
-            "success": added_count,
-            "skipped": skipped_count,
-            "errors": len(errors)
+            'token': token,
+            'data_type': plan['data_type'],
+            'summary': DataService.summarize_import(plan),
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page,
+            'items': page_items
         }
 
+    @staticmethod
+    def commit_import_preview(token: str) -> Optional[Dict[str, Any]]:
+        """
+        Commit a previewed import plan without re-parsing the uploaded file.
+
+        Args:
+            token: The preview token
+
+        Returns:
+            The import summary, or None if the preview does not exist
+
+        Raises:
+            ValueError: If the stored data changed after the preview was computed.
+        """
+        plan = DataService.load_import_preview(token)
+        if plan is None:
+            return None
+        summary = DataService.commit_import(plan)
+        DataService.discard_import_preview(token)
+        return summary
+
     @staticmethod
     def add_training_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
         """Add a new training entry.
@@ -663,7 +1337,7 @@ class DataService:
 
         data.append(validated_entry)
         reindexed_data = DataService.reindex(data)
-        DataService.save_data(reindexed_data, 'training')
+        DataService.save_data(reindexed_data, 'training', upserted=[validated_entry])
 
         # Find the added entry in the reindexed list to return it with 'NO'
         for e in reindexed_data:
@@ -715,7 +1389,7 @@ class DataService:
             raise KeyError(f"Entry with ID '{employee_id}' not found")
 
         reindexed_data = DataService.reindex(updated_data)
-        DataService.save_data(reindexed_data, 'training')
+        DataService.save_data(reindexed_data, 'training', upserted=[validated_entry])
 
         # Find the updated entry in the reindexed list
         for e in reindexed_data:
@@ -754,7 +1428,7 @@ class DataService:
             return False  # Entry not found
 
         reindexed_data = DataService.reindex(data)  # Reindex after deletion
-        DataService.save_data(reindexed_data, 'training')
+        DataService.save_data(reindexed_data, 'training', removed=[employee_id])
         return True
 
     @staticmethod
@@ -775,81 +1449,51 @@ class DataService:
         return None
 
     @staticmethod
-    def export_data(data_type: str) -> str:
+    def get_export_columns(data_type: str) -> List[str]:
         """
-        Export data of the specified type to CSV format.
+        Get the export column order for a data type.
 
         Args:
             data_type: The type of data to export ('ppm', 'ocm', or 'training').
 
         Returns:
-            The CSV content as a string.
+            The list of column headers.
 
         Raises:
             ValueError: If the data type is not supported.
         """
-        if data_type not in ['ppm', 'ocm', 'training']:
-            raise ValueError("Unsupported data type for export.")
-
-        data = DataService.load_data(data_type)
-
-        # Flatten and transform data
-        flat_data = []
-
         if data_type == 'training':
-            # Define the department to machine mapping
-            department_machines = {
-                'LDR': ['BP APPARATUS', 'DELIVERY BED', 'NEBULIZER', 'OBSERVATION LIGHT', 'REFRIGERATOR'],
-                'ER': ['DEFIBRILLATOR', 'VENTILATOR', 'INFUSION PUMP', 'SUCTION MACHINE'],
-                'X-RAY': ['X-RAY MACHINE', 'ULTRASOUND', 'CT SCAN', 'MRI'],
-                'LABORATORY': ['CENTRIFUGE', 'MICROSCOPE', 'ANALYZER', 'INCUBATOR', 'REFRIGERATOR'],
-                'OR': ['ANESTHESIA MACHINE', 'SURGICAL TABLE', 'SURGICAL LIGHT', 'ELECTROSURGICAL UNIT', 'PATIENT MONITOR'],
-                'ENDOSCOPY': ['ENDOSCOPE', 'LIGHT SOURCE', 'VIDEO PROCESSOR', 'WASHER'],
-                'DENTAL': ['DENTAL CHAIR', 'DENTAL X-RAY', 'AUTOCLAVE', 'COMPRESSOR'],
-                'CSSD': ['AUTOCLAVE', 'WASHER', 'DRYER', 'SEALER'],
-                'NURSERY': ['INCUBATOR', 'PHOTOTHERAPY', 'INFANT WARMER', 'MONITOR'],
-                'OB-GYN': ['ULTRASOUND', 'FETAL MONITOR', 'COLPOSCOPE', 'DELIVERY BED'],
-                'OPTHA': ['SLIT LAMP', 'OPHTHALMOSCOPE', 'TONOMETER', 'PHOROPTER'],
-                'ENT': ['AUDIOMETER', 'OTOSCOPE', 'ENDOSCOPE', 'MICROSCOPE'],
-                'DERMA': ['LASER', 'CRYOTHERAPY', 'DERMATOSCOPE', 'ELECTROCAUTERY'],
-                'PT': ['TREADMILL', 'ULTRASOUND THERAPY', 'TENS', 'PARALLEL BARS', 'EXERCISE BIKE'],
-                'IVF': ['INCUBATOR', 'MICROSCOPE', 'CENTRIFUGE', 'FREEZER'],
-                'GENERAL SURGERY': ['SURGICAL TABLE', 'SURGICAL LIGHT', 'ELECTROSURGICAL UNIT', 'SUCTION MACHINE'],
-                'IM': ['ECG', 'NEBULIZER', 'BP APPARATUS', 'GLUCOMETER'],
-                '5 A': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                '5 B': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                '6 A': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                '6 B': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                '4A': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                '4 B': ['HOSPITAL BED', 'INFUSION PUMP', 'PATIENT MONITOR', 'SUCTION MACHINE'],
-                'LAUNDRY': ['WASHER', 'DRYER', 'IRONER', 'FOLDER'],
-                'PEDIA': ['INCUBATOR', 'INFANT WARMER', 'NEBULIZER', 'PHOTOTHERAPY'],
-                'PLASTIC': ['LASER', 'ELECTROSURGICAL UNIT', 'LIPOSUCTION MACHINE', 'MONITOR']
-            }
-
-            # Legacy machine mapping
-            legacy_machine_ids = {
-                'sonar': 'SONAR',
-                'fmx': 'FMX',
-                'max': 'MAX',
-                'box20': 'BOX20',
-                'hex': 'HEX'
-            }
-
-            # Helper function to get machine ID
-            def get_machine_id(machine_name):
-                for machine_id, name in legacy_machine_ids.items():
-                    if name.lower() == machine_name.lower():
-                        return machine_id
-                return machine_name.lower().replace(' ', '_')
-
             # Add columns for machine1–machine7 and their trainers
             machine_fields = []
             for i in range(1, 8):
                 machine_fields.append(f'machine{i}')
                 machine_fields.append(f'machine{i}_trainer')
+            return ['NO', 'NAME', 'ID', 'DEPARTMENT', 'TRAINER'] + machine_fields + ['total_trained']
+        elif data_type == 'ppm':
+            return ['NO', 'EQUIPMENT', 'MODEL', 'MFG_SERIAL', 'MANUFACTURER', 'LOG_NO', 'DEPARTMENT', 'PPM',
+                    'PPM Q I', 'Q1_ENGINEER', 'PPM Q II', 'Q2_ENGINEER', 'PPM Q III', 'Q3_ENGINEER', 'PPM Q IV', 'Q4_ENGINEER',
+                    'INSTALLATION_DATE', 'WARRANTY_END', 'STATUS_OVERRIDE']
+        elif data_type == 'ocm':
+            return ['NO', 'EQUIPMENT', 'MODEL', 'MFG_SERIAL', 'MANUFACTURER', 'LOG_NO', 'DEPARTMENT', 'OCM',
+                    'Last_Date', 'ENGINEER', 'Next_Date', 'INSTALLATION_DATE', 'WARRANTY_END', 'STATUS_OVERRIDE']
+        raise ValueError("Unsupported data type for export.")
 
-            for entry in data:
+    @staticmethod
+    def iter_export_rows(data_type: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield flattened export rows for a data type, one entry at a time.
+
+        Args:
+            data_type: The type of data to export ('ppm', 'ocm', or 'training').
+
+        Yields:
+            Flat dictionaries keyed by the columns from get_export_columns().
+        """
+        columns_order = DataService.get_export_columns(data_type)
+        data = DataService.load_data(data_type)
+
+        for entry in data:
+            if data_type == 'training':
                 flat_entry = {
                     'NO': entry.get('NO'),
                     'NAME': entry.get('NAME'),
@@ -862,67 +1506,92 @@ class DataService:
                     flat_entry[f'machine{i}'] = entry.get(f'machine{i}', False)
                     flat_entry[f'machine{i}_trainer'] = entry.get(f'machine{i}_trainer', '')
                 flat_entry['total_trained'] = entry.get('total_trained', 0)
-                flat_data.append(flat_entry)
-
-            # Define CSV columns order for training
-            columns_order = ['NO', 'NAME', 'ID', 'DEPARTMENT', 'TRAINER'] + machine_fields + ['total_trained']
-        else:
-            # Define column orders first to ensure all fields are included
+                yield flat_entry
+                continue
+
+            # Initialize all fields with empty strings to ensure all columns are present
+            flat_entry = {col: '' for col in columns_order}
+
+            # Fill in the common fields
+            flat_entry.update({
+                'NO': entry.get('NO', ''),
+                'EQUIPMENT': entry.get('EQUIPMENT', ''),
+                'MODEL': entry.get('MODEL', ''),
+                'MFG_SERIAL': entry.get('MFG_SERIAL', ''),
+                'MANUFACTURER': entry.get('MANUFACTURER', ''),
+                'LOG_NO': str(entry.get('LOG_NO', '')),
+                'DEPARTMENT': entry.get('DEPARTMENT', '')
+            })
+
+            # Add data type specific fields
             if data_type == 'ppm':
-                columns_order = ['NO', 'EQUIPMENT', 'MODEL', 'MFG_SERIAL', 'MANUFACTURER', 'LOG_NO', 'DEPARTMENT', 'PPM',
-                               'PPM Q I', 'Q1_ENGINEER', 'PPM Q II', 'Q2_ENGINEER', 'PPM Q III', 'Q3_ENGINEER', 'PPM Q IV', 'Q4_ENGINEER',
-                               'INSTALLATION_DATE', 'WARRANTY_END']
-            else:  # OCM
-                columns_order = ['NO', 'EQUIPMENT', 'MODEL', 'MFG_SERIAL', 'MANUFACTURER', 'LOG_NO', 'DEPARTMENT', 'OCM',
-                               'Last_Date', 'ENGINEER', 'Next_Date', 'INSTALLATION_DATE', 'WARRANTY_END']
-
-            # For PPM and OCM data
-            for entry in data:
-                # Initialize all fields with empty strings to ensure all columns are present
-                flat_entry = {col: '' for col in columns_order}
-
-                # Fill in the common fields
-                flat_entry.update({
-                    'NO': entry.get('NO', ''),
-                    'EQUIPMENT': entry.get('EQUIPMENT', ''),
-                    'MODEL': entry.get('MODEL', ''),
-                    'MFG_SERIAL': entry.get('MFG_SERIAL', ''),
-                    'MANUFACTURER': entry.get('MANUFACTURER', ''),
-                    'LOG_NO': str(entry.get('LOG_NO', '')),
-                    'DEPARTMENT': entry.get('DEPARTMENT', '')
-                })
-
-                # Add data type specific fields
-                if data_type == 'ppm':
-                    flat_entry['PPM'] = entry.get('PPM', '')
-
-                    for roman, num, q_key in [('I', 1, 'PPM_Q_I'), ('II', 2, 'PPM_Q_II'), ('III', 3, 'PPM_Q_III'), ('IV', 4, 'PPM_Q_IV')]:
-                        q_data = entry.get(q_key, {})
-                        flat_entry[f'PPM Q {roman}'] = q_data.get('date', '')
-                        flat_entry[f'Q{num}_ENGINEER'] = q_data.get('engineer', '')
-                    
-                    # Add installation and warranty fields for PPM
-                    flat_entry['INSTALLATION_DATE'] = entry.get('installation_date', '')
-                    flat_entry['WARRANTY_END'] = entry.get('end_of_warranty', '')
-                elif data_type == 'ocm':
-                    flat_entry['OCM'] = entry.get('OCM', '')
-                    flat_entry['Last_Date'] = entry.get('Last_Date', '')
-                    flat_entry['ENGINEER'] = entry.get('ENGINEER', '')
-                    flat_entry['Next_Date'] = entry.get('Next_Date', '')
-                    
-                    # Add installation and warranty fields for OCM
-                    flat_entry['INSTALLATION_DATE'] = entry.get('installation_date', '')
-                    flat_entry['WARRANTY_END'] = entry.get('end_of_warranty', '')
-
-                flat_data.append(flat_entry)
+                flat_entry['PPM'] = entry.get('PPM', '')
+
+                for roman, num, q_key in [('I', 1, 'PPM_Q_I'), ('II', 2, 'PPM_Q_II'), ('III', 3, 'PPM_Q_III'), ('IV', 4, 'PPM_Q_IV')]:
+                    q_data = entry.get(q_key, {})
+                    flat_entry[f'PPM Q {roman}'] = q_data.get('date', '')
+                    flat_entry[f'Q{num}_ENGINEER'] = q_data.get('engineer', '')
+            else:
+                flat_entry['OCM'] = entry.get('OCM', '')
+                flat_entry['Last_Date'] = entry.get('Last_Date', '')
+                flat_entry['ENGINEER'] = entry.get('ENGINEER', '')
+                flat_entry['Next_Date'] = entry.get('Next_Date', '')
+
+            # Add installation and warranty fields
+            flat_entry['INSTALLATION_DATE'] = entry.get('installation_date', '')
+            flat_entry['WARRANTY_END'] = entry.get('end_of_warranty', '')
+            flat_entry['STATUS_OVERRIDE'] = entry.get('status_override') or ''
+
+            yield flat_entry
+
+    @staticmethod
+    def export_data(data_type: str) -> str:
+        """
+        Export data of the specified type to CSV format.
+
+        Args:
+            data_type: The type of data to export ('ppm', 'ocm', or 'training').
+
+        Returns:
+            The CSV content as a string.
+
+        Raises:
+            ValueError: If the data type is not supported.
+        """
+        if data_type not in ['ppm', 'ocm', 'training']:
+            raise ValueError("Unsupported data type for export.")
 
         # Generate CSV content using csv library
         with io.StringIO() as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=columns_order)
+            writer = csv.DictWriter(csvfile, fieldnames=DataService.get_export_columns(data_type))
             writer.writeheader()
-            writer.writerows(flat_data)
+            writer.writerows(DataService.iter_export_rows(data_type))
             return csvfile.getvalue()
 
+    @staticmethod
+    def export_data_xlsx(data_type: str, output_path: str) -> int:
+        """
+        Export data of the specified type to an Excel workbook.
+
+        Rows are streamed from iter_export_rows() into XlsxWriter's constant_memory
+        mode, so the workbook is never held in memory as a whole.
+
+        Args:
+            data_type: The type of data to export ('ppm', 'ocm', or 'training').
+            output_path: Path of the .xlsx file to write.
+
+        Returns:
+            The number of rows written.
+
+        Raises:
+            ValueError: If the data type is not supported.
+        """
+        if data_type not in ['ppm', 'ocm', 'training']:
+            raise ValueError("Unsupported data type for export.")
+
+        return write_xlsx(output_path, DataService.get_export_columns(data_type),
+                          DataService.iter_export_rows(data_type), sheet_name=data_type.upper())
+
     @staticmethod
     def load_training_data() -> List[Dict[str, Any]]:
         """
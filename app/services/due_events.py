@@ -0,0 +1,139 @@
+"""
+Stream of dated maintenance events across all equipment datasets.
+
+PPM quarter dates, OCM next service dates and warranty expiries of PPM and OCM
+equipment are collected into one list sorted by due date. The list is built once
+per version of the data files and then queried by date range with a binary search,
+so the reminder pipeline never rescans the datasets for each event type.
+"""
+import bisect
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.data_service import DataService
+
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+PPM_EVENT = 'ppm'
+OCM_EVENT = 'ocm'
+WARRANTY_EVENT = 'warranty'
+EVENT_KINDS = (PPM_EVENT, OCM_EVENT, WARRANTY_EVENT)
+
+# Labels shown in the task column of reminders; PPM events use the quarter
+OCM_LABEL = 'OCM Service'
+WARRANTY_LABEL = 'Warranty Expiry'
+
+# (equipment, mfg_serial, task, department, date, engineer), the reminder tuple format
+Event = Tuple[str, str, str, str, str, str]
+
+
+def parse_due_date(value: Any) -> Optional[date]:
+    """Parse a DD/MM/YYYY date, returning None for empty, 'n/a' or invalid values."""
+    if not value or not isinstance(value, str) or value.strip().lower() == 'n/a':
+        return None
+    try:
+        return datetime.strptime(value.strip(), '%d/%m/%Y').date()
+    except ValueError:
+        return None
+
+
+class DueEventService:
+    """Service for querying dated maintenance events by date range."""
+
+    # (data version, due date ordinals, kinds, events), all sorted by due date
+    _index: Optional[Tuple[str, List[int], List[str], List[Event]]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_data_version() -> str:
+        """Get a version token covering every dataset the events are built from."""
+        return f"{DataService.get_dataset_key('ppm')}|{DataService.get_dataset_key('ocm')}"
+
+    @staticmethod
+    def build_events(ppm_data: Iterable[Dict[str, Any]],
+                     ocm_data: Iterable[Dict[str, Any]]) -> List[Tuple[date, str, Event]]:
+        """Collect the dated events of the PPM and OCM datasets.
+
+        Args:
+            ppm_data: PPM entries
+            ocm_data: OCM entries
+
+        Returns:
+            List of (due date, kind, event), sorted by due date
+        """
+        events = []
+
+        def add(due: Optional[date], kind: str, entry: Dict[str, Any], label: str, engineer: Any):
+            if due is not None:
+                events.append((due, kind, (
+                    entry.get('EQUIPMENT', ''),
+                    entry.get('MFG_SERIAL', ''),
+                    label,
+                    entry.get('DEPARTMENT') or 'N/A',
+                    due.strftime('%d/%m/%Y'),
+                    engineer or 'N/A'
+                )))
+
+        for entry in ppm_data:
+            if str(entry.get('PPM', '')).lower() == 'yes':
+                for q in ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']:
+                    q_data = entry.get(q) or {}
+                    add(parse_due_date(q_data.get('date')), PPM_EVENT, entry,
+                        q.replace('PPM_Q_', 'Quarter '), q_data.get('engineer'))
+            add(parse_due_date(entry.get('end_of_warranty')), WARRANTY_EVENT, entry, WARRANTY_LABEL, None)
+
+        for entry in ocm_data:
+            if str(entry.get('OCM', '')).lower() == 'yes':
+                add(parse_due_date(entry.get('Next_Date')), OCM_EVENT, entry, OCM_LABEL, entry.get('ENGINEER'))
+            add(parse_due_date(entry.get('end_of_warranty')), WARRANTY_EVENT, entry, WARRANTY_LABEL, None)
+
+        events.sort(key=lambda event: event[0])
+        return events
+
+    @staticmethod
+    def get_index() -> Tuple[str, List[int], List[str], List[Event]]:
+        """Get the event index as (data version, due date ordinals, kinds, events), rebuilding it if a dataset changed."""
+        version = DueEventService.get_data_version()
+        index = DueEventService._index
+        if index is not None and index[0] == version:
+            return index
+
+        with DueEventService._lock:
+            index = DueEventService._index
+            if index is not None and index[0] == version:
+                return index
+
+            events = DueEventService.build_events(DataService.load_data('ppm'), DataService.load_data('ocm'))
+            index = (
+                version,
+                [due.toordinal() for due, _, _ in events],
+                [kind for _, kind, _ in events],
+                [event for _, _, event in events]
+            )
+            DueEventService._index = index
+            logger.info(f"Built due event index with {len(events)} events")
+            return index
+
+    @staticmethod
+    def get_due_events(start: date, end: date, kinds: Iterable[str] = None) -> List[Event]:
+        """Get the events due within a date range.
+
+        Args:
+            start: First due date included
+            end: Last due date included
+            kinds: Event kinds to include (default: all of EVENT_KINDS)
+
+        Returns:
+            Events as (equipment, mfg_serial, task, department, date, engineer), in due-date order
+        """
+        _, ordinals, event_kinds, events = DueEventService.get_index()
+        lo = bisect.bisect_left(ordinals, start.toordinal())
+        hi = bisect.bisect_right(ordinals, end.toordinal())
+        if kinds is None:
+            return events[lo:hi]
+        kinds = set(kinds)
+        return [events[i] for i in range(lo, hi) if event_kinds[i] in kinds]
@@ -2,28 +2,62 @@
 Email service for sending maintenance reminders.
 """
 import asyncio
+import hashlib
+import json
 import logging
-import smtplib
-from datetime import datetime
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
 from email.message import EmailMessage
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from app.config import Config
+from app.services.mail_transport import MailTransport
+from app.services.outbox import EmailOutbox
+from app.services.reminder_ledger import ReminderLedger
+from app.utils.cron import CronSchedule
 
 
 logger = logging.getLogger(__name__)
 
+# Seconds between checks for a stop request while the scheduler sleeps
+SCHEDULER_POLL_SECONDS = 60
+
+# Seconds before a failed scheduled reminder run is retried
+SCHEDULER_RETRY_SECONDS = 300
+
+# Number of rendered reminder bodies kept in memory
+RENDER_CACHE_SIZE = 128
+
+# Email templates are compiled once, at import
+_template_env = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'email')),
+    autoescape=select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+_reminder_template = _template_env.get_template('reminder.html')
+
+# Rendered reminder bodies keyed by (task list hash, recipient), least recently used first
+_render_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_render_cache_lock = threading.Lock()
+
 
 class EmailService:
     """Service for sending email notifications."""
 
     @staticmethod
-    async def get_upcoming_maintenance(data: List[Dict[str, Any]], days_ahead: int = None) -> List[Tuple[str, str, str, str, str, str]]:
+    async def get_upcoming_maintenance(data: List[Dict[str, Any]], days_ahead: int = None,
+                                       today: date = None) -> List[Tuple[str, str, str, str, str, str]]:
         """Get upcoming maintenance within specified days.
 
         Args:
             data: List of PPM entries
             days_ahead: Days ahead to check (default: from config)
+            today: Date to count the days from (default: today)
 
         Returns:
             List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
@@ -31,7 +65,7 @@ class EmailService:
         if days_ahead is None:
             days_ahead = Config.REMINDER_DAYS
 
-        now = datetime.now()
+        today = today or date.today()
         upcoming = []
 
         for entry in data:
@@ -45,7 +79,8 @@ class EmailService:
 
                 try:
                     due_date = datetime.strptime(q_data['date'], '%d/%m/%Y')
-                    days_until = (due_date - now).days
+                    # Whole calendar days, so tasks due today are still included
+                    days_until = (due_date.date() - today).days
 
                     if 0 <= days_until <= days_ahead:
                         # Include the department field
@@ -64,6 +99,90 @@ class EmailService:
         upcoming.sort(key=lambda x: datetime.strptime(x[4], '%d/%m/%Y'))  # Updated index for date
         return upcoming
 
+    @staticmethod
+    def get_upcoming_reminders(days_ahead: int = None, today: date = None) -> List[Tuple[str, str, str, str, str, str]]:
+        """Get every dated event to remind on within specified days.
+
+        Covers PPM quarters, OCM next service dates and warranty expiries, from the
+        due event index of the current datasets.
+
+        Args:
+            days_ahead: Days ahead to check (default: from config)
+            today: Date to count the days from (default: today)
+
+        Returns:
+            List of upcoming events as (equipment, mfg_serial, task, department, date, engineer)
+        """
+        from app.services.due_events import DueEventService
+
+        if days_ahead is None:
+            days_ahead = Config.REMINDER_DAYS
+        today = today or date.today()
+        return DueEventService.get_due_events(today, today + timedelta(days=days_ahead))
+
+    @staticmethod
+    def render_reminder_html(upcoming: List[Tuple[str, str, str, str, str, str]], recipient: str = '') -> str:
+        """Render the HTML body of a reminder email.
+
+        The template is compiled once; rendered bodies are cached by the content of
+        the task list and the recipient, so the same digest is only rendered once
+        (e.g. a test notification preview followed by the send).
+
+        Args:
+            upcoming: List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
+            recipient: Address the digest is rendered for (optional)
+
+        Returns:
+            The HTML content
+        """
+        digest = hashlib.sha256(json.dumps([Config.REMINDER_DAYS, upcoming], default=str).encode('utf-8')).hexdigest()
+        key = (digest, recipient.lower())
+
+        with _render_cache_lock:
+            if key in _render_cache:
+                _render_cache.move_to_end(key)
+                return _render_cache[key]
+
+        html_content = _reminder_template.render(upcoming=upcoming, recipient=recipient,
+                                                 reminder_days=Config.REMINDER_DAYS)
+
+        with _render_cache_lock:
+            _render_cache[key] = html_content
+            while len(_render_cache) > RENDER_CACHE_SIZE:
+                _render_cache.popitem(last=False)
+        return html_content
+
+    @staticmethod
+    def get_cc_recipients() -> List[str]:
+        """Get the configured CC recipients of the full reminder digest."""
+        return [cc for cc in (Config.CC_EMAIL_1, Config.CC_EMAIL_2, Config.CC_EMAIL_3) if cc and cc.strip()]
+
+    @staticmethod
+    def build_reminder_message(upcoming: List[Tuple[str, str, str, str, str, str]], to: str,
+                               cc: List[str] = None) -> EmailMessage:
+        """Build a reminder email for a list of upcoming maintenance tasks.
+
+        Args:
+            upcoming: List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
+            to: Recipient address
+            cc: CC recipient addresses (optional)
+
+        Returns:
+            The email message
+        """
+        msg = EmailMessage()
+
+        # Set up email
+        msg.set_content("Please view this email with an HTML-compatible email client.")
+        msg.add_alternative(EmailService.render_reminder_html(upcoming, to), subtype='html')
+
+        msg['Subject'] = f"Hospital Equipment Maintenance Reminder - {len(upcoming)} upcoming tasks"
+        msg['From'] = Config.EMAIL_SENDER
+        msg['To'] = to
+        if cc:
+            msg['Cc'] = ', '.join(cc)
+        return msg
+
     @staticmethod
     async def send_reminder_email(upcoming: List[Tuple[str, str, str, str, str, str]]) -> bool:
         """Send reminder email for upcoming maintenance.
@@ -84,91 +203,22 @@ class EmailService:
             reload_config()
             logger.info("Configuration reloaded before sending email")
 
-            msg = EmailMessage()
-
-            # Email content
-            subject = f"Hospital Equipment Maintenance Reminder - {len(upcoming)} upcoming tasks"
-
-            # Create HTML content
-            html_content = f"""
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; }}
-                    table {{ border-collapse: collapse; width: 100%; }}
-                    th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                    th {{ background-color: #f2f2f2; }}
-                    tr:nth-child(even) {{ background-color: #f9f9f9; }}
-                    .header {{ background-color: #4CAF50; color: white; padding: 10px; }}
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <h2>Upcoming Equipment Maintenance</h2>
-                    <p>The following equipment requires maintenance in the next {Config.REMINDER_DAYS} days:</p>
-                </div>
-                <table>
-                    <tr>
-                        <th>Equipment</th>
-                        <th>Serial Number</th>
-                        <th>Quarter</th>
-                        <th>Department</th>
-                        <th>Due Date</th>
-                        <th>Engineer</th>
-                    </tr>
-            """
-
-            for equipment, serial, quarter, department, date, engineer in upcoming:
-                html_content += f"""
-                    <tr>
-                        <td>{equipment}</td>
-                        <td>{serial}</td>
-                        <td>{quarter}</td>
-                        <td>{department}</td>
-                        <td>{date}</td>
-                        <td>{engineer}</td>
-                    </tr>
-                """
-
-            html_content += """
-                </table>
-                <p>Please ensure these maintenance tasks are completed on time.</p>
-                <p>This is an automated reminder from the Hospital Equipment Maintenance System.</p>
-            </body>
-            </html>
-            """
-
-            # Set up email
-            msg.set_content("Please view this email with an HTML-compatible email client.")
-            msg.add_alternative(html_content, subtype='html')
-
-            msg['Subject'] = subject
-            msg['From'] = Config.EMAIL_SENDER
-            msg['To'] = Config.EMAIL_RECEIVER
-
             # Add CC recipients if configured
-            cc_recipients = []
-            if Config.CC_EMAIL_1 and Config.CC_EMAIL_1.strip():
-                cc_recipients.append(Config.CC_EMAIL_1)
-            if Config.CC_EMAIL_2 and Config.CC_EMAIL_2.strip():
-                cc_recipients.append(Config.CC_EMAIL_2)
-            if Config.CC_EMAIL_3 and Config.CC_EMAIL_3.strip():
-                cc_recipients.append(Config.CC_EMAIL_3)
-
+            cc_recipients = EmailService.get_cc_recipients()
             if cc_recipients:
-                msg['Cc'] = ', '.join(cc_recipients)
                 logger.info(f"Adding CC recipients: {cc_recipients}")
 
+            msg = EmailService.build_reminder_message(upcoming, Config.EMAIL_RECEIVER, cc_recipients)
+
             # Log email settings being used (without password)
             logger.info(f"Sending email using: SMTP_SERVER={Config.SMTP_SERVER}, SMTP_PORT={Config.SMTP_PORT}, " +
                        f"SMTP_USERNAME={Config.SMTP_USERNAME}, EMAIL_SENDER={Config.EMAIL_SENDER}, " +
                        f"EMAIL_RECEIVER={Config.EMAIL_RECEIVER}")
 
-            # Send email
-            with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT) as server:
-                server.starttls()
-                server.login(Config.SMTP_USERNAME, Config.SMTP_PASSWORD)
-                server.send_message(msg)
+            # Send email over a pooled connection, off the event loop
+            error = (await MailTransport.send([msg]))[0]
+            if error is not None:
+                raise error
 
             logger.info(f"Reminder email sent for {len(upcoming)} upcoming maintenance tasks to {Config.EMAIL_RECEIVER}")
             return True
@@ -178,9 +228,184 @@ class EmailService:
             return False
 
     @staticmethod
-    async def process_reminders():
-        """Process and send reminders for upcoming maintenance."""
-        from app.services.data_service import DataService
+    def load_reminder_recipients() -> Dict[str, Dict[str, List[str]]]:
+        """Load the department and engineer reminder recipients.
+
+        Returns:
+            {'departments': {department: [emails]}, 'engineers': {engineer: [emails]}}
+        """
+        recipients = {'departments': {}, 'engineers': {}}
+        try:
+            with open(Config.REMINDER_RECIPIENTS_PATH, 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return recipients
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding reminder recipients: {str(e)}")
+            return recipients
+
+        for section in recipients:
+            for name, emails in (stored.get(section) or {}).items():
+                if isinstance(emails, str):
+                    emails = [emails]
+                emails = [email.strip() for email in emails if email and email.strip()]
+                if emails:
+                    recipients[section][name.strip().lower()] = emails
+        return recipients
+
+    @staticmethod
+    def save_reminder_recipients(recipients: Dict[str, Dict[str, Any]]):
+        """Save the department and engineer reminder recipients.
+
+        Args:
+            recipients: {'departments': {department: [emails]}, 'engineers': {engineer: [emails]}}
+        """
+        os.makedirs(os.path.dirname(Config.REMINDER_RECIPIENTS_PATH) or '.', exist_ok=True)
+        with open(Config.REMINDER_RECIPIENTS_PATH, 'w') as f:
+            json.dump({section: recipients.get(section) or {} for section in ('departments', 'engineers')}, f, indent=2)
+
+    @staticmethod
+    def partition_by_recipient(upcoming: List[Tuple[str, str, str, str, str, str]],
+                               recipients: Dict[str, Dict[str, List[str]]]) -> Dict[str, List[Tuple[str, str, str, str, str, str]]]:
+        """Partition upcoming tasks into one digest per recipient address.
+
+        Tasks are indexed by department and engineer once, then each mapped recipient
+        gets the tasks of their departments and of the engineers they cover. A task
+        appears at most once per recipient, in due-date order.
+
+        Args:
+            upcoming: List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
+            recipients: Mapping from load_reminder_recipients()
+
+        Returns:
+            Mapping of email address to that recipient's tasks
+        """
+        by_department = defaultdict(list)
+        by_engineer = defaultdict(list)
+        for position, task in enumerate(upcoming):
+            by_department[str(task[3]).strip().lower()].append(position)
+            by_engineer[str(task[5]).strip().lower()].append(position)
+
+        positions_by_recipient = defaultdict(set)
+        for section, index in (('departments', by_department), ('engineers', by_engineer)):
+            for name, emails in recipients.get(section, {}).items():
+                positions = index.get(name)
+                if not positions:
+                    continue
+                for email in emails:
+                    positions_by_recipient[email.lower()].update(positions)
+
+        return {email: [upcoming[position] for position in sorted(positions)]
+                for email, positions in positions_by_recipient.items()}
+
+    @staticmethod
+    def build_digests(upcoming: List[Tuple[str, str, str, str, str, str]]) -> Dict[str, List[Tuple[str, str, str, str, str, str]]]:
+        """Get the tasks of every reminder digest, keyed by recipient address.
+
+        The full list goes to EMAIL_RECEIVER; every recipient mapped in the reminder
+        recipients file gets only their own tasks.
+
+        Args:
+            upcoming: List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
+
+        Returns:
+            Mapping of recipient address to that recipient's tasks
+        """
+        digests = {}
+        if Config.EMAIL_RECEIVER:
+            digests[Config.EMAIL_RECEIVER] = list(upcoming)
+
+        partitions = EmailService.partition_by_recipient(upcoming, EmailService.load_reminder_recipients())
+        for email, tasks in partitions.items():
+            if email not in digests:
+                digests[email] = tasks
+        return digests
+
+    @staticmethod
+    async def send_reminder_digests(upcoming: List[Tuple[str, str, str, str, str, str]],
+                                    use_ledger: bool = False, today: date = None) -> Dict[str, bool]:
+        """Send the full reminder digest plus one digest per department/engineer recipient.
+
+        The full list goes to EMAIL_RECEIVER and the CCs. Every recipient mapped in the
+        reminder recipients file gets only their own tasks. All digests are queued in
+        the email outbox and delivered concurrently, at most EMAIL_MAX_CONCURRENCY at a
+        time; failed deliveries are retried by the outbox worker.
+
+        Args:
+            upcoming: List of upcoming maintenance as (equipment, mfg_serial, quarter, department, date, engineer)
+            use_ledger: Skip tasks each recipient was already reminded of at their current
+                escalation stage, and record the tasks sent
+            today: Date the escalation stages are computed for (default: today)
+
+        Returns:
+            Mapping of recipient address to whether their digest was sent right away
+        """
+        if not upcoming:
+            logger.info("No upcoming maintenance to send reminders for")
+            return {}
+
+        from app.utils.config_reloader import reload_config
+        reload_config()
+
+        today = today or date.today()
+        digests = EmailService.build_digests(upcoming)
+        if use_ledger:
+            digests = ReminderLedger.filter_unsent(digests, today)
+            if not digests:
+                logger.info(f"All {len(upcoming)} upcoming tasks were already reminded at their current stage")
+                return {}
+
+        cc_recipients = EmailService.get_cc_recipients()
+        messages = [(email, EmailService.build_reminder_message(
+                        tasks, email, cc_recipients if email == Config.EMAIL_RECEIVER else None))
+                    for email, tasks in digests.items()]
+
+        # Persist the digests first so an SMTP outage only delays them
+        ids = EmailOutbox.enqueue(messages)
+        if use_ledger:
+            # Queued digests are delivered by the outbox eventually, so they count as sent;
+            # the ones that fail permanently are released on the next run
+            ReminderLedger.record_sent(digests, today, dict(zip(digests, ids)))
+        delivered = await EmailOutbox.drain(ids)
+
+        sent = {email: delivered.get(message_id, False) for (email, _), message_id in zip(messages, ids)}
+        logger.info(f"Sent {sum(sent.values())} of {len(sent)} reminder digests for {len(upcoming)} upcoming tasks; "
+                    f"the rest stay queued for retry")
+        return sent
+
+    @staticmethod
+    def get_reminder_version() -> str:
+        """Get a version of everything that decides which reminders are sent.
+
+        Combines the equipment data version, the recipients file and the reminder
+        settings, so a change to any of them forces a full scan on the next run.
+        """
+        from app.services.due_events import DueEventService
+
+        try:
+            stat = os.stat(Config.REMINDER_RECIPIENTS_PATH)
+            recipients_version = f"{stat.st_mtime_ns}:{stat.st_size}"
+        except FileNotFoundError:
+            recipients_version = 'missing'
+        escalation_days = ','.join(str(days) for days in Config.REMINDER_ESCALATION_DAYS)
+        return (f"{DueEventService.get_data_version()}|{recipients_version}|{Config.REMINDER_DAYS}|"
+                f"{escalation_days}|{Config.EMAIL_RECEIVER}")
+
+    @staticmethod
+    async def process_reminders(today: date = None) -> bool:
+        """Process and send reminders for upcoming maintenance.
+
+        Each task is reminded once per escalation point (REMINDER_ESCALATION_DAYS). When
+        the equipment data, the recipients and the reminder settings did not change since the
+        last run, only the tasks that crossed an escalation point since then are considered.
+        Reminders whose message failed permanently are released and sent again.
+
+        Args:
+            today: Date the reminders are processed for (default: today)
+
+        Returns:
+            True if the reminders were processed, False if an error occurred
+        """
         from app.utils.config_reloader import reload_config
 
         try:
@@ -188,26 +413,98 @@ class EmailService:
             reload_config()
             logger.info("Configuration reloaded before processing reminders")
 
-            # Load PPM data
-            ppm_data = DataService.load_data('ppm')
+            today = today or date.today()
+            run_version = EmailService.get_reminder_version()
+
+            # Release reminders whose digest could not be delivered
+            released = ReminderLedger.forget_messages(EmailOutbox.get_failed_ids(ReminderLedger.get_message_ids()))
+            if released:
+                logger.warning(f"Released {released} reminders whose email failed permanently")
+
+            # Get upcoming PPM, OCM and warranty events
+            upcoming = EmailService.get_upcoming_reminders(today=today)
 
-            # Get upcoming maintenance
-            upcoming = await EmailService.get_upcoming_maintenance(ppm_data)
+            last_run = ReminderLedger.get_last_run()
+            if not released and last_run and last_run[1] == run_version and last_run[0] <= today:
+                upcoming = ReminderLedger.crossed_since(upcoming, last_run[0], today)
+                logger.info(f"Reminder inputs unchanged since {last_run[0]}: {len(upcoming)} tasks crossed an escalation point")
 
-            # Send reminder if there are upcoming maintenance tasks
+            # Send reminder digests if there are upcoming maintenance tasks
             if upcoming:
-                await EmailService.send_reminder_email(upcoming)
+                await EmailService.send_reminder_digests(upcoming, use_ledger=True, today=today)
             else:
                 logger.info("No upcoming maintenance tasks found")
 
+            ReminderLedger.set_last_run(today, run_version)
+            return True
+
         except Exception as e:
             logger.error(f"Error processing reminders: {str(e)}")
+            return False
+
+    @staticmethod
+    def load_last_scheduled_run() -> Optional[datetime]:
+        """Get the time of the last successful scheduled reminder run, if any."""
+        try:
+            with open(Config.SCHEDULER_STATE_PATH, 'r') as f:
+                return datetime.fromisoformat(json.load(f)['last_run'])
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error reading scheduler state: {str(e)}")
+            return None
+
+    @staticmethod
+    def save_last_scheduled_run(last_run: datetime):
+        """Persist the time of a successful scheduled reminder run."""
+        os.makedirs(os.path.dirname(Config.SCHEDULER_STATE_PATH) or '.', exist_ok=True)
+        temp_path = f"{Config.SCHEDULER_STATE_PATH}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'last_run': last_run.isoformat(timespec='seconds')}, f)
+        os.replace(temp_path, Config.SCHEDULER_STATE_PATH)
 
     @staticmethod
-    async def run_scheduler():
-        """Run scheduler for periodic reminder sending."""
+    def get_next_run(last_run: Optional[datetime], now: datetime) -> datetime:
+        """Get the time the next scheduled reminder run is due.
+
+        Uses the SCHEDULER_CRON expression, or SCHEDULER_INTERVAL hours after the last
+        run if no (valid) expression is configured. A time at or before now means runs
+        were missed and one should happen right away.
+
+        Args:
+            last_run: Time of the last successful run, or None if reminders never ran
+            now: Current time
+
+        Returns:
+            The time the next run is due
+        """
+        if last_run is None:
+            return now
+
+        if Config.SCHEDULER_CRON:
+            try:
+                return CronSchedule(Config.SCHEDULER_CRON).next_after(last_run)
+            except ValueError as e:
+                logger.error(f"Invalid SCHEDULER_CRON, using SCHEDULER_INTERVAL: {str(e)}")
+        return last_run + timedelta(hours=Config.SCHEDULER_INTERVAL)
+
+    @staticmethod
+    async def run_scheduler(should_continue: Callable[[], bool] = None):
+        """Run scheduler for periodic reminder sending.
+
+        The time of the last successful run is persisted, so restarts do not reset the
+        schedule. Runs missed while no worker was up are caught up with a single run
+        on startup; the ledger takes care of anything that became due in between.
+
+        Args:
+            should_continue: Checked before each run and while sleeping; the scheduler
+                returns as soon as it is False (e.g. when the scheduler is stopped)
+        """
         from app.utils.config_reloader import reload_config
 
+        if should_continue is None:
+            should_continue = lambda: True
+
         # Reload configuration to get the latest settings
         reload_config()
 
@@ -215,11 +512,34 @@ class EmailService:
             logger.info("Reminder scheduler is disabled")
             return
 
-        logger.info(f"Starting reminder scheduler (interval: {Config.SCHEDULER_INTERVAL} hours)")
+        logger.info(f"Starting reminder scheduler (schedule: {Config.SCHEDULER_CRON or f'every {Config.SCHEDULER_INTERVAL} hours'})")
 
-        while True:
-            await EmailService.process_reminders()
+        while should_continue():
+            last_run = EmailService.load_last_scheduled_run()
+            now = datetime.now()
+            next_run = EmailService.get_next_run(last_run, now)
 
-            # Reload configuration before sleeping to get the latest interval
+            if next_run <= now:
+                if last_run is not None and (now - next_run).total_seconds() > SCHEDULER_POLL_SECONDS:
+                    logger.info(f"Catching up the reminder run due at {next_run.isoformat(timespec='minutes')}")
+                if await EmailService.process_reminders():
+                    EmailService.save_last_scheduled_run(now)
+                    continue
+                # Retry a failed run later instead of spinning
+                next_run = now + timedelta(seconds=SCHEDULER_RETRY_SECONDS)
+
+            logger.info(f"Next reminder run at {next_run.isoformat(timespec='minutes')}")
+            # Sleep until the run is due, waking in slices only to honour a stop request
+            while should_continue():
+                remaining = (next_run - datetime.now()).total_seconds()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(SCHEDULER_POLL_SECONDS, remaining))
+
+            # Pick up schedule changes made while sleeping
             reload_config()
-            await asyncio.sleep(Config.SCHEDULER_INTERVAL * 3600)  # Convert hours to seconds
+            if not Config.SCHEDULER_ENABLED:
+                logger.info("Reminder scheduler is disabled")
+                break
+
+        logger.info("Reminder scheduler stopped")
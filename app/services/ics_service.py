@@ -0,0 +1,180 @@
+"""
+iCalendar (.ics) feeds of upcoming maintenance tasks.
+
+A feed lists the PPM quarter and OCM service events of one department or one
+engineer, taken from the due event index. Feeds are streamed event by event as
+they are generated; the finished body is cached under an ETag derived from the
+data version, the filter and the day, so calendar clients polling the same feed
+get a 304 or the cached body instead of a new rendering.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, List, Tuple
+
+from app.services.due_events import OCM_EVENT, PPM_EVENT, DueEventService, Event
+
+
+logger = logging.getLogger(__name__)
+
+FEED_FIELDS = ('department', 'engineer')
+
+# Events included in a feed, relative to the day it is generated
+FEED_PAST_DAYS = 30
+FEED_DAYS_AHEAD = 365
+
+FEED_CACHE_SIZE = 128
+
+PRODUCT_ID = '-//Hospital Equipment System//Maintenance Calendar//EN'
+UID_DOMAIN = 'hospital-equipment-system'
+
+
+def _escape(text: str) -> str:
+    """Escape a TEXT property value (RFC 5545, 3.3.11)."""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold_line(line: str) -> str:
+    """Fold a content line into CRLF-terminated lines of at most 75 octets."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Do not split a multi-byte character
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def render_event(event: Event, stamp: str) -> str:
+    """
+    Render a due event as a VEVENT.
+
+    Args:
+        event: (equipment, mfg_serial, task, department, date, engineer)
+        stamp: DTSTAMP value (UTC date-time)
+
+    Returns:
+        str: The VEVENT lines
+    """
+    equipment, serial, task, department, due, engineer = event
+    due_date = datetime.strptime(due, '%d/%m/%Y').date()
+    uid = re.sub(r'[^A-Za-z0-9._-]+', '-', f"{serial}-{task}-{due_date:%Y%m%d}")
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{uid}@{UID_DOMAIN}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{due_date:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{due_date + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_escape(f'{task}: {equipment or serial} ({serial})')}",
+        f"DESCRIPTION:{_escape(f'Department: {department}, Engineer: {engineer}')}",
+        f"LOCATION:{_escape(department)}",
+        'TRANSP:TRANSPARENT',
+        'END:VEVENT',
+    ]
+    return ''.join(_fold_line(line) for line in lines)
+
+
+def _fold_value(value: str) -> str:
+    return ' '.join(str(value).casefold().split())
+
+
+class IcsFeedService:
+    """Service generating subscribable .ics feeds per department or engineer."""
+
+    # Rendered feed bodies keyed by ETag, least recently used first
+    _cache: 'OrderedDict[str, str]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_etag(field: str, value: str, today: date = None) -> str:
+        """
+        Get the ETag of a feed.
+
+        Args:
+            field: 'department' or 'engineer'
+            value: Department or engineer name (case- and whitespace-insensitive)
+            today: Day the feed is generated for (default: today)
+
+        Returns:
+            str: ETag of (data version, filter, day)
+
+        Raises:
+            ValueError: If the field is invalid
+        """
+        if field not in FEED_FIELDS:
+            raise ValueError(f"Invalid feed. Must be one of: {', '.join(FEED_FIELDS)}")
+        today = today or date.today()
+        key = f"{DueEventService.get_data_version()}|{field}|{_fold_value(value)}|{today.isoformat()}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _generate(field: str, value: str, today: date) -> Iterator[str]:
+        """Yield the feed in chunks: the header, one chunk per event and the footer."""
+        start = today - timedelta(days=FEED_PAST_DAYS)
+        end = today + timedelta(days=FEED_DAYS_AHEAD)
+        wanted = _fold_value(value)
+        position = 3 if field == 'department' else 5
+        stamp = f"{today:%Y%m%d}T000000Z"
+
+        yield ''.join(_fold_line(line) for line in [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            f"PRODID:{PRODUCT_ID}",
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            f"X-WR-CALNAME:{_escape(f'Maintenance - {value}')}",
+            'REFRESH-INTERVAL;VALUE=DURATION:PT15M',
+        ])
+        for event in DueEventService.get_due_events(start, end, kinds=[PPM_EVENT, OCM_EVENT]):
+            if _fold_value(event[position]) == wanted:
+                yield render_event(event, stamp)
+        yield 'END:VCALENDAR\r\n'
+
+    @staticmethod
+    def get_feed(field: str, value: str, today: date = None) -> Tuple[str, Iterable[str]]:
+        """
+        Get a feed as its ETag and body chunks.
+
+        A cached body is returned whole; otherwise the chunks are generated as they
+        are consumed and the body is cached once the last chunk has been produced.
+
+        Args:
+            field: 'department' or 'engineer'
+            value: Department or engineer name (case- and whitespace-insensitive)
+            today: Day the feed is generated for (default: today)
+
+        Returns:
+            tuple: (ETag, iterable of body chunks)
+
+        Raises:
+            ValueError: If the field is invalid
+        """
+        today = today or date.today()
+        etag = IcsFeedService.get_etag(field, value, today)
+        with IcsFeedService._lock:
+            body = IcsFeedService._cache.get(etag)
+            if body is not None:
+                IcsFeedService._cache.move_to_end(etag)
+                return etag, [body]
+
+        def stream() -> Iterator[str]:
+            chunks: List[str] = []
+            for chunk in IcsFeedService._generate(field, value, today):
+                chunks.append(chunk)
+                yield chunk
+            with IcsFeedService._lock:
+                IcsFeedService._cache[etag] = ''.join(chunks)
+                while len(IcsFeedService._cache) > FEED_CACHE_SIZE:
+                    IcsFeedService._cache.popitem(last=False)
+            logger.info(f"Generated {field} feed '{value}' ({len(chunks) - 2} events)")
+
+        return etag, stream()
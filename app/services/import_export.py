@@ -1,10 +1,13 @@
 """
 Service for importing and exporting data.
 """
+import csv
+import io
 import logging
 import os
+import zipfile
 from io import StringIO
-from typing import List, Dict, Any, Literal, Tuple
+from typing import List, Dict, Any, Literal, Tuple, Union, BinaryIO
 import json
 
 import pandas as pd
@@ -12,11 +15,20 @@ from pydantic import ValidationError
 
 from app.models.ppm import PPMEntry
 from app.models.ocm import OCMEntry
+from app.models.training import TrainingEntry
 from app.services.data_service import DataService
+from app.utils.env_writer import update_env_section
 
 
 logger = logging.getLogger(__name__)
 
+# Data type of each CSV member of a backup archive
+BACKUP_SECTIONS = {
+    'ppm': 'ppm_data.csv',
+    'ocm': 'ocm_data.csv',
+    'training': 'training_data.csv'
+}
+
 
 class ImportExportService:
     """Service for handling import and export operations."""
@@ -617,5 +629,103 @@ class ImportExportService:
             logger.error(f"Error importing {data_type} data: {str(e)}")
             return False, f"Error importing {data_type.upper()} data: {str(e)}", {}
 
+    @staticmethod
+    def _read_backup_section(zip_file: zipfile.ZipFile, member: str,
+                             data_type: Literal['ppm', 'ocm', 'training']) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Stream one CSV member of a backup archive and validate its rows."""
+        with zip_file.open(member) as raw:
+            reader = csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+            return DataService.validate_backup_rows(data_type, reader)
+
+    @staticmethod
+    def _validate_backup_records(data_type: Literal['ppm', 'ocm', 'training'],
+                                 records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Validate the stored entries of one section of a JSON backup."""
+        model = {'ppm': PPMEntry, 'ocm': OCMEntry, 'training': TrainingEntry}[data_type]
+        validated = []
+        errors = []
+        for index, record in enumerate(records, start=1):
+            try:
+                validated.append(model(**record).model_dump())
+            except (ValidationError, TypeError) as e:
+                errors.append(f"Entry {index}: {str(e)}")
+        return DataService.reindex(validated), errors
+
+    @staticmethod
+    def _commit_restore(results: Dict[str, Tuple[List[Dict[str, Any]], List[str]]],
+                        settings: Dict[str, str]) -> Tuple[bool, str, Dict[str, Any]]:
+        """Swap in all validated datasets, or none if any section failed validation."""
+
+        errors = [f"{data_type.upper()} {message}" for data_type, (_, section_errors) in results.items()
+                  for message in section_errors]
+        stats = {data_type: len(records) for data_type, (records, _) in results.items()}
+        stats['error_details'] = errors
+
+        if errors:
+            return False, f"Backup not restored: {len(errors)} invalid rows", stats
+
+        DataService.save_datasets({data_type: records for data_type, (records, _) in results.items()})
+
+        if settings:
+            update_env_section('# Email Configuration', settings)
+        stats['settings'] = len(settings)
+
+        return True, "Backup restored successfully", stats
+
+    @staticmethod
+    def restore_from_zip(source: Union[str, BinaryIO]) -> Tuple[bool, str, Dict[str, Any]]:
+        """Restore PPM, OCM and training data from a backup archive created by /api/backup.
+
+        Archive members are read as streams and validated one section at a time. All
+        datasets are then swapped in as one commit; if any section fails validation,
+        nothing is written.
+
+        Args:
+            source: Path or seekable binary stream of the ZIP file
+
+        Returns:
+            Tuple of (success, message, restore_stats)
+        """
+        with zipfile.ZipFile(source, 'r') as zip_file:
+            names = set(zip_file.namelist())
+            members = {data_type: member for data_type, member in BACKUP_SECTIONS.items() if member in names}
+            if not members:
+                return False, "The backup archive contains no PPM, OCM or training data", {}
+
+            settings = {}
+            if 'settings.csv' in names:
+                with zip_file.open('settings.csv') as raw:
+                    reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+                    next(reader, None)  # Skip header
+                    for row in reader:
+                        # Skip export date and empty values
+                        if len(row) >= 2 and row[0] not in ['EXPORT_DATE'] and row[1]:
+                            settings[row[0]] = row[1]
+
+            results = {data_type: ImportExportService._read_backup_section(zip_file, member, data_type)
+                       for data_type, member in members.items()}
+        return ImportExportService._commit_restore(results, settings)
+
+    @staticmethod
+    def restore_from_json(backup_data: Dict[str, Any]) -> Tuple[bool, str, Dict[str, Any]]:
+        """Restore PPM, OCM and training data from a JSON backup.
+
+        Sections are validated and then swapped in as one commit.
+
+        Args:
+            backup_data: Parsed JSON backup with 'ppm', 'ocm' and 'training' lists
+
+        Returns:
+            Tuple of (success, message, restore_stats)
+        """
+        sections = {data_type: backup_data[data_type] for data_type in BACKUP_SECTIONS
+                    if isinstance(backup_data.get(data_type), list)}
 
+        # Filter out sensitive or unnecessary fields
+        settings = {}
+        if isinstance(backup_data.get('settings'), dict):
+            settings = {k: v for k, v in backup_data['settings'].items() if k not in ['export_date'] and v}
 
+        results = {data_type: ImportExportService._validate_backup_records(data_type, records)
+                   for data_type, records in sections.items()}
+        return ImportExportService._commit_restore(results, settings)
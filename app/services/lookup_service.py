@@ -0,0 +1,139 @@
+"""
+Device lookup by scanned code.
+
+Every PPM and OCM device is reachable through a hash index keyed by its
+MFG_SERIAL and LOG_NO, both as stored and in a folded form (case-insensitive,
+whitespace removed), so a scanned label resolves with one or two dict lookups.
+The index is rebuilt when a data file's version changes; lookups never read the
+data files.
+"""
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.data_service import DataService
+
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_DATA_TYPES = ('ppm', 'ocm')
+
+# Fields a code is matched against, in order of precedence
+LOOKUP_FIELDS = ('MFG_SERIAL', 'LOG_NO')
+
+# (data type, field matched, record)
+Match = Tuple[str, str, Dict[str, Any]]
+
+
+def fold_code(code: str) -> str:
+    """Fold a code for matching, e.g. ' sn-0042 a' -> 'sn-0042a'."""
+    return ''.join(str(code).split()).casefold()
+
+
+class LookupService:
+    """Service resolving scanned serial numbers and log numbers to devices."""
+
+    # (dataset keys, exact index, folded index)
+    _index: Optional[Tuple[str, Dict[str, List[Match]], Dict[str, List[Match]]]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build_index(datasets: Dict[str, List[Dict[str, Any]]]) -> Tuple[Dict[str, List[Match]], Dict[str, List[Match]]]:
+        """
+        Build the exact and folded code indexes.
+
+        Args:
+            datasets: Records by data type
+
+        Returns:
+            tuple: (exact code -> matches, folded code -> matches); serial number
+            matches come before log number matches
+        """
+        exact: Dict[str, List[Match]] = {}
+        folded: Dict[str, List[Match]] = {}
+        for field in LOOKUP_FIELDS:
+            for data_type, records in datasets.items():
+                for record in records:
+                    value = str(record.get(field) or '').strip()
+                    if not value or value.lower() == 'n/a':
+                        continue
+                    match = (data_type, field, record)
+                    exact.setdefault(value, []).append(match)
+                    folded.setdefault(fold_code(value), []).append(match)
+        return exact, folded
+
+    @staticmethod
+    def _get_index() -> Tuple[Dict[str, List[Match]], Dict[str, List[Match]]]:
+        """Get the code indexes, rebuilding them if a data file changed."""
+        version = '|'.join(DataService.get_dataset_key(data_type) for data_type in LOOKUP_DATA_TYPES)
+        index = LookupService._index
+        if index is not None and index[0] == version:
+            return index[1], index[2]
+
+        with LookupService._lock:
+            index = LookupService._index
+            if index is None or index[0] != version:
+                datasets = {data_type: DataService.load_data(data_type) for data_type in LOOKUP_DATA_TYPES}
+                exact, folded = LookupService.build_index(datasets)
+                index = LookupService._index = (version, exact, folded)
+                logger.info(f"Built device lookup index with {len(exact)} codes")
+            return index[1], index[2]
+
+    @staticmethod
+    def lookup(code: str) -> List[Match]:
+        """
+        Find the devices with a serial number or log number matching a code.
+
+        An exact match is preferred; otherwise the code is matched case- and
+        whitespace-insensitively.
+
+        Args:
+            code: Scanned or typed code
+
+        Returns:
+            list: Matches as (data type, field matched, record), best first
+        """
+        exact, folded = LookupService._get_index()
+        code = str(code).strip()
+        return exact.get(code) or folded.get(fold_code(code)) or []
+
+    @staticmethod
+    def get_next_due(data_type: str, record: Dict[str, Any], today: date = None) -> Optional[Dict[str, Any]]:
+        """
+        Get the next maintenance of a device due today or later.
+
+        Args:
+            data_type: 'ppm' or 'ocm'
+            record: Device record
+            today: Date to look from (default: today)
+
+        Returns:
+            dict: Task ('Quarter I'... or 'OCM Service'), date and engineer, or None
+        """
+        today = today or date.today()
+        if data_type == 'ocm':
+            candidates = [('OCM Service', record.get('Next_Date'), record.get('ENGINEER'))]
+        else:
+            candidates = [(q.replace('PPM_Q_', 'Quarter '), (record.get(q) or {}).get('date'),
+                           (record.get(q) or {}).get('engineer'))
+                          for q in ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']]
+
+        next_due = None
+        for task, due, engineer in candidates:
+            try:
+                due_date = datetime.strptime(due, '%d/%m/%Y').date()
+            except (TypeError, ValueError):
+                continue
+            if due_date >= today and (next_due is None or due_date < next_due[1]):
+                next_due = (task, due_date, engineer)
+
+        if next_due is None:
+            return None
+        task, due_date, engineer = next_due
+        return {
+            'task': task,
+            'date': due_date.strftime('%d/%m/%Y'),
+            'days_until': (due_date - today).days,
+            'engineer': engineer or 'N/A'
+        }
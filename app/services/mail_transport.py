@@ -0,0 +1,225 @@
+"""
+Pooled SMTP transport for outgoing email.
+
+Authenticated SMTP connections are kept open and reused across sends. A connection
+that sat idle is checked with NOOP before reuse, and messages are sent in batches
+over a single connection. The blocking smtplib calls run in a thread pool executor
+so they never block the event loop.
+"""
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Errors after which a connection is discarded and the send retried on a new one
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError)
+
+
+class SMTPConnectionPool:
+    """Pool of reusable, authenticated SMTP connections to one server."""
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', use_tls: bool = True,
+                 max_size: int = 4, max_idle_seconds: int = 300, health_check_seconds: int = 30, timeout: int = 30):
+        """
+        Args:
+            host: SMTP server host
+            port: SMTP server port
+            username: Login user name; no login is attempted if empty
+            password: Login password
+            use_tls: Upgrade connections with STARTTLS
+            max_size: Maximum number of idle connections kept open
+            max_idle_seconds: Idle connections older than this are closed instead of reused
+            health_check_seconds: Idle connections older than this are checked with NOOP before reuse
+            timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_seconds = health_check_seconds
+        self.timeout = timeout
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new connection."""
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.ehlo()
+            if self.use_tls:
+                connection.starttls()
+                connection.ehlo()
+            if self.username:
+                connection.login(self.username, self.password)
+        except Exception:
+            self._close(connection)
+            raise
+        logger.debug(f"Opened SMTP connection to {self.host}:{self.port}")
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    @staticmethod
+    def is_healthy(connection: smtplib.SMTP) -> bool:
+        """Check a connection with NOOP."""
+        try:
+            return connection.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self) -> smtplib.SMTP:
+        """Get a healthy connection from the pool, or open a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, released_at = self._idle.pop()
+
+            idle_for = time.monotonic() - released_at
+            if idle_for > self.max_idle_seconds:
+                self._close(connection)
+            elif idle_for <= self.health_check_seconds or self.is_healthy(connection):
+                return connection
+            else:
+                logger.info("Discarding stale SMTP connection")
+                self._close(connection)
+
+        return self._connect()
+
+    def release(self, connection: smtplib.SMTP):
+        """Return a connection to the pool."""
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    def send_batch(self, messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """
+        Send messages over one pooled connection (blocking).
+
+        A dropped connection is replaced once and the remaining messages are sent on
+        the new connection.
+
+        Args:
+            messages: Messages to send
+
+        Returns:
+            One entry per message: None if it was sent, otherwise the exception raised
+        """
+        results: List[Optional[Exception]] = []
+        connection = None
+        reconnected = False
+        index = 0
+
+        try:
+            while index < len(messages):
+                if connection is None:
+                    connection = self.acquire()
+                try:
+                    connection.send_message(messages[index])
+                    results.append(None)
+                    index += 1
+                    continue
+                except CONNECTION_ERRORS as e:
+                    error = e
+                except smtplib.SMTPException as e:
+                    # Rejected message (e.g. bad recipient); the connection is still usable
+                    results.append(e)
+                    index += 1
+                    continue
+                except OSError as e:
+                    # Socket errors (SMTPException is an OSError, so this must come last)
+                    error = e
+
+                self._close(connection)
+                connection = None
+                if reconnected:
+                    # The server is unreachable; fail the rest of the batch
+                    results.extend([error] * (len(messages) - index))
+                    break
+                logger.warning(f"SMTP connection lost, reconnecting: {str(error)}")
+                reconnected = True
+        except Exception as e:
+            # Could not connect or authenticate at all
+            results.extend([e] * (len(messages) - len(results)))
+        finally:
+            if connection is not None:
+                self.release(connection)
+
+        return results
+
+
+class MailTransport:
+    """Service holding the SMTP connection pool for the current email settings."""
+
+    _pool: Optional[SMTPConnectionPool] = None
+    _pool_settings: Optional[tuple] = None
+    _executor = ThreadPoolExecutor(max_workers=max(Config.EMAIL_MAX_CONCURRENCY, 1), thread_name_prefix='smtp')
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_pool() -> SMTPConnectionPool:
+        """Get the pool for the current SMTP settings, replacing it if the settings changed."""
+        settings = (Config.SMTP_SERVER, Config.SMTP_PORT, Config.SMTP_USERNAME, Config.SMTP_PASSWORD,
+                    Config.SMTP_USE_TLS)
+        with MailTransport._lock:
+            if MailTransport._pool is None or MailTransport._pool_settings != settings:
+                if MailTransport._pool is not None:
+                    MailTransport._pool.close()
+                MailTransport._pool = SMTPConnectionPool(
+                    Config.SMTP_SERVER, Config.SMTP_PORT, Config.SMTP_USERNAME, Config.SMTP_PASSWORD,
+                    use_tls=Config.SMTP_USE_TLS, max_size=max(Config.EMAIL_MAX_CONCURRENCY, 1)
+                )
+                MailTransport._pool_settings = settings
+            return MailTransport._pool
+
+    @staticmethod
+    async def send(messages: List[EmailMessage]) -> List[Optional[Exception]]:
+        """
+        Send a batch of messages without blocking the event loop.
+
+        Args:
+            messages: Messages to send
+
+        Returns:
+            One entry per message: None if it was sent, otherwise the exception raised
+        """
+        if not messages:
+            return []
+        pool = MailTransport.get_pool()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(MailTransport._executor, pool.send_batch, messages)
+
+    @staticmethod
+    def close():
+        """Close all pooled connections."""
+        with MailTransport._lock:
+            if MailTransport._pool is not None:
+                MailTransport._pool.close()
+            MailTransport._pool = None
+            MailTransport._pool_settings = None
@@ -0,0 +1,282 @@
+"""
+Durable email outbox.
+
+Rendered messages are stored in a SQLite database before any delivery attempt, and
+a delivery worker drains the queue through the pooled SMTP transport. Failed
+deliveries are retried with exponential backoff and jitter, so an SMTP outage only
+delays reminders instead of losing them.
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import Config
+from app.services.mail_transport import MailTransport
+
+
+logger = logging.getLogger(__name__)
+
+# Retry schedule: BASE * 2^attempts seconds, capped, with +/-50% jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+MAX_ATTEMPTS = 10
+
+# Sent messages are kept this long for latency metrics
+SENT_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Longest sleep of the delivery worker between queue checks
+WORKER_POLL_SECONDS = 30
+
+# A claimed message not delivered within this time is assumed abandoned (e.g. its
+# process died mid-send) and is requeued when a delivery worker starts
+CLAIM_LEASE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+class EmailOutbox:
+    """Service for queueing email and delivering it with retries."""
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        """Open the outbox database, creating it if needed."""
+        os.makedirs(os.path.dirname(Config.EMAIL_OUTBOX_PATH) or '.', exist_ok=True)
+        connection = sqlite3.connect(Config.EMAIL_OUTBOX_PATH, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        return connection
+
+    @staticmethod
+    def retry_delay(attempts: int) -> float:
+        """Get the delay before the next delivery attempt.
+
+        Args:
+            attempts: Number of failed attempts so far
+
+        Returns:
+            Seconds to wait, with jitter so retries from many messages spread out
+        """
+        delay = min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.5)
+
+    @staticmethod
+    def enqueue(messages: List[Tuple[str, EmailMessage]]) -> List[int]:
+        """Store messages for delivery.
+
+        Args:
+            messages: List of (recipient, message)
+
+        Returns:
+            The outbox ids of the messages, in order
+        """
+        now = time.time()
+        ids = []
+        with closing(EmailOutbox._connect()) as connection, connection:
+            for recipient, msg in messages:
+                cursor = connection.execute(
+                    'INSERT INTO outbox (recipient, message, enqueued_at, next_attempt_at) VALUES (?, ?, ?, ?)',
+                    (recipient, msg.as_bytes(), now, now)
+                )
+                ids.append(cursor.lastrowid)
+        logger.info(f"Queued {len(ids)} emails in the outbox")
+        return ids
+
+    @staticmethod
+    def _claim_due_messages(ids: Optional[List[int]], limit: int) -> List[Tuple[int, str, bytes, int]]:
+        """Claim pending messages for delivery.
+
+        The claimed rows are switched to 'sending' with a lease in the same statement
+        that selects them, so concurrent drains (in this or another process) never
+        claim the same message.
+        """
+        now = time.time()
+        with closing(EmailOutbox._connect()) as connection, connection:
+            if ids is not None:
+                placeholders = ', '.join('?' for _ in ids)
+                candidates = (f"SELECT id FROM outbox WHERE status = 'pending' AND id IN ({placeholders}) "
+                              f"ORDER BY id LIMIT ?")
+                params = (*ids, limit)
+            else:
+                candidates = ("SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                              "ORDER BY next_attempt_at LIMIT ?")
+                params = (now, limit)
+            return connection.execute(
+                f"UPDATE outbox SET status = 'sending', next_attempt_at = ? "
+                f"WHERE status = 'pending' AND id IN ({candidates}) "
+                f"RETURNING id, recipient, message, attempts",
+                (now + CLAIM_LEASE_SECONDS, *params)
+            ).fetchall()
+
+    @staticmethod
+    def requeue_stale_claims() -> int:
+        """Return messages whose claim lease expired to the queue.
+
+        Returns:
+            Number of messages requeued
+        """
+        with closing(EmailOutbox._connect()) as connection, connection:
+            requeued = connection.execute(
+                "UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND next_attempt_at <= ?",
+                (time.time(),)
+            ).rowcount
+        if requeued:
+            logger.warning(f"Requeued {requeued} emails whose delivery was interrupted")
+        return requeued
+
+    @staticmethod
+    def _record_result(message_id: int, attempts: int, error: Optional[Exception]):
+        now = time.time()
+        with closing(EmailOutbox._connect()) as connection, connection:
+            if error is None:
+                connection.execute(
+                    "UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                    (attempts, now, message_id)
+                )
+            elif attempts >= MAX_ATTEMPTS:
+                connection.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, str(error), message_id)
+                )
+            else:
+                connection.execute(
+                    "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? "
+                    "WHERE id = ?",
+                    (attempts, now + EmailOutbox.retry_delay(attempts), str(error), message_id)
+                )
+
+    @staticmethod
+    async def drain(ids: Optional[List[int]] = None, limit: int = 100) -> Dict[int, bool]:
+        """Deliver due messages concurrently, at most EMAIL_MAX_CONCURRENCY at a time.
+
+        Messages are claimed before they are sent, so each one is delivered by only
+        one of several concurrent drains.
+
+        Args:
+            ids: Only deliver these messages, regardless of their retry schedule (optional)
+            limit: Maximum number of messages delivered in this call
+
+        Returns:
+            Mapping of outbox id to whether the message was delivered
+        """
+        due = EmailOutbox._claim_due_messages(ids, limit)
+        if not due:
+            return {}
+
+        semaphore = asyncio.Semaphore(max(Config.EMAIL_MAX_CONCURRENCY, 1))
+
+        async def deliver(message_id: int, recipient: str, raw: bytes, attempts: int) -> bool:
+            msg = message_from_bytes(raw, policy=policy.default)
+            async with semaphore:
+                error = (await MailTransport.send([msg]))[0]
+            EmailOutbox._record_result(message_id, attempts + 1, error)
+            if error is not None:
+                logger.warning(f"Delivery of email {message_id} to {recipient} failed "
+                               f"(attempt {attempts + 1}): {str(error)}")
+                return False
+            return True
+
+        results = await asyncio.gather(*(deliver(*row) for row in due))
+        return {row[0]: delivered for row, delivered in zip(due, results)}
+
+    @staticmethod
+    def get_failed_ids(ids: List[int]) -> List[int]:
+        """Get which of some messages failed permanently."""
+        if not ids:
+            return []
+        placeholders = ', '.join('?' * len(ids))
+        with closing(EmailOutbox._connect()) as connection:
+            return [row[0] for row in connection.execute(
+                f"SELECT id FROM outbox WHERE status = 'failed' AND id IN ({placeholders})", list(ids)
+            )]
+
+    @staticmethod
+    def next_due_in() -> Optional[float]:
+        """Get the seconds until the next pending message is due, or None if the queue is empty."""
+        with closing(EmailOutbox._connect()) as connection:
+            next_attempt_at = connection.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+        return None if next_attempt_at is None else max(next_attempt_at - time.time(), 0)
+
+    @staticmethod
+    def prune():
+        """Delete sent messages past the retention period."""
+        with closing(EmailOutbox._connect()) as connection, connection:
+            connection.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                               (time.time() - SENT_RETENTION_SECONDS,))
+
+    @staticmethod
+    def get_metrics() -> Dict[str, Any]:
+        """Get queue depth and delivery latency metrics.
+
+        Returns:
+            Counts by status, age of the oldest pending message, and the average and
+            95th percentile delivery latency (enqueue to send) of retained sent messages
+        """
+        now = time.time()
+        with closing(EmailOutbox._connect()) as connection:
+            counts = dict(connection.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+            oldest_pending = connection.execute(
+                "SELECT MIN(enqueued_at) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+            latencies = [row[0] for row in connection.execute(
+                "SELECT sent_at - enqueued_at FROM outbox WHERE status = 'sent' ORDER BY 1"
+            )]
+
+        return {
+            'queue_depth': counts.get('pending', 0) + counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_pending_age_seconds': round(now - oldest_pending, 3) if oldest_pending else None,
+            'delivery_latency_avg_seconds': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'delivery_latency_p95_seconds': round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None,
+        }
+
+    @staticmethod
+    async def run_worker(should_continue: Callable[[], bool] = None):
+        """Drain the outbox until stopped, sleeping until the next message is due.
+
+        Args:
+            should_continue: Checked between drains; the worker returns when it is False
+        """
+        if should_continue is None:
+            should_continue = lambda: True
+
+        logger.info("Starting email outbox delivery worker")
+        try:
+            EmailOutbox.requeue_stale_claims()
+        except Exception as e:
+            logger.error(f"Error requeueing interrupted emails: {str(e)}")
+
+        while should_continue():
+            try:
+                await EmailOutbox.drain()
+                EmailOutbox.prune()
+                next_due = EmailOutbox.next_due_in()
+            except Exception as e:
+                logger.error(f"Error draining email outbox: {str(e)}")
+                next_due = None
+
+            delay = WORKER_POLL_SECONDS if next_due is None else min(next_due, WORKER_POLL_SECONDS)
+            await asyncio.sleep(max(delay, 1))
+        logger.info("Email outbox delivery worker stopped")
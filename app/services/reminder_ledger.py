@@ -0,0 +1,229 @@
+"""
+Ledger of sent maintenance reminders.
+
+Each reminder is recorded by (serial, quarter, due date, recipient) with the
+escalation stage it was sent at, so a task is only re-sent when it crosses the next
+escalation point (e.g. 60, 30, 7 and 0 days before it is due) instead of on every
+scheduler run. Each row keeps the id of the outbox message that carries it, so a
+reminder whose message failed permanently can be released and sent again. The
+ledger also keeps the date and data version of the last run, so
+a run on unchanged data only looks at the tasks that crossed a point since then.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Ledger rows of tasks that were due longer ago than this are pruned
+RETENTION_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminder_ledger (
+    serial TEXT NOT NULL,
+    quarter TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    stage INTEGER NOT NULL,
+    sent_at REAL NOT NULL,
+    message_id INTEGER,
+    PRIMARY KEY (serial, quarter, due_date, recipient)
+);
+CREATE INDEX IF NOT EXISTS idx_reminder_ledger_recipient ON reminder_ledger (recipient, due_date);
+CREATE TABLE IF NOT EXISTS reminder_runs (
+    name TEXT PRIMARY KEY,
+    run_date TEXT NOT NULL,
+    data_version TEXT
+);
+"""
+
+Task = Tuple[str, str, str, str, str, str]
+
+
+class ReminderLedger:
+    """Service recording which reminders were sent at which escalation stage."""
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        """Open the ledger database, creating it if needed."""
+        os.makedirs(os.path.dirname(Config.REMINDER_LEDGER_PATH) or '.', exist_ok=True)
+        connection = sqlite3.connect(Config.REMINDER_LEDGER_PATH, timeout=30)
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(reminder_ledger)')}
+        if 'message_id' not in columns:
+            connection.execute('ALTER TABLE reminder_ledger ADD COLUMN message_id INTEGER')
+        return connection
+
+    @staticmethod
+    def get_escalation_points() -> List[int]:
+        """Get the escalation points in days before the due date, largest first.
+
+        The reminder window (REMINDER_DAYS) is always the first point, and points
+        outside the window are ignored.
+        """
+        points = {Config.REMINDER_DAYS}
+        points.update(p for p in Config.REMINDER_ESCALATION_DAYS if 0 <= p <= Config.REMINDER_DAYS)
+        return sorted(points, reverse=True)
+
+    @staticmethod
+    def get_stage(days_until: int, points: List[int]) -> Optional[int]:
+        """Get the escalation stage of a task: the nearest point at or above days_until.
+
+        Args:
+            days_until: Days until the task is due
+            points: Escalation points, largest first
+
+        Returns:
+            The stage, or None if the task is overdue or outside the reminder window
+        """
+        if days_until < 0:
+            return None
+        stage = None
+        for point in points:
+            if point >= days_until:
+                stage = point
+            else:
+                break
+        return stage
+
+    @staticmethod
+    def _due(task: Task) -> date:
+        return datetime.strptime(task[4], '%d/%m/%Y').date()
+
+    @staticmethod
+    def crossed_since(upcoming: List[Task], last_run: date, today: date) -> List[Task]:
+        """Keep only the tasks that crossed an escalation point since the last run.
+
+        A task due in d days today was due in d + elapsed days at the last run, so it
+        crossed point p if d <= p < d + elapsed.
+
+        Args:
+            upcoming: Upcoming tasks
+            last_run: Date of the last run
+            today: Date of this run
+
+        Returns:
+            The tasks that may need a new reminder
+        """
+        elapsed = (today - last_run).days
+        if elapsed <= 0:
+            return []
+        points = ReminderLedger.get_escalation_points()
+        crossed = []
+        for task in upcoming:
+            days_until = (ReminderLedger._due(task) - today).days
+            if any(days_until <= point < days_until + elapsed for point in points):
+                crossed.append(task)
+        return crossed
+
+    @staticmethod
+    def filter_unsent(digests: Dict[str, List[Task]], today: date) -> Dict[str, List[Task]]:
+        """Drop tasks each recipient was already reminded of at their current stage.
+
+        Args:
+            digests: Mapping of recipient address to tasks
+            today: Date of this run
+
+        Returns:
+            Mapping of recipient address to the tasks still to send (empty digests removed)
+        """
+        points = ReminderLedger.get_escalation_points()
+        pending = {}
+        with closing(ReminderLedger._connect()) as connection:
+            for recipient, tasks in digests.items():
+                sent = {(serial, quarter, due_date): stage for serial, quarter, due_date, stage in connection.execute(
+                    'SELECT serial, quarter, due_date, stage FROM reminder_ledger WHERE recipient = ? AND due_date >= ?',
+                    (recipient.lower(), today.isoformat())
+                )}
+                unsent = []
+                for task in tasks:
+                    due = ReminderLedger._due(task)
+                    stage = ReminderLedger.get_stage((due - today).days, points)
+                    if stage is None:
+                        continue
+                    previous = sent.get((task[1], task[2], due.isoformat()))
+                    if previous is None or previous > stage:
+                        unsent.append(task)
+                if unsent:
+                    pending[recipient] = unsent
+        return pending
+
+    @staticmethod
+    def record_sent(digests: Dict[str, List[Task]], today: date, message_ids: Optional[Dict[str, int]] = None):
+        """Record the tasks sent to each recipient at their current stage.
+
+        Args:
+            digests: Mapping of recipient address to the tasks sent
+            today: Date of this run
+            message_ids: Mapping of recipient address to the outbox id of their digest
+        """
+        points = ReminderLedger.get_escalation_points()
+        message_ids = message_ids or {}
+        now = time.time()
+        rows = []
+        for recipient, tasks in digests.items():
+            for task in tasks:
+                due = ReminderLedger._due(task)
+                stage = ReminderLedger.get_stage((due - today).days, points)
+                if stage is not None:
+                    rows.append((task[1], task[2], due.isoformat(), recipient.lower(), stage, now,
+                                 message_ids.get(recipient)))
+
+        with closing(ReminderLedger._connect()) as connection, connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO reminder_ledger '
+                '(serial, quarter, due_date, recipient, stage, sent_at, message_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            connection.execute('DELETE FROM reminder_ledger WHERE due_date < ?',
+                               ((today - timedelta(days=RETENTION_DAYS)).isoformat(),))
+
+    @staticmethod
+    def get_message_ids() -> List[int]:
+        """Get the outbox ids of the messages carrying recorded reminders."""
+        with closing(ReminderLedger._connect()) as connection:
+            return [row[0] for row in connection.execute(
+                'SELECT DISTINCT message_id FROM reminder_ledger WHERE message_id IS NOT NULL'
+            )]
+
+    @staticmethod
+    def forget_messages(message_ids: List[int]) -> int:
+        """Remove the reminders carried by some messages, so they are sent again.
+
+        Args:
+            message_ids: Outbox ids of messages that failed permanently
+
+        Returns:
+            Number of reminders removed
+        """
+        if not message_ids:
+            return 0
+        placeholders = ', '.join('?' * len(message_ids))
+        with closing(ReminderLedger._connect()) as connection, connection:
+            return connection.execute(
+                f'DELETE FROM reminder_ledger WHERE message_id IN ({placeholders})', list(message_ids)
+            ).rowcount
+
+    @staticmethod
+    def get_last_run(name: str = 'reminders') -> Optional[Tuple[date, Optional[str]]]:
+        """Get the date and data version of the last completed run, if any."""
+        with closing(ReminderLedger._connect()) as connection:
+            row = connection.execute('SELECT run_date, data_version FROM reminder_runs WHERE name = ?',
+                                     (name,)).fetchone()
+        if not row:
+            return None
+        return date.fromisoformat(row[0]), row[1]
+
+    @staticmethod
+    def set_last_run(run_date: date, data_version: Optional[str], name: str = 'reminders'):
+        """Record a completed run."""
+        with closing(ReminderLedger._connect()) as connection, connection:
+            connection.execute('INSERT OR REPLACE INTO reminder_runs VALUES (?, ?, ?)',
+                               (name, run_date.isoformat(), data_version))
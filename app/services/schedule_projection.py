@@ -0,0 +1,104 @@
+"""
+Multi-year projection of PPM schedules.
+
+A device's stored PPM_Q_I..PPM_Q_IV dates only cover one year. The projector
+continues the cycle indefinitely: occurrence k of a device is due Q1 + 3k months
+and is done by the engineer of quarter k mod 4. Occurrences are generated lazily
+and only inside the requested window, starting directly at the first one due,
+so a query over any horizon holds one pending occurrence per device in memory.
+"""
+import heapq
+import logging
+import threading
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+from app.services.data_service import DataService
+from app.services.due_events import Event, parse_due_date
+
+
+logger = logging.getLogger(__name__)
+
+QUARTERS = ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']
+
+
+class ScheduleProjector:
+    """Service projecting PPM quarter occurrences over arbitrary date ranges."""
+
+    # (PPM dataset key, [(Q1 date, entry)] of scheduled devices)
+    _devices: Optional[Tuple[str, List[Tuple[date, Dict[str, Any]]]]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def project_device(entry: Dict[str, Any], q1_date: date, start: date, end: date) -> Iterator[Tuple[date, Event]]:
+        """
+        Yield a device's PPM occurrences due within a date range.
+
+        Args:
+            entry: PPM entry
+            q1_date: Date of the device's first quarter
+            start: First due date included
+            end: Last due date included
+
+        Yields:
+            (due date, event) with the event as (equipment, mfg_serial, task,
+            department, date, engineer)
+        """
+        months = (start.year - q1_date.year) * 12 + start.month - q1_date.month
+        k = max(0, months // 3 - 1)
+        while True:
+            due = q1_date + relativedelta(months=3 * k)
+            if due > end:
+                return
+            if due >= start:
+                quarter = QUARTERS[k % 4]
+                yield due, (
+                    entry.get('EQUIPMENT', ''),
+                    entry.get('MFG_SERIAL', ''),
+                    quarter.replace('PPM_Q_', 'Quarter '),
+                    entry.get('DEPARTMENT') or 'N/A',
+                    due.strftime('%d/%m/%Y'),
+                    (entry.get(quarter) or {}).get('engineer') or 'N/A'
+                )
+            k += 1
+
+    @staticmethod
+    def _get_devices() -> List[Tuple[date, Dict[str, Any]]]:
+        """Get the devices with a PPM schedule, reloading them if the PPM data changed."""
+        version = DataService.get_dataset_key('ppm')
+        devices = ScheduleProjector._devices
+        if devices is not None and devices[0] == version:
+            return devices[1]
+
+        with ScheduleProjector._lock:
+            devices = ScheduleProjector._devices
+            if devices is None or devices[0] != version:
+                scheduled = []
+                for entry in DataService.load_data('ppm'):
+                    if str(entry.get('PPM', '')).lower() != 'yes':
+                        continue
+                    q1_date = parse_due_date((entry.get('PPM_Q_I') or {}).get('date'))
+                    if q1_date is not None:
+                        scheduled.append((q1_date, entry))
+                devices = ScheduleProjector._devices = (version, scheduled)
+                logger.info(f"Loaded {len(scheduled)} PPM schedules for projection")
+            return devices[1]
+
+    @staticmethod
+    def iter_occurrences(start: date, end: date) -> Iterator[Event]:
+        """
+        Yield the projected PPM occurrences of all devices due within a date range.
+
+        Args:
+            start: First due date included
+            end: Last due date included
+
+        Yields:
+            Events as (equipment, mfg_serial, task, department, date, engineer), in due-date order
+        """
+        streams = [ScheduleProjector.project_device(entry, q1_date, start, end)
+                   for q1_date, entry in ScheduleProjector._get_devices() if q1_date <= end]
+        for _, event in heapq.merge(*streams, key=lambda occurrence: occurrence[0]):
+            yield event
@@ -0,0 +1,179 @@
+"""
+Single-leader reminder scheduler.
+
+Reminders and outbox deliveries run in a dedicated scheduler process (see
+run_scheduler.py, started by gunicorn's arbiter), never in the web workers. The
+process only runs them while it holds the leader lock: an exclusive flock() on a
+file in the data directory, held for as long as the process leads and released
+by the OS when it exits, however it exits. A second scheduler process (e.g. on a
+restart that overlaps the old one) waits until the lock is free.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single development process, no lock needed
+    fcntl = None
+
+from app.config import Config
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts of a follower to take the leader lock
+LEADER_RETRY_SECONDS = 30
+
+
+class LeaderLock:
+    """Exclusive OS lock on a file, electing one leader across processes."""
+
+    def __init__(self, lock_path: str):
+        """
+        Args:
+            lock_path: Path of the lock file
+        """
+        self.lock_path = lock_path
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._file = None
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """Read the owner record of the lock, or None if there is no current owner."""
+        try:
+            with open(self.lock_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None
+
+    def is_held(self) -> bool:
+        """Check if this lock object currently owns the lock."""
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """
+        Try to become the leader without blocking.
+
+        Returns:
+            bool: True if this lock object owns the lock
+        """
+        if self._file is not None:
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock_file = os.fdopen(os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+
+        # Record the owner for operators; the flock itself is what elects the leader
+        lock_file.seek(0)
+        lock_file.truncate()
+        json.dump({'owner': self.owner_id, 'host': socket.gethostname(), 'pid': os.getpid()}, lock_file)
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        """Give up the lock if this lock object owns it."""
+        if self._file is None:
+            return
+        lock_file, self._file = self._file, None
+        try:
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.flush()
+        finally:
+            # Closing the file drops the flock
+            lock_file.close()
+
+
+class SchedulerService:
+    """Service running the reminder scheduler in exactly one process."""
+
+    _thread: Optional[threading.Thread] = None
+    _stop_event = threading.Event()
+    _lock: Optional[LeaderLock] = None
+
+    @staticmethod
+    def start() -> Optional[threading.Thread]:
+        """
+        Start the scheduler thread of this process, if it is not running yet.
+
+        The thread waits for the leader lock and only runs reminders while it holds it.
+        Under gunicorn this is done by the separate scheduler process (run_scheduler.py),
+        not by the web workers.
+
+        Returns:
+            The scheduler thread, or None if the scheduler is disabled
+        """
+        if not Config.SCHEDULER_ENABLED:
+            logger.info("Reminder scheduler is disabled")
+            return None
+
+        if SchedulerService._thread and SchedulerService._thread.is_alive():
+            return SchedulerService._thread
+
+        SchedulerService._stop_event = threading.Event()
+        SchedulerService._lock = LeaderLock(Config.SCHEDULER_LOCK_PATH)
+        SchedulerService._thread = threading.Thread(
+            target=SchedulerService._run,
+            args=(SchedulerService._lock, SchedulerService._stop_event),
+            name='reminder-scheduler',
+            daemon=True
+        )
+        SchedulerService._thread.start()
+        return SchedulerService._thread
+
+    @staticmethod
+    def stop():
+        """Stop the scheduler thread; it releases the leader lock when its tasks have stopped."""
+        SchedulerService._stop_event.set()
+
+    @staticmethod
+    def is_leader() -> bool:
+        """Check if this process is the scheduler leader."""
+        return bool(SchedulerService._lock) and SchedulerService._lock.is_held()
+
+    @staticmethod
+    async def _run_leader_tasks(should_continue):
+        """Run the reminder scheduler and the email outbox worker until the scheduler returns."""
+        from app.services.email_service import EmailService
+        from app.services.outbox import EmailOutbox
+
+        worker = asyncio.ensure_future(EmailOutbox.run_worker(should_continue))
+        try:
+            await EmailService.run_scheduler(should_continue=should_continue)
+        finally:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+    @staticmethod
+    def _run(lock: LeaderLock, stop_event: threading.Event):
+        """Wait for leadership and run the reminder scheduler while leading."""
+        while not stop_event.is_set():
+            if not lock.try_acquire():
+                stop_event.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            logger.info(f"Process {os.getpid()} elected reminder scheduler leader ({lock.owner_id})")
+            try:
+                should_continue = lambda: not stop_event.is_set()
+                # The leader tasks do blocking work (SQLite, JSON loads, index rebuilds), so they
+                # get their own event loop in this thread
+                asyncio.run(SchedulerService._run_leader_tasks(should_continue))
+                # The scheduler returned: it was disabled or stopped
+                return
+            except Exception as e:
+                logger.error(f"Error in email scheduler: {str(e)}")
+                stop_event.wait(LEADER_RETRY_SECONDS)
+            finally:
+                lock.release()
@@ -0,0 +1,391 @@
+"""
+Full-text search over equipment and training records.
+
+Searchable fields of every record are split into tokens, and the distinct tokens
+into trigrams (with a leading '$' marking the start of a token, so two-letter
+queries match token prefixes). Query tokens are resolved against the token
+vocabulary through the trigram index, then expanded to the records holding the
+matching tokens, so queries never scan the records themselves.
+
+The DataService write paths (add, update, delete and import) pass the records they
+changed to apply_changes(), which re-indexes just those. Searches only stat the
+data files: if a file was rewritten behind the index (by another worker process,
+a restore or a direct save), its records are diffed against the indexed ones by
+key and fingerprint, and only added, changed or removed records are re-indexed.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services.data_service import DataService
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DATA_TYPES = ('ppm', 'ocm', 'training')
+
+# Fields indexed per dataset, and the fields returned with each hit
+EQUIPMENT_SEARCH_FIELDS = ('EQUIPMENT', 'MODEL', 'MANUFACTURER', 'MFG_SERIAL', 'LOG_NO', 'DEPARTMENT')
+TRAINING_SEARCH_FIELDS = ('NAME', 'ID', 'DEPARTMENT')
+EQUIPMENT_HIT_FIELDS = ('EQUIPMENT', 'MODEL', 'MANUFACTURER', 'MFG_SERIAL', 'LOG_NO', 'DEPARTMENT')
+TRAINING_HIT_FIELDS = ('NAME', 'ID', 'DEPARTMENT')
+
+# Share of a query token's trigrams a record must contain to match it
+MIN_TRIGRAM_MATCH = 0.75
+
+# Shortest query token that is searched (a '$' plus two letters forms one trigram)
+MIN_TOKEN_LENGTH = 2
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+DocId = Tuple[str, str]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def trigrams(token: str) -> Set[str]:
+    """Get the trigrams of a token, including the '$'-marked token start."""
+    padded = f"${token}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _record_key(data_type: str, record: Dict[str, Any]) -> str:
+    return str(record.get('ID' if data_type == 'training' else 'MFG_SERIAL', '')).strip()
+
+
+def _search_text(data_type: str, record: Dict[str, Any]) -> List[str]:
+    """Get the searchable values of a record, including engineer and trainer names."""
+    if data_type == 'training':
+        values = [record.get(field) for field in TRAINING_SEARCH_FIELDS]
+        values += [record.get(f'machine{n}_trainer') for n in range(1, 8)]
+        values.append(record.get('TRAINER'))
+    else:
+        values = [record.get(field) for field in EQUIPMENT_SEARCH_FIELDS]
+        values.append(record.get('ENGINEER'))
+        for q in ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']:
+            values.append((record.get(q) or {}).get('engineer'))
+    return [str(value) for value in values if value and str(value).lower() != 'n/a']
+
+
+class SearchIndex:
+    """Two-level trigram index with incremental add, update and remove.
+
+    Records map to their distinct tokens and tokens to the records containing them;
+    trigrams index the token vocabulary, which is much smaller than the records.
+    A query token is matched against the vocabulary first, so the per-record work
+    is a set union and intersection.
+    """
+
+    def __init__(self):
+        self.token_docs: Dict[str, Set[int]] = {}
+        self.gram_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self.doc_numbers: Dict[DocId, int] = {}
+        self.type_numbers: Dict[str, Set[int]] = defaultdict(set)
+        self.doc_ids: Dict[int, DocId] = {}
+        self.doc_tokens: Dict[int, Set[str]] = {}
+        self.doc_fingerprints: Dict[DocId, str] = {}
+        self.doc_fields: Dict[DocId, Dict[str, Any]] = {}
+        self._next_number = 0
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    def remove(self, doc_id: DocId):
+        """Remove a record from the index."""
+        number = self.doc_numbers.pop(doc_id, None)
+        if number is None:
+            return
+        del self.doc_ids[number]
+        self.type_numbers[doc_id[0]].discard(number)
+        for token in self.doc_tokens.pop(number):
+            docs = self.token_docs[token]
+            docs.discard(number)
+            if not docs:
+                # Last record with this token: drop it from the vocabulary
+                del self.token_docs[token]
+                for gram in trigrams(token):
+                    tokens = self.gram_tokens[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.gram_tokens[gram]
+        self.doc_fingerprints.pop(doc_id, None)
+        self.doc_fields.pop(doc_id, None)
+
+    def add(self, doc_id: DocId, values: List[str], fingerprint: str, fields: Dict[str, Any]):
+        """Add or replace a record."""
+        self.remove(doc_id)
+        number = self._next_number
+        self._next_number += 1
+
+        tokens = {token for value in values for token in tokenize(value)}
+        for token in tokens:
+            docs = self.token_docs.get(token)
+            if docs is None:
+                docs = self.token_docs[token] = set()
+                for gram in trigrams(token):
+                    self.gram_tokens[gram].add(token)
+            docs.add(number)
+
+        self.doc_numbers[doc_id] = number
+        self.doc_ids[number] = doc_id
+        self.type_numbers[doc_id[0]].add(number)
+        self.doc_tokens[number] = tokens
+        self.doc_fingerprints[doc_id] = fingerprint
+        self.doc_fields[doc_id] = fields
+
+    def match_tokens(self, token: str) -> Dict[str, float]:
+        """
+        Find the vocabulary tokens matching a query token.
+
+        Tokens containing the query token score 3 for an exact match, 2 for a prefix
+        and 1 otherwise. Only if there are none, tokens sharing most of its trigrams
+        match with a score below 1, which tolerates typos.
+
+        Returns:
+            Mapping of vocabulary token to score
+        """
+        grams = sorted(trigrams(token), key=lambda g: len(self.gram_tokens.get(g, ())))
+        if not grams:
+            return {}
+
+        # Intersect the rarest trigram's tokens with the others, as C-level set operations
+        candidates = set(self.gram_tokens.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self.gram_tokens.get(gram, set())
+
+        matches = {}
+        for candidate in candidates:
+            if candidate == token:
+                matches[candidate] = 3.0
+            elif candidate.startswith(token):
+                matches[candidate] = 2.0
+            elif token in candidate:
+                matches[candidate] = 1.0
+        if matches or len(grams) < 3:
+            return matches
+
+        counts: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self.gram_tokens.get(gram, ()):
+                counts[candidate] += 1
+        needed = max(1, int(len(grams) * MIN_TRIGRAM_MATCH + 0.999))
+        return {candidate: count / len(grams) * 0.9 for candidate, count in counts.items() if count >= needed}
+
+    def search(self, query: str, data_types: Optional[Set[str]] = None,
+               limit: Optional[int] = None) -> Tuple[int, List[Tuple[float, DocId]]]:
+        """
+        Find the records matching every token of a query.
+
+        Args:
+            query: Free-text query
+            data_types: Only return records of these datasets (optional)
+            limit: Only rank this many best hits (default: all)
+
+        Returns:
+            tuple: (number of matching records, list of (score, doc id) best first); a
+            record scores the sum over query tokens of its best matching token, and ties
+            keep indexing order
+        """
+        tokens = [token for token in dict.fromkeys(tokenize(query)) if len(token) >= MIN_TOKEN_LENGTH]
+        if not tokens:
+            return 0, []
+
+        allowed = None
+        if data_types is not None:
+            allowed = set()
+            for data_type in data_types:
+                allowed |= self.type_numbers.get(data_type, set())
+
+        # Records by score, best first; each record only in the bucket of its best score
+        buckets: Dict[float, Set[int]] = defaultdict(set)
+        if len(tokens) == 1:
+            for candidate, score in self.match_tokens(tokens[0]).items():
+                buckets[score] |= self.token_docs[candidate]
+            seen: Set[int] = set()
+            for score in sorted(buckets, reverse=True):
+                buckets[score] -= seen
+                seen |= buckets[score]
+        else:
+            per_token = []
+            for token in tokens:
+                doc_scores: Dict[int, float] = {}
+                # Lowest scoring tokens first, so each record ends up with its best score
+                for candidate, score in sorted(self.match_tokens(token).items(), key=lambda m: m[1]):
+                    doc_scores.update(dict.fromkeys(self.token_docs[candidate], score))
+                if not doc_scores:
+                    return 0, []
+                per_token.append(doc_scores)
+
+            per_token.sort(key=len)
+            numbers = set(per_token[0])
+            for doc_scores in per_token[1:]:
+                numbers.intersection_update(doc_scores.keys())
+            for number in numbers:
+                buckets[sum(doc_scores[number] for doc_scores in per_token)].add(number)
+
+        if allowed is not None:
+            for score in buckets:
+                buckets[score] &= allowed
+
+        total = sum(len(bucket) for bucket in buckets.values())
+        hits = []
+        for score in sorted(buckets, reverse=True):
+            if limit is not None and len(hits) >= limit:
+                break
+            ranked = sorted(buckets[score])
+            if limit is not None:
+                ranked = ranked[:limit - len(hits)]
+            hits.extend((score, self.doc_ids[number]) for number in ranked)
+        return total, hits
+
+
+class SearchService:
+    """Service keeping a search index in sync with the data files."""
+
+    _index = SearchIndex()
+    _versions: Dict[str, str] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(values: List[str], fields: Dict[str, Any]) -> str:
+        return hashlib.sha1(repr((values, sorted(fields.items()))).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _index_record(data_type: str, record: Dict[str, Any]) -> Tuple[Optional[DocId], Optional[str]]:
+        """Add or update one record unless its fingerprint is unchanged; the caller holds the lock.
+
+        Returns:
+            tuple: (doc id, or None for records without key; 'added', 'updated' or None if unchanged)
+        """
+        key = _record_key(data_type, record)
+        if not key:
+            return None, None
+        index = SearchService._index
+        doc_id = (data_type, key)
+        hit_fields = TRAINING_HIT_FIELDS if data_type == 'training' else EQUIPMENT_HIT_FIELDS
+        values = _search_text(data_type, record)
+        fields = {field: record.get(field, '') for field in hit_fields}
+        fingerprint = SearchService._fingerprint(values, fields)
+        previous = index.doc_fingerprints.get(doc_id)
+        if previous == fingerprint:
+            return doc_id, None
+        index.add(doc_id, values, fingerprint, fields)
+        return doc_id, 'updated' if previous else 'added'
+
+    @staticmethod
+    def sync(data_type: str, records: List[Dict[str, Any]], version: Optional[str] = None) -> Dict[str, int]:
+        """
+        Bring the index of one dataset in line with its records.
+
+        Args:
+            data_type: 'ppm', 'ocm' or 'training'
+            records: All records of the dataset
+            version: Data version the records belong to (optional)
+
+        Returns:
+            dict: Number of records added, updated and removed
+        """
+        index = SearchService._index
+        stats = {'added': 0, 'updated': 0, 'removed': 0}
+
+        with SearchService._lock:
+            seen = set()
+            for record in records:
+                doc_id, change = SearchService._index_record(data_type, record)
+                if doc_id is None:
+                    continue
+                seen.add(doc_id)
+                if change:
+                    stats[change] += 1
+
+            stale = [doc_id for doc_id in index.doc_fingerprints if doc_id[0] == data_type and doc_id not in seen]
+            for doc_id in stale:
+                index.remove(doc_id)
+            stats['removed'] = len(stale)
+
+            if version is not None:
+                SearchService._versions[data_type] = version
+
+        if any(stats.values()):
+            logger.info(f"Search index synced for {data_type}: {stats}")
+        return stats
+
+    @staticmethod
+    def apply_changes(data_type: str, base_version: str, version: str,
+                      upserted: Iterable[Dict[str, Any]] = (), removed: Iterable[str] = ()) -> bool:
+        """
+        Re-index the records changed by a write to a data file, without reading the file.
+
+        The changes only apply to an index built from the file as it was before the write;
+        otherwise the index is left as it is and the next search re-syncs the dataset.
+
+        Args:
+            data_type: 'ppm', 'ocm' or 'training'
+            base_version: Data version of the file before the write
+            version: Data version of the file after the write
+            upserted: Records added or updated by the write
+            removed: Keys (MFG_SERIAL or training ID) of the records deleted by the write
+
+        Returns:
+            bool: True if the changes were applied
+        """
+        with SearchService._lock:
+            if SearchService._versions.get(data_type) != base_version:
+                return False
+            for record in upserted:
+                SearchService._index_record(data_type, record)
+            for key in removed:
+                SearchService._index.remove((data_type, str(key).strip()))
+            SearchService._versions[data_type] = version
+        return True
+
+    @staticmethod
+    def refresh():
+        """Re-sync every dataset whose file changed since it was indexed.
+
+        Writes made through DataService in this process are already indexed, so this is
+        a stat() per data file unless the file was rewritten elsewhere.
+        """
+        for data_type in SEARCH_DATA_TYPES:
+            version = DataService.get_dataset_key(data_type)
+            if SearchService._versions.get(data_type) != version:
+                SearchService.sync(data_type, DataService.load_data(data_type), version)
+
+    @staticmethod
+    def search(query: str, data_types: Optional[List[str]] = None, page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+        """
+        Search equipment and training records.
+
+        Args:
+            query: Free-text query
+            data_types: Datasets to search (default: all)
+            page: Page number, starting at 1
+            per_page: Hits per page
+
+        Returns:
+            dict: The page of hits (with data type, key, score and summary fields) and the total
+        """
+        SearchService.refresh()
+        index = SearchService._index
+        start = (page - 1) * per_page
+        with SearchService._lock:
+            total, hits = index.search(query, set(data_types) if data_types else None, limit=start + per_page)
+            page_hits = [
+                {'data_type': doc_id[0], 'key': doc_id[1], 'score': round(score, 3), **index.doc_fields[doc_id]}
+                for score, doc_id in hits[start:start + per_page]
+            ]
+        return {
+            'query': query,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'hits': page_hits
+        }
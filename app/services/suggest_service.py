@@ -0,0 +1,140 @@
+"""
+Prefix suggestions for form fields.
+
+The distinct values of each suggestible field (departments, engineers, trainers,
+models, ...) are kept in an array sorted by their case-folded form. A prefix lookup
+is two binary searches into that array, so dropdowns can fetch a handful of
+matches instead of pages embedding every distinct value. The arrays are rebuilt
+when a data file's version changes.
+"""
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.services.data_service import DataService
+
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_DATA_TYPES = ('ppm', 'ocm', 'training')
+
+# Highest code point, so prefix + this sorts after every string starting with prefix
+_MAX_CHAR = '\U0010ffff'
+
+
+def _equipment_values(field: str) -> Callable[[str, Dict[str, Any]], Iterable[Any]]:
+    return lambda data_type, record: [record.get(field)] if data_type != 'training' else []
+
+
+def _department_values(data_type: str, record: Dict[str, Any]) -> Iterable[Any]:
+    return [record.get('DEPARTMENT')]
+
+
+def _engineer_values(data_type: str, record: Dict[str, Any]) -> Iterable[Any]:
+    if data_type == 'ocm':
+        return [record.get('ENGINEER')]
+    if data_type == 'ppm':
+        return [(record.get(q) or {}).get('engineer') for q in ['PPM_Q_I', 'PPM_Q_II', 'PPM_Q_III', 'PPM_Q_IV']]
+    return []
+
+
+def _trainer_values(data_type: str, record: Dict[str, Any]) -> Iterable[Any]:
+    if data_type != 'training':
+        return []
+    return [record.get('TRAINER')] + [record.get(f'machine{n}_trainer') for n in range(1, 8)]
+
+
+# Suggestible fields and how to read their values from a record
+SUGGEST_FIELDS: Dict[str, Callable[[str, Dict[str, Any]], Iterable[Any]]] = {
+    'department': _department_values,
+    'engineer': _engineer_values,
+    'trainer': _trainer_values,
+    'equipment': _equipment_values('EQUIPMENT'),
+    'model': _equipment_values('MODEL'),
+    'manufacturer': _equipment_values('MANUFACTURER'),
+}
+
+
+def _fold(value: str) -> str:
+    return ' '.join(value.casefold().split())
+
+
+class SuggestService:
+    """Service answering prefix lookups over the distinct values of form fields."""
+
+    # (dataset keys, {field: (sorted folded values, original values)})
+    _index: Optional[Tuple[str, Dict[str, Tuple[List[str], List[str]]]]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build_index(datasets: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Tuple[List[str], List[str]]]:
+        """
+        Build the sorted value arrays of every suggestible field.
+
+        Values are deduplicated case- and whitespace-insensitively; the first spelling
+        seen is kept.
+
+        Args:
+            datasets: Records by data type
+
+        Returns:
+            dict: Field -> (sorted folded values, original values in the same order)
+        """
+        index = {}
+        for field, read_values in SUGGEST_FIELDS.items():
+            distinct: Dict[str, str] = {}
+            for data_type, records in datasets.items():
+                for record in records:
+                    for value in read_values(data_type, record):
+                        if not value or not isinstance(value, str):
+                            continue
+                        value = value.strip()
+                        folded = _fold(value)
+                        if folded and folded != 'n/a' and folded not in distinct:
+                            distinct[folded] = value
+            folded_values = sorted(distinct)
+            index[field] = (folded_values, [distinct[folded] for folded in folded_values])
+        return index
+
+    @staticmethod
+    def _get_index() -> Dict[str, Tuple[List[str], List[str]]]:
+        """Get the value arrays, rebuilding them if a data file changed."""
+        version = '|'.join(DataService.get_dataset_key(data_type) for data_type in SUGGEST_DATA_TYPES)
+        index = SuggestService._index
+        if index is not None and index[0] == version:
+            return index[1]
+
+        with SuggestService._lock:
+            index = SuggestService._index
+            if index is None or index[0] != version:
+                datasets = {data_type: DataService.load_data(data_type) for data_type in SUGGEST_DATA_TYPES}
+                index = (version, SuggestService.build_index(datasets))
+                SuggestService._index = index
+                logger.info(f"Built suggestion index: { {field: len(values[0]) for field, values in index[1].items()} }")
+            return index[1]
+
+    @staticmethod
+    def suggest(field: str, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Get the values of a field starting with a prefix.
+
+        Args:
+            field: One of SUGGEST_FIELDS
+            prefix: Prefix to match, case- and whitespace-insensitively
+            limit: Maximum number of suggestions
+
+        Returns:
+            list: Matching values in alphabetical order
+
+        Raises:
+            ValueError: If the field is not suggestible
+        """
+        if field not in SUGGEST_FIELDS:
+            raise ValueError(f"Invalid field. Must be one of: {', '.join(SUGGEST_FIELDS)}")
+
+        folded_values, values = SuggestService._get_index()[field]
+        folded_prefix = _fold(prefix)
+        start = bisect.bisect_left(folded_values, folded_prefix)
+        end = bisect.bisect_right(folded_values, folded_prefix + _MAX_CHAR, lo=start)
+        return values[start:min(end, start + limit)]
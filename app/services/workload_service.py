@@ -0,0 +1,114 @@
+"""
+Engineer workload forecast.
+
+PPM quarter and OCM service events of the due event index are turned into two
+NumPy arrays per data version: due date ordinals and engineer codes. A forecast
+is then a single bincount over (engineer, week) cells for the events within the
+horizon. Forecasts are cached per data version, day and horizon.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.due_events import OCM_EVENT, PPM_EVENT, DueEventService
+
+
+logger = logging.getLogger(__name__)
+
+WORKLOAD_EVENT_KINDS = (PPM_EVENT, OCM_EVENT)
+DEFAULT_WEEKS = 12
+MAX_WEEKS = 52
+FORECAST_CACHE_SIZE = 32
+
+
+class WorkloadService:
+    """Service forecasting maintenance tasks per engineer per week."""
+
+    # (data version, due date ordinals, engineer codes, engineer names)
+    _arrays: Optional[Tuple[str, np.ndarray, np.ndarray, List[str]]] = None
+    _forecasts: 'OrderedDict[Tuple[str, date, int], Dict[str, Any]]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_arrays() -> Tuple[str, np.ndarray, np.ndarray, List[str]]:
+        """Get the task arrays, rebuilding them if the due event index changed."""
+        version, ordinals, kinds, events = DueEventService.get_index()
+        arrays = WorkloadService._arrays
+        if arrays is not None and arrays[0] == version:
+            return arrays
+
+        with WorkloadService._lock:
+            arrays = WorkloadService._arrays
+            if arrays is None or arrays[0] != version:
+                tasks = [i for i, kind in enumerate(kinds) if kind in WORKLOAD_EVENT_KINDS]
+                engineers, codes = np.unique(np.array([events[i][5] for i in tasks], dtype=str),
+                                             return_inverse=True)
+                arrays = WorkloadService._arrays = (
+                    version,
+                    np.array([ordinals[i] for i in tasks], dtype=np.int64),
+                    codes.astype(np.int64),
+                    engineers.tolist()
+                )
+                WorkloadService._forecasts.clear()
+                logger.info(f"Built workload arrays with {len(tasks)} tasks for {len(engineers)} engineers")
+            return arrays
+
+    @staticmethod
+    def get_forecast(weeks: int = DEFAULT_WEEKS, today: date = None) -> Dict[str, Any]:
+        """
+        Count the maintenance tasks due per engineer per week.
+
+        Weeks start on Monday, the first being the current week; only tasks due
+        today or later are counted.
+
+        Args:
+            weeks: Number of weeks to forecast (1 to MAX_WEEKS)
+            today: Date the forecast starts from (default: today)
+
+        Returns:
+            dict: weeks (start dates, DD/MM/YYYY), engineers (name, counts per week and
+            total, busiest first) and totals per week
+
+        Raises:
+            ValueError: If weeks is out of range
+        """
+        if not 1 <= weeks <= MAX_WEEKS:
+            raise ValueError(f"weeks must be between 1 and {MAX_WEEKS}")
+
+        today = today or date.today()
+        version, ordinals, codes, engineers = WorkloadService._get_arrays()
+        key = (version, today, weeks)
+        with WorkloadService._lock:
+            forecast = WorkloadService._forecasts.get(key)
+            if forecast is not None:
+                WorkloadService._forecasts.move_to_end(key)
+                return forecast
+
+        first_week = today - timedelta(days=today.weekday())
+        lo = np.searchsorted(ordinals, today.toordinal(), side='left')
+        hi = np.searchsorted(ordinals, first_week.toordinal() + 7 * weeks, side='left')
+        week_numbers = (ordinals[lo:hi] - first_week.toordinal()) // 7
+        counts = np.bincount(codes[lo:hi] * weeks + week_numbers,
+                             minlength=len(engineers) * weeks).reshape(len(engineers), weeks)
+
+        totals = counts.sum(axis=1)
+        busiest = [i for i in np.argsort(-totals, kind='stable') if totals[i] > 0]
+        forecast = {
+            'weeks': [(first_week + timedelta(weeks=n)).strftime('%d/%m/%Y') for n in range(weeks)],
+            'engineers': [{
+                'engineer': engineers[i],
+                'counts': counts[i].tolist(),
+                'total': int(totals[i])
+            } for i in busiest],
+            'totals': counts.sum(axis=0).tolist()
+        }
+
+        with WorkloadService._lock:
+            WorkloadService._forecasts[key] = forecast
+            while len(WorkloadService._forecasts) > FORECAST_CACHE_SIZE:
+                WorkloadService._forecasts.popitem(last=False)
+        return forecast
@@ -5,6 +5,9 @@
  * 1. Include this script in your HTML
  * 2. Add the 'searchable-select' class to any select element you want to make searchable
  * 3. Optionally add a 'data-placeholder' attribute to customize the search placeholder
+ *
+ * Text inputs with a 'data-suggest-field' attribute (e.g. data-suggest-field="engineer")
+ * get autocomplete suggestions fetched from /api/suggest as the user types.
  */
 document.addEventListener('DOMContentLoaded', function() {
     // Find all select elements with the 'searchable-select' class
@@ -13,6 +16,46 @@ document.addEventListener('DOMContentLoaded', function() {
     selectElements.forEach(function(select) {
         makeSearchable(select);
     });
+
+    document.querySelectorAll('input[data-suggest-field]').forEach(function(input) {
+        attachSuggestions(input);
+    });
+
+    /**
+     * Fills a datalist for a text input with suggestions from the server
+     * @param {HTMLInputElement} input - The input element to suggest values for
+     */
+    function attachSuggestions(input) {
+        const datalist = document.createElement('datalist');
+        datalist.id = `${input.id || input.name}-suggestions`;
+        input.setAttribute('list', datalist.id);
+        input.setAttribute('autocomplete', 'off');
+        input.parentNode.appendChild(datalist);
+
+        let timer = null;
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const prefix = input.value.trim();
+            if (!prefix) {
+                datalist.innerHTML = '';
+                return;
+            }
+            timer = setTimeout(function() {
+                const params = new URLSearchParams({field: input.dataset.suggestField, prefix: prefix, limit: 10});
+                fetch(`/api/suggest?${params}`)
+                    .then(response => response.ok ? response.json() : {suggestions: []})
+                    .then(data => {
+                        datalist.innerHTML = '';
+                        data.suggestions.forEach(function(value) {
+                            const option = document.createElement('option');
+                            option.value = value;
+                            datalist.appendChild(option);
+                        });
+                    })
+                    .catch(() => {});
+            }, 150);
+        });
+    }
     
     /**
      * Makes a select element searchable by adding a search input above it
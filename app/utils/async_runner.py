@@ -0,0 +1,98 @@
+"""
+Shared background event loop for calling async services from sync code.
+
+Each process runs one event loop in a daemon thread, started on first use. Sync
+Flask views submit coroutines to it with run_coroutine(), so no request creates or
+tears down an event loop. Long-running background work (the reminder scheduler)
+runs on its own loop instead, so it never delays a request.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default seconds a sync caller waits for a coroutine; below gunicorn's 30 s worker
+# timeout, so a slow coroutine fails the request instead of getting the worker killed
+DEFAULT_TIMEOUT = 20
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the shared event loop of this process, starting its thread if needed.
+
+    A loop inherited through fork() has no thread running it in the child, so a new
+    one is started per process.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running shared loop
+    """
+    global _loop, _thread, _pid
+    if _loop is not None and _pid == os.getpid() and _thread.is_alive():
+        return _loop
+
+    with _lock:
+        if _loop is None or _pid != os.getpid() or not _thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_run_loop, args=(_loop,), name='async-runner', daemon=True)
+            _thread.start()
+            _pid = os.getpid()
+            logger.debug(f"Started shared event loop in process {_pid}")
+        return _loop
+
+
+def run_coroutine(coro: Awaitable[Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> Any:
+    """
+    Run a coroutine on the shared event loop and wait for its result.
+
+    Must not be called from the shared loop's own thread.
+
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait for the result; None waits indefinitely
+
+    Returns:
+        The coroutine's result
+
+    Raises:
+        TimeoutError: If the coroutine did not finish in time (it is cancelled)
+        Exception: Whatever the coroutine raised
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("run_coroutine() cannot be called from the shared event loop thread")
+
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Coroutine did not finish within {timeout} seconds")
+
+
+def shutdown(timeout: float = 5):
+    """Stop the shared event loop of this process, if it is running."""
+    global _loop, _thread, _pid
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = _pid = None
+    if loop is not None and thread.is_alive():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
@@ -0,0 +1,44 @@
+"""
+gzip compression of API responses negotiated via Accept-Encoding.
+"""
+import gzip
+
+from flask import Response, request
+
+# Responses smaller than this are sent as they are; gzip would barely help
+MIN_COMPRESS_SIZE = 1024
+
+COMPRESS_LEVEL = 6
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/csv', 'text/plain', 'text/html', 'text/calendar')
+
+
+def gzip_response(response: Response) -> Response:
+    """
+    Compress a response body with gzip if the client accepts it.
+
+    Streamed and file responses, responses that already have a Content-Encoding
+    or an ETag (whose value would then depend on the encoding) and small or
+    non-text bodies are left unchanged.
+
+    Args:
+        response: Response to compress (e.g. from an after_request handler)
+
+    Returns:
+        Response: The same response, compressed if applicable
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or 'ETag' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or not request.accept_encodings['gzip']):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,115 @@
+"""
+Minimal cron schedule parser.
+
+Supports the standard five fields (minute, hour, day of month, month, day of week)
+with '*', single values, ranges ('1-5'), lists ('1,15') and steps ('*/15', '8-18/2').
+Day of week runs from 0 (Sunday) to 6, and 7 is accepted for Sunday too. As in cron,
+when both day of month and day of week are restricted, a day matching either fires.
+"""
+from datetime import datetime, timedelta
+from typing import Set
+
+# Days searched for the next fire time before giving up (covers Feb 29 schedules)
+MAX_SEARCH_DAYS = 366 * 8
+
+FIELD_RANGES = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day of month', 1, 31),
+    ('month', 1, 12),
+    ('day of week', 0, 7),
+)
+
+
+def _parse_field(spec: str, name: str, low: int, high: int) -> Set[int]:
+    """Parse one cron field into the set of values it matches."""
+    values = set()
+    for part in spec.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            if not step_text.isdigit() or int(step_text) < 1:
+                raise ValueError(f"Invalid step in cron {name} field: {spec}")
+            step = int(step_text)
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            if not (start_text.isdigit() and end_text.isdigit()):
+                raise ValueError(f"Invalid range in cron {name} field: {spec}")
+            start, end = int(start_text), int(end_text)
+        elif part.isdigit():
+            start = int(part)
+            end = high if step > 1 else start
+        else:
+            raise ValueError(f"Invalid cron {name} field: {spec}")
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron {name} field out of range ({low}-{high}): {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """A parsed cron expression that computes its next fire time."""
+
+    def __init__(self, expression: str):
+        """
+        Args:
+            expression: Cron expression, e.g. '0 7 * * *' for daily at 07:00
+
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(spec, name, low, high) for spec, (name, low, high) in zip(fields, FIELD_RANGES)
+        )
+        # Cron counts Sunday as 0 or 7, Python as weekday 6
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+        self._sorted_hours = sorted(self.hours)
+        self._sorted_minutes = sorted(self.minutes)
+
+    def _matches_day(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = day.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        Get the first fire time strictly after a given time.
+
+        Args:
+            after: Reference time (naive local time)
+
+        Returns:
+            datetime: The next fire time, with seconds and microseconds zeroed
+
+        Raises:
+            ValueError: If the schedule never fires (e.g. '0 0 31 2 *')
+        """
+        start = after.replace(second=0, microsecond=0)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(MAX_SEARCH_DAYS):
+            if self._matches_day(day):
+                for hour in self._sorted_hours:
+                    for minute in self._sorted_minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate > after:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def __repr__(self):
+        return f"CronSchedule({self.expression!r})"
@@ -0,0 +1,53 @@
+"""
+Date that equipment status is evaluated on.
+
+Within a request the date is read once, from the ``as_of`` query parameter
+(YYYY-MM-DD) or the clock, and kept in the request's WSGI environ so every
+status computed for that request uses the same date, even across midnight.
+Outside a request it is today's date.
+"""
+from datetime import date
+from typing import Optional
+
+from flask import has_request_context, request
+
+# Key of the evaluation date in the WSGI environ
+ENVIRON_KEY = 'app.evaluation_date'
+
+
+def parse_as_of(value: Optional[str]) -> date:
+    """
+    Parse an as_of value.
+
+    Args:
+        value: Date in YYYY-MM-DD format, or empty for today
+
+    Returns:
+        date: The evaluation date
+
+    Raises:
+        ValueError: If the value is not a valid YYYY-MM-DD date
+    """
+    if not value or not value.strip():
+        return date.today()
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Invalid as_of date: {value}. Expected format: YYYY-MM-DD")
+
+
+def get_evaluation_date() -> date:
+    """
+    Get the evaluation date of the current request.
+
+    Returns:
+        date: The request's as_of date or the date the request started; today outside a request
+
+    Raises:
+        ValueError: If the request's as_of parameter is invalid
+    """
+    if not has_request_context():
+        return date.today()
+    if ENVIRON_KEY not in request.environ:
+        request.environ[ENVIRON_KEY] = parse_as_of(request.args.get('as_of'))
+    return request.environ[ENVIRON_KEY]
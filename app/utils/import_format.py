@@ -0,0 +1,260 @@
+"""
+Single-pass format detection for import files.
+
+Only the first few KB of a CSV file are inspected to determine the text encoding,
+the delimiter, the dataset type (PPM, OCM or training, by header signature) and
+the mapping of the file's headers to the canonical import columns. The returned
+ImportFormat then streams rows with that configuration and decodes them strictly,
+so a byte past the sample that does not fit the encoding is caught while reading
+instead of being silently replaced.
+"""
+import codecs
+import csv
+import logging
+import re
+from typing import Dict, Iterator, List, Optional
+
+from app.utils.spreadsheet import is_xlsx, iter_xlsx_rows, read_xlsx_header
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes inspected to detect the format of a CSV file
+SNIFF_BYTES = 64 * 1024
+
+# Encodings tried in order; latin-1 decodes any byte sequence so it is the last resort
+CANDIDATE_ENCODINGS = ('utf-8-sig', 'cp1252', 'latin-1')
+
+CANDIDATE_DELIMITERS = ',;\t|'
+
+# Canonical equipment import columns and the alternative spellings accepted for them
+EQUIPMENT_HEADER_ALIASES = {
+    'EQUIPMENT': ['equipment', 'equipment name', 'device'],
+    'MODEL': ['model'],
+    'MFG_SERIAL': ['mfg serial', 'serial', 'serial no', 'serial number', 'mfg serial no'],
+    'MANUFACTURER': ['manufacturer', 'mfg', 'make'],
+    'LOG_NO': ['log no', 'log number', 'log'],
+    'DEPARTMENT': ['department', 'dept'],
+    'PPM': ['ppm'],
+    'OCM': ['ocm'],
+    'PPM Q I': ['ppm q i', 'ppm q1', 'q1 date', 'q1'],
+    'PPM Q II': ['ppm q ii', 'ppm q2', 'q2 date', 'q2'],
+    'PPM Q III': ['ppm q iii', 'ppm q3', 'q3 date', 'q3'],
+    'PPM Q IV': ['ppm q iv', 'ppm q4', 'q4 date', 'q4'],
+    'Q1_ENGINEER': ['q1 engineer'],
+    'Q2_ENGINEER': ['q2 engineer'],
+    'Q3_ENGINEER': ['q3 engineer'],
+    'Q4_ENGINEER': ['q4 engineer'],
+    'Last_Date': ['last date', 'last service date'],
+    'Next_Date': ['next date', 'next service date'],
+    'ENGINEER': ['engineer'],
+    'INSTALLATION_DATE': ['installation date', 'install date'],
+    'WARRANTY_END': ['warranty end', 'end of warranty', 'warranty end date'],
+}
+
+# Header signatures used to tell the dataset types apart
+DATASET_SIGNATURES = {
+    'ppm': {'PPM', 'PPM Q I', 'PPM Q II', 'Q1_ENGINEER', 'Q2_ENGINEER'},
+    'ocm': {'OCM', 'Last_Date', 'Next_Date', 'ENGINEER'},
+    'training': {'NAME', 'ID', 'MACHINE 1', 'MACHINE 1 TRAINER'},
+}
+
+
+def _header_key(header: str) -> str:
+    """Normalize a header for alias lookup, e.g. 'Mfg_Serial ' -> 'mfg serial'."""
+    return ' '.join(re.split(r'[\s_\-]+', header.strip().lower())).strip()
+
+
+_ALIAS_LOOKUP = {_header_key(alias): canonical
+                 for canonical, aliases in EQUIPMENT_HEADER_ALIASES.items()
+                 for alias in aliases + [canonical]}
+
+
+def normalize_training_column(col: str) -> str:
+    """Normalize a training import header, e.g. 'machine_1_trainer' -> 'MACHINE 1 TRAINER'."""
+    return ' '.join(col.replace('_', ' ').upper().split())
+
+
+def map_headers(headers: List[str], data_type: str) -> Dict[str, str]:
+    """
+    Map the headers of a file to the canonical import columns.
+
+    Args:
+        headers: Headers as they appear in the file
+        data_type: Dataset type ('ppm', 'ocm' or 'training')
+
+    Returns:
+        dict: Mapping of file header to canonical column; unknown headers map to themselves
+    """
+    if data_type == 'training':
+        return {h: normalize_training_column(h) for h in headers if h}
+    return {h: _ALIAS_LOOKUP.get(_header_key(h), h.strip()) for h in headers if h}
+
+
+def detect_dataset_type(headers: List[str]) -> Optional[str]:
+    """
+    Determine the dataset type of a file from its header signature.
+
+    Args:
+        headers: Headers as they appear in the file
+
+    Returns:
+        str: 'ppm', 'ocm' or 'training', or None if the headers match no signature
+    """
+    equipment_columns = set(map_headers(headers, 'ppm').values())
+    training_columns = set(map_headers(headers, 'training').values())
+
+    scores = {
+        'ppm': len(DATASET_SIGNATURES['ppm'] & equipment_columns),
+        'ocm': len(DATASET_SIGNATURES['ocm'] & equipment_columns),
+        'training': len(DATASET_SIGNATURES['training'] & training_columns),
+    }
+    # Equipment files must carry the serial number, training files the employee ID
+    if 'MFG_SERIAL' not in equipment_columns:
+        scores['ppm'] = scores['ocm'] = 0
+    if not {'NAME', 'ID'} <= training_columns:
+        scores['training'] = 0
+
+    best = max(scores, key=scores.get)
+    return best if scores[best] else None
+
+
+def _detect_encoding(sample: bytes) -> str:
+    """Get the first candidate encoding that decodes the sample."""
+    for encoding in CANDIDATE_ENCODINGS:
+        # Incremental decoding tolerates a multi-byte character cut off at the end of the sample
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1'
+
+
+def _next_encoding(encoding: str) -> Optional[str]:
+    """Get the candidate encoding tried after another one, if any."""
+    index = CANDIDATE_ENCODINGS.index(encoding) if encoding in CANDIDATE_ENCODINGS else len(CANDIDATE_ENCODINGS)
+    return CANDIDATE_ENCODINGS[index + 1] if index + 1 < len(CANDIDATE_ENCODINGS) else None
+
+
+def _detect_delimiter(text: str) -> str:
+    """Get the delimiter of a CSV sample, falling back to the most frequent candidate in the header."""
+    lines = text.splitlines()
+    # Drop the last line, it may be cut off by the sample size
+    sample = '\n'.join(lines[:-1] if len(lines) > 1 else lines)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        header_line = lines[0] if lines else ''
+        return max(CANDIDATE_DELIMITERS, key=header_line.count) if header_line.strip() else ','
+
+
+class ImportFormat:
+    """Detected format of an import file, with a streaming reader configured for it."""
+
+    def __init__(self, file_path: str, data_type: Optional[str], headers: List[str],
+                 encoding: Optional[str] = None, delimiter: Optional[str] = None):
+        self.file_path = file_path
+        self.data_type = data_type
+        self.headers = headers
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.header_map = map_headers(headers, data_type) if data_type else {h: h for h in headers if h}
+
+    @property
+    def is_xlsx(self) -> bool:
+        return self.encoding is None
+
+    @property
+    def columns(self) -> List[str]:
+        """Canonical columns present in the file."""
+        return list(self.header_map.values())
+
+    def iter_rows(self) -> Iterator[Dict[str, str]]:
+        """
+        Stream the rows of the file keyed by canonical column.
+
+        Yields:
+            dict: One row at a time, with every value as a string
+        """
+        header_map = self.header_map
+        if self.is_xlsx:
+            for row in iter_xlsx_rows(self.file_path):
+                yield {header_map.get(k, k): v for k, v in row.items()}
+            return
+
+        # Rows already yielded are skipped when reading restarts with another encoding
+        yielded = 0
+        ascii_only = True
+        while True:
+            try:
+                with open(self.file_path, 'r', encoding=self.encoding, newline='') as f:
+                    reader = csv.DictReader(f, delimiter=self.delimiter)
+                    seen = 0
+                    for row in reader:
+                        if not any(row.values()):
+                            continue
+                        seen += 1
+                        if seen <= yielded:
+                            continue
+                        values = {header_map.get(k, k): (v or '').strip() for k, v in row.items() if k is not None}
+                        ascii_only = ascii_only and all(v.isascii() for v in values.values())
+                        yielded += 1
+                        yield values
+                return
+            except UnicodeDecodeError as e:
+                # ASCII reads the same in every candidate, so if only ASCII rows were yielded
+                # the file can be read on with the next candidate encoding
+                next_encoding = _next_encoding(self.encoding)
+                with open(self.file_path, 'rb') as f:
+                    has_bom = f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8
+                if next_encoding is None or not ascii_only or has_bom:
+                    raise ValueError(f"The file is not valid {self.encoding} after row {yielded + 1}: {str(e)}. "
+                                     f"Save it as UTF-8 and upload it again.") from e
+                logger.info(f"{self.file_path} is not valid {self.encoding} past the first {SNIFF_BYTES} bytes, "
+                            f"reading on as {next_encoding}")
+                self.encoding = next_encoding
+
+    def __repr__(self):
+        return (f"ImportFormat(data_type={self.data_type!r}, encoding={self.encoding!r}, "
+                f"delimiter={self.delimiter!r}, columns={len(self.headers)})")
+
+
+def detect_format(file_path: str, data_type: Optional[str] = None) -> ImportFormat:
+    """
+    Detect the format of a CSV or XLSX import file from its first few KB.
+
+    Args:
+        file_path: Path to the file
+        data_type: Expected dataset type; detected from the header signature if not given
+
+    Returns:
+        ImportFormat: The detected format
+
+    Raises:
+        ValueError: If the file is empty or the dataset type cannot be determined
+    """
+    if is_xlsx(file_path):
+        headers = read_xlsx_header(file_path)
+        encoding = delimiter = None
+    else:
+        with open(file_path, 'rb') as f:
+            sample = f.read(SNIFF_BYTES)
+        encoding = _detect_encoding(sample)
+        text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+        delimiter = _detect_delimiter(text)
+        header_line = text.splitlines()[0] if text.strip() else ''
+        headers = next(csv.reader([header_line], delimiter=delimiter), [])
+        headers = [h.strip() for h in headers]
+
+    if not any(headers):
+        raise ValueError("The uploaded file is empty.")
+
+    if data_type is None:
+        data_type = detect_dataset_type(headers)
+        if data_type is None:
+            raise ValueError("Could not determine if the file contains PPM, OCM or training data.")
+
+    import_format = ImportFormat(file_path, data_type, headers, encoding, delimiter)
+    logger.info(f"Detected import format for {file_path}: {import_format}")
+    return import_format
@@ -0,0 +1,104 @@
+"""
+Field projection and compact encoding of JSON records.
+
+``?fields=`` takes a comma-separated list of field paths; nested values are
+addressed with dots (e.g. ``MFG_SERIAL,PPM_Q_I.date``). The compact encoding
+sends the column names once followed by one array of values per record.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+ENCODINGS = ('records', 'compact')
+
+
+def parse_fields(value: Optional[str]) -> List[str]:
+    """
+    Parse a fields parameter.
+
+    Args:
+        value: Comma-separated field paths, or empty for all fields
+
+    Returns:
+        list: Field paths in the order given, without duplicates
+
+    Raises:
+        ValueError: If a path has an empty part, or a path and one of its sub-paths
+            are both requested (e.g. ``PPM_Q_I,PPM_Q_I.date``)
+    """
+    fields = list(dict.fromkeys(field.strip() for field in (value or '').split(',') if field.strip()))
+    for field in fields:
+        if not all(field.split('.')):
+            raise ValueError(f"Invalid field path: {field}")
+    for field in fields:
+        for other in fields:
+            if other.startswith(field + '.'):
+                raise ValueError(f"Field '{field}' conflicts with its sub-field '{other}'")
+    return fields
+
+
+def get_path(record: Dict[str, Any], path: str) -> Any:
+    """
+    Get the value at a dotted path of a record.
+
+    Returns:
+        The value, or None if any part is missing
+
+    Raises:
+        ValueError: If the path goes through a value that is not an object
+    """
+    value: Any = record
+    parts = path.split('.')
+    for depth, key in enumerate(parts):
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            raise ValueError(f"Field path '{path}' goes through '{'.'.join(parts[:depth])}', which is not an object")
+        value = value.get(key)
+    return value
+
+
+def project(record: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """
+    Keep only some fields of a record.
+
+    Args:
+        record: Record to project
+        fields: Field paths; dotted paths keep their nesting
+
+    Returns:
+        dict: The projected record, with None for missing fields
+
+    Raises:
+        ValueError: If a path goes through a value that is not an object
+    """
+    projected: Dict[str, Any] = {}
+    for path in fields:
+        *parents, key = path.split('.')
+        target = projected
+        for parent in parents:
+            # Copy rather than write into a nested dict that may belong to the record
+            child = target.get(parent)
+            target[parent] = dict(child) if isinstance(child, dict) else {}
+            target = target[parent]
+        target[key] = get_path(record, path)
+    return projected
+
+
+def to_compact(records: Iterable[Dict[str, Any]], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Encode records as a column header plus one row of values per record.
+
+    Args:
+        records: Records to encode
+        fields: Field paths to use as columns (default: every top-level key, in
+            order of first appearance)
+
+    Returns:
+        dict: {'columns': [...], 'rows': [[...], ...]}
+    """
+    records = list(records)
+    if not fields:
+        fields = list(dict.fromkeys(key for record in records for key in record))
+    return {
+        'columns': fields,
+        'rows': [[get_path(record, path) for path in fields] for record in records]
+    }
@@ -0,0 +1,110 @@
+"""
+Utility functions for streaming rows to and from Excel workbooks.
+
+Workbooks are read with openpyxl's read-only mode and written with XlsxWriter's
+constant_memory mode, so neither direction holds the whole sheet in memory.
+"""
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def is_xlsx(filename):
+    """Check if a filename refers to an Excel workbook."""
+    return filename.lower().endswith(XLSX_EXTENSIONS)
+
+
+def cell_to_str(value: Any) -> str:
+    """
+    Convert a worksheet cell value to the string form used by the CSV importers.
+
+    Args:
+        value: Raw cell value from openpyxl
+
+    Returns:
+        str: Dates as DD/MM/YYYY, whole numbers without a decimal part, '' for empty cells
+    """
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def iter_xlsx_rows(file_path: str) -> Iterator[Dict[str, str]]:
+    """
+    Stream the rows of the first worksheet as dictionaries keyed by header.
+
+    Args:
+        file_path: Path to the .xlsx file
+
+    Yields:
+        dict: One row at a time, with every value converted to a string
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header_row = next(rows, None)
+        if header_row is None:
+            return
+        headers = [cell_to_str(h) for h in header_row]
+
+        for values in rows:
+            # Skip trailing rows that only carry formatting
+            if values is None or all(v is None or v == '' for v in values):
+                continue
+            yield {header: cell_to_str(value) for header, value in zip(headers, values) if header}
+    finally:
+        workbook.close()
+
+
+def read_xlsx_header(file_path: str) -> List[str]:
+    """Read only the header row of the first worksheet."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        header_row = next(workbook.active.iter_rows(max_row=1, values_only=True), None)
+        return [cell_to_str(h) for h in header_row] if header_row else []
+    finally:
+        workbook.close()
+
+
+def write_xlsx(file_path: str, columns: List[str], rows: Iterable[Dict[str, Any]], sheet_name: str = 'Sheet1') -> int:
+    """
+    Write rows to an Excel workbook in constant-memory mode.
+
+    Rows are flushed to disk as they are written, so the generator feeding this
+    function is consumed one row at a time.
+
+    Args:
+        file_path: Destination path of the .xlsx file
+        columns: Column order of the header row
+        rows: Iterable of row dictionaries
+        sheet_name: Name of the worksheet
+
+    Returns:
+        int: Number of data rows written
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(file_path, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({'bold': True})
+        worksheet.write_row(0, 0, columns, header_format)
+
+        count = 0
+        for count, row in enumerate(rows, start=1):
+            worksheet.write_row(count, 0, ['' if row.get(col) is None else row.get(col) for col in columns])
+        return count
+    finally:
+        workbook.close()
@@ -35,4 +35,34 @@ tmp_upload_dir = None
 
 # SSL (if needed)
 keyfile = None
-certfile = None 
\ No newline at end of file
+certfile = None
+
+# Server hooks
+_scheduler_process = None
+
+
+def when_ready(server):
+    """Start the reminder scheduler in its own process, next to the web workers."""
+    global _scheduler_process
+    import subprocess
+    import sys
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_scheduler.py')
+    _scheduler_process = subprocess.Popen([sys.executable, script])
+    server.log.info(f"Started reminder scheduler process {_scheduler_process.pid}")
+
+
+def on_exit(server):
+    """Stop the reminder scheduler process with the arbiter."""
+    if _scheduler_process is None or _scheduler_process.poll() is not None:
+        return
+    _scheduler_process.terminate()
+    try:
+        _scheduler_process.wait(timeout=30)
+    except Exception:
+        _scheduler_process.kill()
+
+
+def worker_exit(server, worker):
+    """Stop the background event loop of an exiting worker."""
+    from app.utils.async_runner import shutdown
+    shutdown()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Reminder scheduler entry point for the AL ORF Maintenance application.
+Gunicorn starts this process from its arbiter (see gunicorn.conf.py), so
+reminders and outbox deliveries never run inside the web workers.
+"""
+import os
+import signal
+import sys
+from app import create_app, start_email_scheduler
+from app.services.scheduler import SchedulerService
+
+# Create the Flask application instance for configuration and logging
+application = create_app(os.environ.get('FLASK_ENV', 'production'))
+
+# Seconds a stopping scheduler gets to finish its current step before the process exits;
+# the OS drops the leader lock on exit and the outbox requeues interrupted claims
+STOP_GRACE_SECONDS = 5
+
+
+def _stop(signum, frame):
+    SchedulerService.stop()
+    thread = SchedulerService._thread
+    if thread:
+        thread.join(STOP_GRACE_SECONDS)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    thread = start_email_scheduler()
+    if thread:
+        application.logger.info("Email scheduler started in scheduler process")
+        # Join in short steps so the signal handlers get to run
+        while thread.is_alive():
+            thread.join(1)
@@ -34,3 +34,21 @@ def sample_data():
         "LOG_NO": "123456",
         "PPM": "Yes"}
     return sample_ppm
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point the data files at a temporary directory."""
+    from app.config import Config
+
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(Config, 'PPM_JSON_PATH', str(tmp_path / 'ppm.json'))
+    monkeypatch.setattr(Config, 'OCM_JSON_PATH', str(tmp_path / 'ocm.json'))
+    monkeypatch.setattr(Config, 'TRAINING_JSON_PATH', str(tmp_path / 'training.json'))
+    monkeypatch.setattr(Config, 'IMPORT_STATE_PATH', str(tmp_path / 'import_state.json'))
+    monkeypatch.setattr(Config, 'IMPORT_PREVIEW_DIR', str(tmp_path / 'import_previews'))
+    monkeypatch.setattr(Config, 'EMAIL_OUTBOX_PATH', str(tmp_path / 'email_outbox.sqlite3'))
+    monkeypatch.setattr(Config, 'REMINDER_LEDGER_PATH', str(tmp_path / 'reminder_ledger.sqlite3'))
+    monkeypatch.setattr(Config, 'SCHEDULER_STATE_PATH', str(tmp_path / 'scheduler_state.json'))
+    DataService.ensure_data_files_exist()
+    return tmp_path
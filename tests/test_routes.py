@@ -143,23 +143,20 @@ class TestApiRoutes:
 
     def test_import_data(self, app_test_client, tmp_path):
         """Test importing data from CSV."""
-        mock_file = Mock()
-        mock_file.filename = "test.csv"
-        mock_file.read.return_value = b"Test CSV Content"
-        
         test_file_path = tmp_path / "test.csv"
         test_file_path.write_text("test;csv;content")
+        summary = {"success": 1, "skipped": 0, "errors": 0, "added": 1, "updated": 0, "unchanged": 0,
+                   "error_details": []}
 
-        with patch.object(ImportExportService, "import_from_csv", return_value=(True, "Import success", {})):
-             with patch("app.routes.api.request") as mock_request:
-                mock_request.files = {"file": mock_file}
-                response = app_test_client.post(
-                    "/api/import/ppm", data={"file": (test_file_path.open('rb'), "test.csv")}
-                )
-                assert response.status_code == 200
-                assert response.is_json
-                data = json.loads(response.data)
-                assert data["message"] == "Import success"
+        with patch.object(DataService, "plan_import", return_value={}), \
+                patch.object(DataService, "commit_import", return_value=summary):
+            response = app_test_client.post(
+                "/api/import/ppm", data={"file": (test_file_path.open('rb'), "test.csv")}
+            )
+            assert response.status_code == 200
+            assert response.is_json
+            data = json.loads(response.data)
+            assert data["stats"]["added"] == 1
 
 
 def test_get_equipment_invalid_type(app_test_client):
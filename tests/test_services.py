@@ -1,13 +1,25 @@
+import io
 import json
+import os
+import socket
+import subprocess
+import sys
 import tempfile
+import time
+import zipfile
+from email.message import EmailMessage
 from unittest.mock import patch, MagicMock
 
 import pytest
 
 from app.services.data_service import DataService
 from app.services.email_service import EmailService
-from app.services.import_export import ImportExportService
+from app.services.import_export import BACKUP_SECTIONS, ImportExportService
+from app.services.mail_transport import SMTPConnectionPool
+from app.services.scheduler import LeaderLock
 from app.services.validation import ValidationService
+from app.models.ppm import PPMEntry
+from app.utils.import_format import detect_format
 
 
 @pytest.fixture
@@ -142,7 +154,7 @@ def test_reindex(mock_data_service):
 @pytest.fixture
 def mock_email_service():
     """Fixture for mocking EmailService."""
-    with patch("app.services.email_service.smtplib.SMTP") as MockSMTP:
+    with patch("app.services.mail_transport.smtplib.SMTP") as MockSMTP:
         email_service = EmailService()
         email_service.smtp_server = "smtp.example.com"  # Replace with a placeholder
         email_service.smtp_port = 587  # Replace with a placeholder
@@ -183,3 +195,952 @@ def test_process_reminders(mock_email_service, mock_data_service):
     ])
     mock_email_service.process_reminders(data_service=mock_data_service)
     mock_email_service.send_reminder_email.assert_called_once()
+
+
+PPM_CSV_HEADER = "EQUIPMENT,MODEL,MFG_SERIAL,MANUFACTURER,LOG_NO,DEPARTMENT,PPM,PPM Q I,Q1_ENGINEER,Q2_ENGINEER,Q3_ENGINEER,Q4_ENGINEER\n"
+
+
+def test_import_data_reports_added_updated_unchanged(data_dir):
+    """Test that re-importing only touches changed rows."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_text(PPM_CSV_HEADER +
+                        "Ventilator,V1,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n"
+                        "Monitor,M1,SN2,Acme,L2,ER,Yes,01/02/2024,A,B,C,D\n")
+    result = DataService.import_data('ppm', str(csv_path))
+    assert (result['added'], result['updated'], result['unchanged']) == (2, 0, 0)
+
+    version = DataService.get_data_version('ppm')
+    result = DataService.import_data('ppm', str(csv_path))
+    assert result.get('identical_file') is True
+    assert result['unchanged'] == 2
+    assert DataService.get_data_version('ppm') == version
+
+    csv_path.write_text(PPM_CSV_HEADER +
+                        "Ventilator,V2,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n"
+                        "Monitor,M1,SN2,Acme,L2,ER,Yes,01/02/2024,A,B,C,D\n"
+                        "Pump,P1,SN3,Acme,L3,OR,Yes,01/03/2024,A,B,C,D\n")
+    with patch("app.services.data_service.PPMEntry", wraps=PPMEntry) as model:
+        result = DataService.import_data('ppm', str(csv_path))
+    assert (result['added'], result['updated'], result['unchanged']) == (1, 1, 1)
+    assert model.call_count == 2
+    assert DataService.get_entry('ppm', 'SN1')['MODEL'] == 'V2'
+
+
+def test_import_dry_run_preview_and_commit(data_dir):
+    """Test that a dry-run import writes nothing and its cached plan can be committed."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_text(PPM_CSV_HEADER + "Ventilator,V1,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n")
+    DataService.import_data('ppm', str(csv_path))
+
+    csv_path.write_text(PPM_CSV_HEADER +
+                        "Ventilator,V2,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n"
+                        "Pump,P1,SN3,Acme,L3,OR,Yes,01/03/2024,A,B,C,D\n"
+                        "Pump,P2,,Acme,L4,OR,Yes,01/03/2024,A,B,C,D\n")
+    version = DataService.get_data_version('ppm')
+    preview = DataService.import_data('ppm', str(csv_path), dry_run=True)
+    assert DataService.get_data_version('ppm') == version
+    assert preview['total'] == 3
+    assert [item['action'] for item in preview['items']] == ['new', 'changed', 'rejected']
+    assert preview['items'][1]['changes'] == {'MODEL': {'old': 'V1', 'new': 'V2'}}
+
+    page = DataService.get_import_preview_page(preview['token'], page=2, per_page=1)
+    assert page['pages'] == 3 and page['items'][0]['key'] == 'SN1'
+
+    csv_path.unlink()
+    summary = DataService.commit_import_preview(preview['token'])
+    assert (summary['added'], summary['updated'], summary['skipped']) == (1, 1, 1)
+    assert DataService.get_entry('ppm', 'SN1')['MODEL'] == 'V2'
+    assert DataService.load_import_preview(preview['token']) is None
+
+
+def test_import_preview_cache_is_bounded_and_expires(data_dir, monkeypatch):
+    """Test that in-memory previews are LRU bounded and expire even when cached in memory."""
+    from app.services import data_service
+
+    monkeypatch.setattr(data_service, 'IMPORT_PREVIEW_CACHE_SIZE', 1)
+    first = DataService.save_import_preview({'rows': 1})
+    second = DataService.save_import_preview({'rows': 2})
+    assert list(data_service._import_previews) == [second]
+    assert DataService.load_import_preview(first) == {'rows': 1}
+    assert list(data_service._import_previews) == [first]
+
+    monkeypatch.setattr(data_service, 'IMPORT_PREVIEW_TTL', -1)
+    assert DataService.load_import_preview(first) is None
+    assert not (data_dir / 'import_previews' / f'{first}.json').exists()
+
+
+def test_training_import_rows_numbered_from_header(data_dir):
+    """Test that training rows are numbered like equipment rows, the header being row 1."""
+    csv_path = data_dir / "training.csv"
+    csv_path.write_text("NAME,ID,DEPARTMENT\nBob,,ER\n")
+    assert DataService.plan_training_import(str(csv_path))['rejected'][0]['row'] == 2
+
+
+def test_detect_format_semicolon_cp1252(data_dir):
+    """Test that encoding, delimiter, dataset type and header aliases are detected in one pass."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_bytes("Equipment;Model;Serial Number;Manufacturer;Log No;Dept;PPM;PPM Q1;Q1 Engineer\n"
+                         "Défibrillateur;D1;SN9;Acme;L9;ER;Yes;01/01/2024;Zoë\n".encode('cp1252'))
+
+    import_format = detect_format(str(csv_path))
+    assert (import_format.data_type, import_format.encoding, import_format.delimiter) == ('ppm', 'cp1252', ';')
+    row = next(import_format.iter_rows())
+    assert row['MFG_SERIAL'] == 'SN9' and row['EQUIPMENT'] == 'Défibrillateur' and row['PPM Q I'] == '01/01/2024'
+
+    result = DataService.import_data('ppm', str(csv_path), import_format=import_format)
+    assert result['added'] == 1
+    assert DataService.get_entry('ppm', 'SN9')['PPM_Q_I']['engineer'] == 'Zoë'
+
+
+def test_detect_format_non_utf8_byte_past_sample(data_dir):
+    """Test that a byte invalid in the sampled encoding past SNIFF_BYTES is decoded strictly."""
+    from app.utils.import_format import SNIFF_BYTES
+
+    csv_path = data_dir / "import.csv"
+    filler = "".join(f"Pump,P1,SN{i},Acme,L{i},OR,Yes,01/03/2024,A,B,C,D\n" for i in range(SNIFF_BYTES // 40))
+    last_row = "Défibrillateur,D1,SNX,Acme,LX,ER,Yes,01/01/2024,A,B,C,D\n"
+    csv_path.write_bytes((PPM_CSV_HEADER + filler + last_row).encode('cp1252'))
+
+    # Only ASCII rows came before the invalid byte, so reading goes on as cp1252
+    import_format = detect_format(str(csv_path))
+    assert import_format.encoding == 'utf-8-sig'
+    rows = list(import_format.iter_rows())
+    assert import_format.encoding == 'cp1252'
+    assert len(rows) == SNIFF_BYTES // 40 + 1 and rows[-1]['EQUIPMENT'] == 'Défibrillateur'
+    assert not any('\ufffd' in value for row in rows for value in row.values())
+
+    # Rows already read as UTF-8 would read differently, so a mixed file is rejected
+    csv_path.write_bytes((PPM_CSV_HEADER + "Zoë,Z1,SNZ,Acme,LZ,ER,Yes,01/01/2024,A,B,C,D\n" + filler).encode('utf-8')
+                         + last_row.encode('cp1252'))
+    with pytest.raises(ValueError, match='not valid utf-8-sig'):
+        list(detect_format(str(csv_path)).iter_rows())
+
+
+def test_restore_from_zip_is_all_or_nothing(data_dir):
+    """Test that a backup archive is restored completely or not at all."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_text(PPM_CSV_HEADER + "Ventilator,V1,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n")
+    DataService.import_data('ppm', str(csv_path))
+    ocm_csv = ("EQUIPMENT,MODEL,MFG_SERIAL,MANUFACTURER,LOG_NO,DEPARTMENT,OCM,Last_Date,ENGINEER\n"
+               "Scope,S1,OC1,Acme,L5,ER,Yes,01/05/2024,Eve\n")
+    training_csv = "NAME,ID,DEPARTMENT,TRAINER,machine1,machine1_trainer,total_trained\nBob,E1,ER,Ann,True,Ann,1\n"
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('ppm_data.csv', DataService.export_data('ppm').replace('V1', 'V2'))
+        zip_file.writestr('ocm_data.csv', ocm_csv + "Scope,S2,OC2,Acme,L6,ER,Yes,,Eve\n")
+        zip_file.writestr('training_data.csv', training_csv)
+    success, _, stats = ImportExportService.restore_from_zip(archive)
+    assert not success and len(stats['error_details']) == 1
+    assert DataService.get_entry('ppm', 'SN1')['MODEL'] == 'V1'
+    assert DataService.load_data('ocm') == [] and DataService.load_data('training') == []
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('ppm_data.csv', DataService.export_data('ppm').replace('V1', 'V2'))
+        zip_file.writestr('ocm_data.csv', ocm_csv)
+        zip_file.writestr('training_data.csv', training_csv)
+    success, _, stats = ImportExportService.restore_from_zip(archive)
+    assert success and (stats['ppm'], stats['ocm'], stats['training']) == (1, 1, 1)
+    assert DataService.get_entry('ppm', 'SN1')['MODEL'] == 'V2'
+    assert DataService.get_entry('ocm', 'OC1')['Next_Date'] == '01/05/2025'
+    assert DataService.load_data('training')[0]['machine1'] is True
+    assert list(data_dir.glob('*.restore')) == [] and list(data_dir.glob('*.rollback')) == []
+
+
+def test_backup_restore_round_trip_keeps_records(data_dir):
+    """Test that restoring a backup gives back every stored field unchanged."""
+    from app.models.ocm import OCMEntry
+
+    quarters = {f'PPM_Q_{roman}': {'date': day, 'engineer': engineer} for roman, day, engineer in
+                [('I', '10/01/2026', 'A'), ('II', '15/04/2026', 'B'), ('III', '20/07/2026', 'n/a'), ('IV', '01/10/2026', 'D')]}
+    ppm = [PPMEntry(NO=1, EQUIPMENT='Ventilator', MODEL='V1', MFG_SERIAL='SN1', MANUFACTURER='Acme', LOG_NO='L1',
+                    DEPARTMENT='LDR', PPM='Yes', installation_date='01/02/2020', status_override='Overdue',
+                    **quarters).model_dump()]
+    ocm = [OCMEntry(NO=1, EQUIPMENT='Scope', MODEL='S1', MFG_SERIAL='OC1', MANUFACTURER='Acme', LOG_NO='L5',
+                    DEPARTMENT='ER', OCM='Yes', Last_Date='01/01/2026', ENGINEER='Eve', Next_Date='01/06/2026',
+                    end_of_warranty='31/12/2027', status_override='OK').model_dump()]
+    DataService.save_data(ppm, 'ppm')
+    DataService.save_data(ocm, 'ocm')
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        for data_type, member in BACKUP_SECTIONS.items():
+            zip_file.writestr(member, DataService.export_data(data_type))
+    DataService.save_data([], 'ppm')
+    DataService.save_data([], 'ocm')
+
+    success, _, _ = ImportExportService.restore_from_zip(archive)
+    assert success
+    for data_type, expected in (('ppm', ppm), ('ocm', ocm)):
+        restored = DataService.load_data(data_type)
+        assert len(restored) == 1
+        for field, value in expected[0].items():
+            assert restored[0].get(field) == value, f"{data_type} {field}"
+
+
+def test_scheduler_leader_lock_failover(data_dir):
+    """Test that only one process leads and leadership fails over when the leader dies."""
+    pytest.importorskip("fcntl")
+    lock_path = str(data_dir / "scheduler.lock")
+    leader = LeaderLock(lock_path)
+    follower = LeaderLock(lock_path)
+
+    assert leader.try_acquire()
+    assert not follower.try_acquire()
+    assert leader.read()['pid'] == os.getpid()
+    leader.release()
+    assert follower.try_acquire()
+    assert not leader.try_acquire()
+    follower.release()
+
+    # A leader process killed without cleaning up loses the lock with its file descriptors
+    script = (
+        "import fcntl, os, sys, time\n"
+        f"f = open({lock_path!r}, 'w')\n"
+        "fcntl.flock(f, fcntl.LOCK_EX)\n"
+        "print('locked', flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == 'locked'
+        assert not follower.try_acquire()
+    finally:
+        process.kill()
+        process.wait()
+    assert follower.try_acquire()
+    follower.release()
+
+
+def test_smtp_pool_reuses_connection():
+    """Test that batched sends reuse one health-checked connection against a local SMTP server."""
+    Controller = pytest.importorskip("aiosmtpd.controller").Controller
+    from aiosmtpd.handlers import Sink
+
+    class Recorder(Sink):
+        def __init__(self):
+            self.messages = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return '250 OK'
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    handler = Recorder()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        pool = SMTPConnectionPool('127.0.0.1', port, use_tls=False, health_check_seconds=0)
+        messages = []
+        for i in range(3):
+            msg = EmailMessage()
+            msg['From'] = 'sender@example.com'
+            msg['To'] = f'engineer{i}@example.com'
+            msg['Subject'] = f'Reminder {i}'
+            msg.set_content('Maintenance due')
+            messages.append(msg)
+
+        with patch.object(pool, '_connect', wraps=pool._connect) as connect:
+            assert pool.send_batch(messages[:2]) == [None, None]
+            assert pool.send_batch(messages[2:]) == [None]
+        assert connect.call_count == 1
+        assert len(handler.messages) == 3
+        pool.close()
+    finally:
+        controller.stop()
+
+
+def test_send_reminder_digests_fans_out_by_department_and_engineer(data_dir, monkeypatch):
+    """Test that each mapped recipient gets only their tasks and the receiver gets all of them."""
+    import asyncio
+    from app.config import Config
+
+    monkeypatch.setattr(Config, 'REMINDER_RECIPIENTS_PATH', str(data_dir / 'reminder_recipients.json'))
+    monkeypatch.setattr(Config, 'EMAIL_RECEIVER', 'admin@example.com')
+    monkeypatch.setattr(Config, 'EMAIL_MAX_CONCURRENCY', 2)
+    monkeypatch.setattr("app.utils.config_reloader.reload_config", lambda: True)
+    EmailService.save_reminder_recipients({
+        'departments': {'LDR': ['ldr@example.com']},
+        'engineers': {'Eng A': 'eng.a@example.com', 'Eng B': ['ldr@example.com']},
+    })
+    upcoming = [
+        ('Ventilator', 'SN1', 'Quarter I', 'LDR', '01/01/2030', 'Eng A'),
+        ('Monitor', 'SN2', 'Quarter I', 'ER', '02/01/2030', 'Eng B'),
+        ('Pump', 'SN3', 'Quarter II', 'OR', '03/01/2030', 'Eng C'),
+    ]
+
+    sent = {}
+    in_flight = {'now': 0, 'max': 0}
+
+    async def fake_send(messages):
+        in_flight['now'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+        sent[messages[0]['To']] = messages[0]['Subject']
+        return [None]
+
+    with patch("app.services.email_service.MailTransport.send", side_effect=fake_send):
+        results = asyncio.run(EmailService.send_reminder_digests(upcoming))
+
+    assert results == {'admin@example.com': True, 'ldr@example.com': True, 'eng.a@example.com': True}
+    assert sent['admin@example.com'].endswith('3 upcoming tasks')
+    assert sent['ldr@example.com'].endswith('2 upcoming tasks')
+    assert sent['eng.a@example.com'].endswith('1 upcoming tasks')
+    assert in_flight['max'] == 2
+
+
+def test_email_outbox_retries_with_backoff(data_dir):
+    """Test that a failed delivery stays queued and is retried after its backoff."""
+    import asyncio
+    from app.services.outbox import EmailOutbox
+
+    msg = EmailMessage()
+    msg['From'] = 'sender@example.com'
+    msg['To'] = 'engineer@example.com'
+    msg['Subject'] = 'Reminder'
+    msg.set_content('Maintenance due')
+    message_id = EmailOutbox.enqueue([('engineer@example.com', msg)])[0]
+
+    outage = ConnectionRefusedError('SMTP server down')
+    with patch("app.services.outbox.MailTransport.send", return_value=[outage]):
+        assert asyncio.run(EmailOutbox.drain()) == {message_id: False}
+    metrics = EmailOutbox.get_metrics()
+    assert metrics['queue_depth'] == 1 and metrics['sent'] == 0
+    assert 15 <= EmailOutbox.next_due_in() <= 45
+
+    # Not due yet, so a regular drain leaves it alone
+    with patch("app.services.outbox.MailTransport.send", return_value=[None]) as send:
+        assert asyncio.run(EmailOutbox.drain()) == {}
+        send.assert_not_called()
+
+    with patch("app.services.outbox.time.time", return_value=time.time() + 60), \
+            patch("app.services.outbox.MailTransport.send", return_value=[None]):
+        assert asyncio.run(EmailOutbox.drain()) == {message_id: True}
+    metrics = EmailOutbox.get_metrics()
+    assert metrics['queue_depth'] == 0 and metrics['sent'] == 1
+    assert metrics['delivery_latency_avg_seconds'] >= 60
+
+
+
+def test_email_outbox_concurrent_drains_send_once(data_dir):
+    """Test that concurrent drains claim each message once and stale claims are requeued."""
+    import asyncio
+    from app.services.outbox import EmailOutbox
+
+    messages = []
+    for n in range(5):
+        msg = EmailMessage()
+        msg['To'] = f'engineer{n}@example.com'
+        msg['Subject'] = 'Reminder'
+        msg.set_content('Maintenance due')
+        messages.append((f'engineer{n}@example.com', msg))
+    ids = EmailOutbox.enqueue(messages)
+
+    sent = []
+
+    async def send(batch):
+        sent.extend(msg['To'] for msg in batch)
+        await asyncio.sleep(0.01)
+        return [None] * len(batch)
+
+    async def drain_concurrently():
+        return await asyncio.gather(EmailOutbox.drain(ids), EmailOutbox.drain(), EmailOutbox.drain(ids))
+
+    with patch("app.services.outbox.MailTransport.send", side_effect=send):
+        results = asyncio.run(drain_concurrently())
+    assert sorted(sent) == sorted(recipient for recipient, _ in messages)
+    assert sorted(message_id for result in results for message_id in result) == sorted(ids)
+    assert EmailOutbox.get_metrics()['sent'] == 5
+
+    # A claim left behind by a dead process is requeued once its lease expires
+    stale_id = EmailOutbox.enqueue(messages[:1])[0]
+    EmailOutbox._claim_due_messages([stale_id], 1)
+    assert EmailOutbox.requeue_stale_claims() == 0
+    with patch("app.services.outbox.time.time", return_value=time.time() + 3600):
+        assert EmailOutbox.requeue_stale_claims() == 1
+    assert EmailOutbox.get_metrics()['queue_depth'] == 1
+
+def test_xlsx_export_roundtrip(data_dir):
+    """Test that an XLSX export can be imported through the same pipeline."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_text(PPM_CSV_HEADER + "Ventilator,V1,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n")
+    DataService.import_data('ppm', str(csv_path))
+
+    xlsx_path = data_dir / "export.xlsx"
+    assert DataService.export_data_xlsx('ppm', str(xlsx_path)) == 1
+
+    DataService.save_data([], 'ppm')
+    result = DataService.import_data('ppm', str(xlsx_path))
+    assert result['added'] == 1
+    entry = DataService.get_entry('ppm', 'SN1')
+    assert entry['PPM_Q_II']['date'] == '01/04/2024'
+    assert entry['DEPARTMENT'] == 'LDR'
+
+
+def test_api_import_accepts_xlsx(client, data_dir):
+    """Test that /api/import takes XLSX files through the streaming importer."""
+    csv_path = data_dir / "import.csv"
+    csv_path.write_text(PPM_CSV_HEADER + "Ventilator,V1,SN1,Acme,L1,LDR,Yes,01/01/2024,A,B,C,D\n")
+    DataService.import_data('ppm', str(csv_path))
+    xlsx_path = data_dir / "export.xlsx"
+    DataService.export_data_xlsx('ppm', str(xlsx_path))
+    DataService.save_data([], 'ppm')
+
+    response = client.post('/api/import/ppm', data={'file': (xlsx_path.open('rb'), 'ppm.xlsx')})
+    assert response.status_code == 200 and response.json['stats']['added'] == 1
+    assert DataService.get_entry('ppm', 'SN1')['DEPARTMENT'] == 'LDR'
+
+
+def test_xlsx_download_removes_temporary_workbook(client, data_dir, monkeypatch):
+    """Test that the temporary workbook of an XLSX download is deleted once it was sent."""
+    import tempfile
+
+    temp_dir = data_dir / "tmp"
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temp_dir))
+
+    response = client.get('/export/ppm?format=xlsx', buffered=True)
+    assert response.status_code == 200 and response.data[:2] == b'PK'
+    assert list(temp_dir.iterdir()) == []
+
+
+def test_process_reminders_sends_once_per_escalation_point(data_dir, monkeypatch):
+    """Test that repeated runs do not re-send a task until it crosses the next escalation point."""
+    import asyncio
+    import json
+    from datetime import date, timedelta
+    from app.config import Config
+
+    monkeypatch.setattr(Config, 'REMINDER_RECIPIENTS_PATH', str(data_dir / 'reminder_recipients.json'))
+    monkeypatch.setattr(Config, 'EMAIL_RECEIVER', 'admin@example.com')
+    monkeypatch.setattr(Config, 'REMINDER_DAYS', 60)
+    monkeypatch.setattr(Config, 'REMINDER_ESCALATION_DAYS', [30, 7, 0])
+    monkeypatch.setattr("app.utils.config_reloader.reload_config", lambda: True)
+
+    start = date(2030, 1, 1)
+    due = (start + timedelta(days=20)).strftime('%d/%m/%Y')
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'EQUIPMENT': 'Ventilator', 'MFG_SERIAL': 'SN1', 'DEPARTMENT': 'LDR', 'PPM': 'Yes',
+                    'PPM_Q_I': {'date': due, 'engineer': 'Eng A'}}], f)
+
+    sent = []
+
+    async def fake_send(messages):
+        sent.extend(messages)
+        return [None] * len(messages)
+
+    with patch("app.services.email_service.MailTransport.send", side_effect=fake_send):
+        for days in (0, 0, 1, 12, 13, 14):
+            asyncio.run(EmailService.process_reminders(today=start + timedelta(days=days)))
+
+    # Sent at the 30 day stage on day 0 and at the 7 day stage on day 13 only
+    assert len(sent) == 2
+    assert all(msg['To'] == 'admin@example.com' for msg in sent)
+
+
+def test_process_reminders_resends_after_recipient_change_and_failure(data_dir, monkeypatch):
+    """Test that new recipients and permanently failed digests bypass the unchanged-data shortcut."""
+    import asyncio
+    import json
+    from datetime import date, timedelta
+    from app.config import Config
+    from app.services import outbox
+
+    monkeypatch.setattr(Config, 'REMINDER_RECIPIENTS_PATH', str(data_dir / 'reminder_recipients.json'))
+    monkeypatch.setattr(Config, 'EMAIL_RECEIVER', 'admin@example.com')
+    monkeypatch.setattr(Config, 'REMINDER_DAYS', 60)
+    monkeypatch.setattr(Config, 'REMINDER_ESCALATION_DAYS', [30, 7, 0])
+    monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 1)
+    monkeypatch.setattr("app.utils.config_reloader.reload_config", lambda: True)
+
+    start = date(2030, 1, 1)
+    due = (start + timedelta(days=20)).strftime('%d/%m/%Y')
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'EQUIPMENT': 'Ventilator', 'MFG_SERIAL': 'SN1', 'DEPARTMENT': 'LDR', 'PPM': 'Yes',
+                    'PPM_Q_I': {'date': due, 'engineer': 'Eng A'}}], f)
+
+    sent = []
+    fail = {'ldr@example.com'}
+
+    async def fake_send(messages):
+        sent.extend(msg['To'] for msg in messages)
+        return [ConnectionError('rejected') if msg['To'] in fail else None for msg in messages]
+
+    with patch("app.services.email_service.MailTransport.send", side_effect=fake_send):
+        asyncio.run(EmailService.process_reminders(today=start))
+        assert sent == ['admin@example.com']
+
+        # A new department recipient is reminded the next day although the data is unchanged
+        EmailService.save_reminder_recipients({'departments': {'ldr': ['ldr@example.com']}})
+        asyncio.run(EmailService.process_reminders(today=start + timedelta(days=1)))
+        assert sent.count('ldr@example.com') == 1
+
+        # Its digest failed permanently, so it is released and sent again
+        fail.clear()
+        asyncio.run(EmailService.process_reminders(today=start + timedelta(days=2)))
+        assert sent.count('ldr@example.com') == 2
+        assert sent.count('admin@example.com') == 1
+
+
+def test_render_reminder_html_escapes_and_caches():
+    """Test that reminder bodies are escaped and rendered once per task list and recipient."""
+    from app.services import email_service
+
+    upcoming = [('<Ventilator>', 'SN1', 'Quarter I', 'LDR & ICU', '01/01/2030', 'Eng A')]
+    email_service._render_cache.clear()
+
+    with patch.object(email_service._reminder_template, 'render',
+                      wraps=email_service._reminder_template.render) as render:
+        html = EmailService.render_reminder_html(upcoming, 'admin@example.com')
+        assert EmailService.render_reminder_html(list(upcoming), 'admin@example.com') is html
+        EmailService.render_reminder_html(upcoming, 'ldr@example.com')
+
+    assert render.call_count == 2
+    assert '&lt;Ventilator&gt;' in html and 'LDR &amp; ICU' in html
+    assert html.count('<tr>') == 2
+
+
+def test_due_events_cover_ppm_ocm_and_warranty(data_dir):
+    """Test that the due event index covers every event type and follows data changes."""
+    import json
+    from datetime import date
+    from app.config import Config
+    from app.services.due_events import DueEventService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'EQUIPMENT': 'Ventilator', 'MFG_SERIAL': 'SN1', 'DEPARTMENT': 'LDR', 'PPM': 'Yes',
+                    'PPM_Q_I': {'date': '10/01/2030', 'engineer': 'Eng A'},
+                    'PPM_Q_II': {'date': '10/04/2030', 'engineer': 'Eng B'},
+                    'end_of_warranty': '05/01/2030'}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'EQUIPMENT': 'Monitor', 'MFG_SERIAL': 'SN2', 'DEPARTMENT': 'ER', 'OCM': 'Yes',
+                    'Next_Date': '20/01/2030', 'ENGINEER': 'Eng C', 'end_of_warranty': 'n/a'}], f)
+
+    events = DueEventService.get_due_events(date(2030, 1, 1), date(2030, 1, 31))
+    assert [(e[1], e[2], e[4]) for e in events] == [
+        ('SN1', 'Warranty Expiry', '05/01/2030'),
+        ('SN1', 'Quarter I', '10/01/2030'),
+        ('SN2', 'OCM Service', '20/01/2030'),
+    ]
+    assert DueEventService.get_due_events(date(2030, 1, 10), date(2030, 1, 10), kinds=['ppm'])[0][5] == 'Eng A'
+
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([], f)
+    assert len(DueEventService.get_due_events(date(2030, 1, 1), date(2030, 1, 31))) == 2
+
+
+def test_cron_schedule_next_run_and_catch_up(data_dir, monkeypatch):
+    """Test cron fire times and that a run missed during downtime is due immediately."""
+    from datetime import datetime
+    from app.config import Config
+    from app.utils.cron import CronSchedule
+
+    daily = CronSchedule('0 7 * * *')
+    assert daily.next_after(datetime(2030, 1, 1, 6, 59, 30)) == datetime(2030, 1, 1, 7, 0)
+    assert daily.next_after(datetime(2030, 1, 1, 7, 0)) == datetime(2030, 1, 2, 7, 0)
+    weekdays = CronSchedule('30 8-18/5 * * 1-5')
+    assert weekdays.next_after(datetime(2030, 1, 4, 18, 31)) == datetime(2030, 1, 7, 8, 30)  # Friday -> Monday
+    with pytest.raises(ValueError):
+        CronSchedule('61 * * * *')
+
+    monkeypatch.setattr(Config, 'SCHEDULER_CRON', '0 7 * * *')
+    assert EmailService.load_last_scheduled_run() is None
+    EmailService.save_last_scheduled_run(datetime(2030, 1, 1, 7, 0, 5))
+    last_run = EmailService.load_last_scheduled_run()
+    assert EmailService.get_next_run(last_run, datetime(2030, 1, 1, 12, 0)) == datetime(2030, 1, 2, 7, 0)
+    # Down over the next 07:00: the run is overdue as soon as the scheduler starts
+    assert EmailService.get_next_run(last_run, datetime(2030, 1, 3, 9, 0)) <= datetime(2030, 1, 3, 9, 0)
+
+
+def test_run_coroutine_reuses_shared_loop():
+    """Test that sync callers share one background event loop and time out cleanly."""
+    import asyncio
+    import threading
+    from app.utils.async_runner import run_coroutine
+
+    async def current_loop():
+        return asyncio.get_running_loop(), threading.current_thread().name
+
+    first_loop, thread_name = run_coroutine(current_loop())
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(run_coroutine(current_loop())[0])) for _ in range(4)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+
+    assert thread_name == 'async-runner'
+    assert results == [first_loop] * 4
+    with pytest.raises(TimeoutError):
+        run_coroutine(asyncio.sleep(5), timeout=0.05)
+
+
+def test_config_service_reparses_env_only_when_changed(tmp_path, monkeypatch):
+    """Test that .env is parsed once per change and each change publishes a new snapshot."""
+    import os
+    from app.config import Config
+    from app.services import config_service
+    from app.services.config_service import SETTINGS, ConfigService
+
+    for name in SETTINGS:
+        monkeypatch.setattr(Config, name, getattr(Config, name))
+        monkeypatch.setenv(name, os.environ.get(name, SETTINGS[name][0]))
+    env_path = tmp_path / '.env'
+    env_path.write_text("SMTP_SERVER=smtp.one.example\nREMINDER_DAYS=30\n")
+    monkeypatch.setattr(ConfigService, '_env_path', str(env_path))
+    monkeypatch.setattr(ConfigService, '_env_resolved', True)
+    monkeypatch.setattr(ConfigService, '_file_stamp', None)
+    monkeypatch.setattr(ConfigService, '_snapshot', None)
+
+    with patch.object(config_service, 'dotenv_values', wraps=config_service.dotenv_values) as parse:
+        first = ConfigService.get_snapshot()
+        assert ConfigService.get_snapshot() is first
+        assert parse.call_count == 1
+        assert first.settings['SMTP_SERVER'] == 'smtp.one.example' and Config.REMINDER_DAYS == 30
+        with pytest.raises(TypeError):
+            first.settings['SMTP_SERVER'] = 'changed'
+
+        env_path.write_text("SMTP_SERVER=smtp.two.example\nREMINDER_DAYS=45\n")
+        second = ConfigService.get_snapshot()
+        assert parse.call_count == 2
+
+    assert second.version == first.version + 1
+    assert second.settings['REMINDER_DAYS'] == 45 and Config.SMTP_SERVER == 'smtp.two.example'
+    assert first.settings['SMTP_SERVER'] == 'smtp.one.example'
+
+
+def test_search_ranks_hits_and_updates_incrementally(data_dir):
+    """Test trigram search across datasets and that only changed records are re-indexed."""
+    import json
+    from app.config import Config
+    from app.services.search_service import SearchService
+
+    ppm = [
+        {'EQUIPMENT': 'Ventilator', 'MODEL': 'V500', 'MANUFACTURER': 'Draeger', 'MFG_SERIAL': 'SN100',
+         'LOG_NO': '42', 'DEPARTMENT': 'ICU', 'PPM': 'Yes', 'PPM_Q_I': {'date': '', 'engineer': 'Arun Kumar'}},
+        {'EQUIPMENT': 'Ventilator Stand', 'MODEL': 'VS1', 'MANUFACTURER': 'Acme', 'MFG_SERIAL': 'SN200',
+         'LOG_NO': '43', 'DEPARTMENT': 'LDR', 'PPM': 'Yes'},
+    ]
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump(ppm, f)
+    with open(Config.TRAINING_JSON_PATH, 'w') as f:
+        json.dump([{'NAME': 'Arun Nair', 'ID': 'E1', 'DEPARTMENT': 'ICU'}], f)
+
+    result = SearchService.search('ventil icu')
+    assert [hit['key'] for hit in result['hits']] == ['SN100']
+    assert [hit['key'] for hit in SearchService.search('arun')['hits']] == ['SN100', 'E1']
+    assert SearchService.search('arun', data_types=['training'])['total'] == 1
+    assert SearchService.search('draegr')['hits'][0]['key'] == 'SN100'  # typo tolerated
+    page = SearchService.search('ventilator', page=2, per_page=1)
+    assert page['total'] == 2 and [hit['key'] for hit in page['hits']] == ['SN200']
+
+    ppm[1]['DEPARTMENT'] = 'ICU'
+    assert SearchService.sync('ppm', ppm) == {'added': 0, 'updated': 1, 'removed': 0}
+    assert SearchService.sync('ppm', ppm[:1]) == {'added': 0, 'updated': 0, 'removed': 1}
+
+
+def test_search_index_follows_data_service_writes(data_dir):
+    """Test that writes through DataService update the index without re-reading the data file."""
+    from app.config import Config
+    from app.services.search_service import SearchService
+
+    with open(Config.TRAINING_JSON_PATH, 'w') as f:
+        json.dump([{'NAME': 'Arun Nair', 'ID': 'E1', 'DEPARTMENT': 'ICU'}], f)
+    assert SearchService.search('arun', data_types=['training'])['total'] == 1
+
+    DataService.add_training_entry({'NAME': 'Maria Lopez', 'ID': 'E2', 'DEPARTMENT': 'Imaging'})
+    DataService.update_training_entry('E1', {'NAME': 'Arun Nair', 'ID': 'E1', 'DEPARTMENT': 'Surgery'})
+    with patch.object(SearchService, 'sync') as sync:
+        assert [hit['key'] for hit in SearchService.search('maria')['hits']] == ['E2']
+        assert SearchService.search('surgery')['hits'][0]['key'] == 'E1'
+        DataService.delete_training_entry('E2')
+        assert SearchService.search('maria')['total'] == 0
+    sync.assert_not_called()
+
+    # A file rewritten behind the index is re-synced on the next search
+    with open(Config.TRAINING_JSON_PATH, 'w') as f:
+        json.dump([{'NAME': 'Maria Lopez', 'ID': 'E3', 'DEPARTMENT': 'Imaging'}], f)
+    assert [hit['key'] for hit in SearchService.search('maria')['hits']] == ['E3']
+
+
+def test_suggest_matches_prefix_across_datasets(data_dir):
+    """Test prefix suggestions and that they follow data changes."""
+    import json
+    from app.config import Config
+    from app.services.suggest_service import SuggestService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'SN1', 'DEPARTMENT': 'ICU', 'MODEL': 'V500',
+                    'PPM_Q_I': {'engineer': 'Arun'}, 'PPM_Q_II': {'engineer': 'arun '}}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'SN2', 'DEPARTMENT': 'Imaging', 'ENGINEER': 'Ahmed'}], f)
+    with open(Config.TRAINING_JSON_PATH, 'w') as f:
+        json.dump([{'ID': 'E1', 'DEPARTMENT': 'icu', 'machine1_trainer': 'Maria'}], f)
+
+    assert SuggestService.suggest('department', 'i') == ['ICU', 'Imaging']
+    assert SuggestService.suggest('engineer', 'A') == ['Ahmed', 'Arun']
+    assert SuggestService.suggest('engineer', 'ar', limit=1) == ['Arun']
+    assert SuggestService.suggest('trainer', 'm') == ['Maria']
+    assert SuggestService.suggest('model', 'x') == []
+    with pytest.raises(ValueError):
+        SuggestService.suggest('serial', 's')
+
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'SN2', 'DEPARTMENT': 'Imaging', 'ENGINEER': 'Aisha Khan'}], f)
+    assert SuggestService.suggest('engineer', 'a') == ['Aisha Khan', 'Arun']
+
+
+def test_lookup_resolves_serial_and_log_number(data_dir):
+    """Test code lookup by exact and folded serial/log number and the next due task."""
+    from datetime import date
+    from app.config import Config
+    from app.services.lookup_service import LookupService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'SN-100 A', 'LOG_NO': 'L7',
+                    'PPM_Q_I': {'date': '01/01/2026', 'engineer': 'Arun'},
+                    'PPM_Q_II': {'date': '01/04/2026', 'engineer': 'Maria'}}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'OC1', 'LOG_NO': 'n/a', 'Next_Date': '15/02/2026', 'ENGINEER': 'Ahmed'}], f)
+
+    [(data_type, field, record)] = LookupService.lookup('SN-100 A')
+    assert (data_type, field) == ('ppm', 'MFG_SERIAL')
+    assert LookupService.lookup(' sn-100a ')[0][2] is record
+    assert LookupService.lookup('l7')[0][:2] == ('ppm', 'LOG_NO')
+    assert LookupService.lookup('n/a') == []
+    assert LookupService.get_next_due('ppm', record, date(2026, 2, 1)) == {
+        'task': 'Quarter II', 'date': '01/04/2026', 'days_until': 59, 'engineer': 'Maria'}
+    ocm = LookupService.lookup('oc1')[0][2]
+    assert LookupService.get_next_due('ocm', ocm, date(2026, 3, 1)) is None
+
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'OC2'}], f)
+    assert LookupService.lookup('OC1') == []
+    assert LookupService.lookup('oc2')[0][0] == 'ocm'
+
+
+def test_aggregate_groups_devices_and_matches_status(data_dir):
+    """Test grouped counts, that vectorized status agrees with per-device status, and caching."""
+    from datetime import date, timedelta
+    from app.config import Config
+    from app.routes.views_new import calculate_equipment_status
+    from app.services.aggregate_service import AggregateService
+
+    today = date.today()
+    fmt = lambda days: (today + timedelta(days=days)).strftime('%d/%m/%Y')
+    ppm = [{'MFG_SERIAL': f'P{n}', 'DEPARTMENT': 'ICU', 'MANUFACTURER': 'GE',
+            'PPM_Q_I': {'date': fmt(days), 'engineer': 'Arun'}}
+           for n, days in enumerate([-30, 0, 1, 8, 9, 100])]
+    ppm += [{'MFG_SERIAL': 'P6', 'DEPARTMENT': 'ICU', 'PPM_Q_I': {'date': 'bad'}},
+            {'MFG_SERIAL': 'P7', 'DEPARTMENT': 'ER', 'PPM_Q_I': {}}]
+    ocm = [{'MFG_SERIAL': 'O1', 'DEPARTMENT': 'ER', 'MANUFACTURER': 'GE', 'Next_Date': fmt(-1), 'ENGINEER': 'Ahmed'},
+           {'MFG_SERIAL': 'O2', 'DEPARTMENT': 'ER', 'Next_Date': 'n/a', 'status_override': 'Due Soon'}]
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump(ppm, f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump(ocm, f)
+
+    version, snapshot = AggregateService._get_snapshot()
+    statuses = list(AggregateService.with_status(snapshot, today)['status'])
+    assert statuses == [calculate_equipment_status(r, t)['status']
+                        for t, records in [('ppm', ppm), ('ocm', ocm)] for r in records]
+
+    result = AggregateService.aggregate(['department', 'type'], ['count', 'overdue', 'min_days_until'])
+    assert result['rows'] == [
+        {'department': 'ER', 'type': 'OCM', 'count': 2, 'overdue': 1, 'min_days_until': -1},
+        {'department': 'ER', 'type': 'PPM', 'count': 1, 'overdue': 0, 'min_days_until': None},
+        {'department': 'ICU', 'type': 'PPM', 'count': 7, 'overdue': 1, 'min_days_until': -30},
+    ]
+    assert AggregateService.aggregate(['department', 'type'], ['count', 'overdue', 'min_days_until'])['rows'] \
+        is result['rows']
+    assert AggregateService.aggregate(['engineer'], data_types=['ocm'])['rows'] == [
+        {'engineer': 'Ahmed', 'count': 1}, {'engineer': 'N/A', 'count': 1}]
+    with pytest.raises(ValueError):
+        AggregateService.aggregate(['serial'])
+
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump(ocm[:1], f)
+    assert AggregateService.aggregate(['type'], data_types=['ocm'])['rows'] == [{'type': 'OCM', 'count': 1}]
+
+
+def test_workload_forecast_counts_tasks_per_engineer_week(client, data_dir):
+    """Test the weekly task histogram per engineer over the horizon."""
+    from datetime import date
+    from app.config import Config
+    from app.services.workload_service import WorkloadService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'P1', 'PPM': 'Yes',
+                    'PPM_Q_I': {'date': '01/06/2026', 'engineer': 'Arun'},   # Monday, before today
+                    'PPM_Q_II': {'date': '04/06/2026', 'engineer': 'Arun'},  # today
+                    'PPM_Q_III': {'date': '15/06/2026', 'engineer': 'Maria'},
+                    'PPM_Q_IV': {'date': '21/06/2026', 'engineer': 'Arun'},
+                    'end_of_warranty': '05/06/2026'}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'O1', 'OCM': 'Yes', 'Next_Date': '22/06/2026', 'ENGINEER': 'Arun'}], f)
+
+    forecast = WorkloadService.get_forecast(3, today=date(2026, 6, 4))
+    assert forecast['weeks'] == ['01/06/2026', '08/06/2026', '15/06/2026']
+    assert forecast['engineers'] == [
+        {'engineer': 'Arun', 'counts': [1, 0, 1], 'total': 2},
+        {'engineer': 'Maria', 'counts': [0, 0, 1], 'total': 1},
+    ]
+    assert forecast['totals'] == [1, 0, 2]
+    assert WorkloadService.get_forecast(3, today=date(2026, 6, 4)) is forecast
+    with pytest.raises(ValueError):
+        WorkloadService.get_forecast(0)
+
+    # The page forecasts from the request's as_of date; an invalid one falls back to today
+    assert b'<th class="text-center">01/06</th>' in client.get('/workload?weeks=3&as_of=2026-06-04').data
+    response = client.get('/equipment/ocm/list?as_of=04/06/2026')
+    assert response.status_code == 200 and b'Invalid as_of date' in response.data
+
+
+def test_schedule_projection_continues_quarters_lazily(client, data_dir):
+    """Test projected PPM occurrences beyond the stored year, in due-date order."""
+    from datetime import date
+    from itertools import islice
+    from app.config import Config
+    from app.services.schedule_projection import ScheduleProjector
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([
+            {'MFG_SERIAL': 'P1', 'PPM': 'Yes', 'PPM_Q_I': {'date': '31/01/2025', 'engineer': 'Arun'},
+             'PPM_Q_II': {'engineer': 'Maria'}, 'PPM_Q_III': {}, 'PPM_Q_IV': {}},
+            {'MFG_SERIAL': 'P2', 'PPM': 'Yes', 'PPM_Q_I': {'date': '15/03/2025', 'engineer': 'Ahmed'}},
+            {'MFG_SERIAL': 'P3', 'PPM': 'No', 'PPM_Q_I': {'date': '01/03/2025'}},
+        ], f)
+
+    events = list(ScheduleProjector.iter_occurrences(date(2027, 1, 1), date(2027, 6, 30)))
+    assert [(e[1], e[2], e[4], e[5]) for e in events] == [
+        ('P1', 'Quarter I', '31/01/2027', 'Arun'),
+        ('P2', 'Quarter I', '15/03/2027', 'Ahmed'),
+        ('P1', 'Quarter II', '30/04/2027', 'Maria'),
+        ('P2', 'Quarter II', '15/06/2027', 'N/A'),
+    ]
+
+    # A far horizon is only materialized as far as it is consumed
+    far = ScheduleProjector.iter_occurrences(date(2025, 1, 1), date(9999, 12, 31))
+    assert [e[4] for e in islice(far, 3)] == ['31/01/2025', '15/03/2025', '30/04/2025']
+
+    response = client.get('/api/schedule/projection?from=2027-01-01&to=2027-06-30&limit=1')
+    assert response.json['occurrences'][0]['date'] == '2027-01-31' and response.json['truncated']
+    assert client.get('/api/schedule/projection?as_of=2027-04-01&limit=1').json['from'] == '2027-04-01'
+    assert client.get('/api/schedule/projection?from=01/01/2027').status_code == 400
+
+
+def test_status_evaluated_as_of_request_date(app):
+    """Test that status uses the request's as_of date, captured once."""
+    from datetime import date
+    from flask import request
+    from app.routes.views_new import calculate_equipment_status
+    from app.utils.evaluation_date import ENVIRON_KEY, get_evaluation_date
+
+    entry = {'Next_Date': '10/03/2026'}
+    assert calculate_equipment_status(entry, 'ocm', date(2026, 3, 10))['status'] == 'Due Soon'
+    assert calculate_equipment_status(entry, 'ocm', date(2026, 3, 11))['status'] == 'Overdue'
+    assert calculate_equipment_status(entry, 'ocm', date(2026, 3, 2))['status'] == 'OK'
+
+    with app.test_request_context('/?as_of=2026-03-11'):
+        assert get_evaluation_date() == date(2026, 3, 11)
+        request.environ[ENVIRON_KEY] = date(2026, 1, 1)  # captured once; not re-read
+        assert get_evaluation_date() == date(2026, 1, 1)
+        assert calculate_equipment_status(entry, 'ocm')['status'] == 'OK'
+    with app.test_request_context('/?as_of=11/03/2026'):
+        with pytest.raises(ValueError):
+            get_evaluation_date()
+
+
+def test_calendar_buckets_events_by_week_and_month(data_dir):
+    """Test calendar buckets, partial edge buckets and kind filtering."""
+    from datetime import date
+    from app.config import Config
+    from app.services.calendar_service import CalendarService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'P1', 'PPM': 'Yes',
+                    'PPM_Q_I': {'date': '02/06/2026'}, 'PPM_Q_II': {'date': '02/09/2026'},
+                    'end_of_warranty': '10/06/2026'},
+                   {'MFG_SERIAL': 'P2', 'PPM': 'Yes', 'PPM_Q_I': {'date': '12/06/2026'}}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'O1', 'OCM': 'Yes', 'Next_Date': '09/06/2026'}], f)
+
+    weeks = CalendarService.get_calendar(date(2026, 6, 3), date(2026, 6, 14))
+    assert [(b['start'], b['count'], b['counts'], b['devices']) for b in weeks['buckets']] == [
+        ('2026-06-01', 0, {'ppm': 0, 'ocm': 0}, []),  # P1 on 02/06 is before 'from'
+        ('2026-06-08', 2, {'ppm': 1, 'ocm': 1}, ['O1', 'P2']),
+    ]
+
+    months = CalendarService.get_calendar(date(2026, 6, 1), date(2026, 9, 30), 'month', ['ppm', 'warranty'])
+    assert [(b['start'], b['end'], b['count']) for b in months['buckets']] == [
+        ('2026-06-01', '2026-06-30', 3), ('2026-07-01', '2026-07-31', 0),
+        ('2026-08-01', '2026-08-31', 0), ('2026-09-01', '2026-09-30', 1)]
+    assert months['buckets'][0]['devices'] == ['P1', 'P2']
+    assert CalendarService.get_calendar(date(2026, 6, 1), date(2026, 9, 30), 'month', ['warranty', 'ppm']) is months
+    with pytest.raises(ValueError):
+        CalendarService.get_calendar(date(2026, 6, 1), date(2026, 9, 30), 'day')
+
+
+def test_ics_feed_filters_streams_and_caches(data_dir):
+    """Test per-engineer .ics feeds, line folding and caching under the ETag."""
+    from datetime import date
+    from app.config import Config
+    from app.services.ics_service import IcsFeedService
+
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump([{'EQUIPMENT': 'Ventilator, ICU; bed ' + 'x' * 60, 'MFG_SERIAL': 'P1', 'PPM': 'Yes',
+                    'DEPARTMENT': 'ICU',
+                    'PPM_Q_I': {'date': '10/06/2026', 'engineer': 'Arun'},
+                    'PPM_Q_II': {'date': '10/09/2026', 'engineer': 'Maria'}}], f)
+    with open(Config.OCM_JSON_PATH, 'w') as f:
+        json.dump([{'MFG_SERIAL': 'O1', 'OCM': 'Yes', 'Next_Date': '01/07/2026', 'ENGINEER': ' arun'}], f)
+
+    today = date(2026, 6, 1)
+    etag, chunks = IcsFeedService.get_feed('engineer', 'ARUN', today)
+    body = ''.join(chunks)
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert body.count('BEGIN:VEVENT') == 2 and 'Maria' not in body
+    assert 'DTSTART;VALUE=DATE:20260610' in body and 'UID:P1-Quarter-I-20260610@' in body
+    assert 'SUMMARY:Quarter I: Ventilator\\, ICU\\; bed' in body
+    assert all(len(line.encode()) <= 75 for line in body.split('\r\n'))
+
+    assert IcsFeedService.get_feed('engineer', 'arun', today) == (etag, [body])
+    assert IcsFeedService.get_etag('engineer', 'Arun', date(2026, 6, 2)) != etag
+    with pytest.raises(ValueError):
+        IcsFeedService.get_feed('serial', 'P1', today)
+
+
+def test_equipment_api_projection_compact_and_gzip(app, data_dir):
+    """Test ?fields= projection, the compact encoding and gzip negotiation."""
+    import gzip
+    from app.config import Config
+
+    entries = [{'MFG_SERIAL': f'SN{n}', 'EQUIPMENT': 'Pump', 'PPM': 'Yes', 'status_override': 'Overdue',
+                'PPM_Q_I': {'date': '01/01/2026', 'engineer': 'Arun'}} for n in range(50)]
+    with open(Config.PPM_JSON_PATH, 'w') as f:
+        json.dump(entries, f)
+    client = app.test_client()
+
+    response = client.get('/api/equipment/ppm?fields=MFG_SERIAL,PPM_Q_I.date,status')
+    assert response.json[0] == {'MFG_SERIAL': 'SN0', 'PPM_Q_I': {'date': '01/01/2026'}, 'status': 'Overdue'}
+
+    response = client.get('/api/equipment/ppm?fields=MFG_SERIAL,PPM_Q_I.engineer&format=compact')
+    assert response.json['columns'] == ['MFG_SERIAL', 'PPM_Q_I.engineer']
+    assert response.json['rows'][1] == ['SN1', 'Arun']
+    assert client.get('/api/equipment/ppm?format=xml').status_code == 400
+    for fields in ('MFG_SERIAL,MFG_SERIAL.x', 'PPM_Q_I,PPM_Q_I.engineer', 'PPM_Q_I..date', 'EQUIPMENT.name'):
+        assert client.get(f'/api/equipment/ppm?fields={fields}').status_code == 400
+    assert DataService.get_all_entries('ppm')[0]['PPM_Q_I'] == {'date': '01/01/2026', 'engineer': 'Arun'}
+
+    plain = client.get('/api/equipment/ppm')
+    compressed = client.get('/api/equipment/ppm', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) * 4 < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.json